@@ -0,0 +1,80 @@
+"""Native asyncio webhook server: the PTB Application and the HTTP endpoint share one loop."""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from webhook_intake import SECRET_TOKEN_HEADER, WebhookIntake
+
+logger = logging.getLogger(__name__)
+
+
+def create_asgi_app(on_update, on_startup, on_shutdown, stats=None, metrics=None, webhook_intake=None,
+                    ack_timeout=5.0, health_text="ok"):
+    """Build the ASGI app with the same `/` and `/webhook` routes as the Flask server.
+
+    `stats()` is served as JSON on `/stats` and `metrics` (a `metrics.Metrics`) on `/metrics`.
+    `webhook_intake` (a `webhook_intake.WebhookIntake`) checks the secret token and decodes the body.
+
+    `on_update(update_json)` is the update intake coroutine. Telegram is answered as soon
+    as it returns. If it raises, or is still running after `ack_timeout` seconds, the answer
+    is a 503 so Telegram delivers the update again; intake keeps running in the background.
+    """
+    webhook_intake = webhook_intake or WebhookIntake()
+
+    async def webhook(request: Request):
+        if not webhook_intake.authentic(request.headers.get(SECRET_TOKEN_HEADER)):
+            return PlainTextResponse("forbidden", status_code=403)
+        try:
+            update_json = webhook_intake.decode(await request.body())
+        except ValueError:
+            return PlainTextResponse("bad request", status_code=400)
+
+        intake = asyncio.ensure_future(on_update(update_json))
+        try:
+            await asyncio.wait_for(asyncio.shield(intake), ack_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update intake exceeded {ack_timeout}s - asking Telegram to retry")
+            return PlainTextResponse("intake timeout", status_code=503)
+        except Exception as e:
+            logger.error(f"Error processing update: {e}")
+            return PlainTextResponse("intake failed", status_code=503)
+        return PlainTextResponse("ok")
+
+    async def home(request: Request):
+        return PlainTextResponse(health_text)
+
+    routes = [
+        Route("/", home),
+        Route("/webhook", webhook, methods=["POST"]),
+    ]
+    if stats is not None:
+        async def stats_route(request: Request):
+            return JSONResponse(stats())
+        routes.append(Route("/stats", stats_route))
+    if metrics is not None:
+        async def metrics_route(request: Request):
+            return Response(metrics.render(), media_type=metrics.content_type)
+        routes.append(Route("/metrics", metrics_route))
+
+    @asynccontextmanager
+    async def lifespan(asgi_app):
+        await on_startup()
+        try:
+            yield
+        finally:
+            await on_shutdown()
+
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+def run_asgi_server(asgi_app, host="0.0.0.0", port=10000):
+    """Serve `asgi_app` with uvicorn; startup and shutdown run through the ASGI lifespan."""
+    import uvicorn
+
+    config = uvicorn.Config(asgi_app, host=host, port=port, lifespan="on", access_log=False, timeout_keep_alive=75)
+    uvicorn.Server(config).run()
@@ -0,0 +1,207 @@
+"""Allow-list authorization: O(1) checks, atomic hot reload, rate-limited denials."""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+class AllowListError(RuntimeError):
+    """The configured allow-list source could not be loaded at startup."""
+
+
+@dataclass(frozen=True)
+class AllowList:
+    """One immutable snapshot; a reload swaps the whole object, so checks never see a
+    half-loaded list. Empty means everyone is allowed, unless `restricted` (a file or
+    SQLite source is configured): then an empty list allows no one."""
+    user_ids: frozenset = frozenset()
+    usernames: frozenset = frozenset()
+    restricted: bool = False
+
+    @property
+    def open(self):
+        return not self.restricted and not self.user_ids and not self.usernames
+
+    def allows(self, user_id, username):
+        if self.open:
+            return True
+        return user_id in self.user_ids or (username is not None and username.lower() in self.usernames)
+
+    def __len__(self):
+        return len(self.user_ids) + len(self.usernames)
+
+
+def parse_entries(entries):
+    """Split entries into numeric user ids and (lowercase, without @) usernames."""
+    user_ids, usernames = set(), set()
+    for entry in entries:
+        entry = entry.strip()
+        if not entry or entry.startswith("#"):
+            continue
+        if entry.lstrip("-").isdigit():
+            user_ids.add(int(entry))
+        else:
+            usernames.add(entry.lstrip("@").lower())
+    return user_ids, usernames
+
+
+def load_file(path):
+    """One user id or username per line; `#` starts a comment line."""
+    with open(path, encoding="utf-8") as f:
+        return parse_entries(f)
+
+
+def load_sqlite(path):
+    """Rows of `authorized_users(user_id INTEGER, username TEXT)`; either column may be NULL."""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = db.execute("SELECT user_id, username FROM authorized_users").fetchall()
+    finally:
+        db.close()
+    user_ids = {int(user_id) for user_id, _ in rows if user_id is not None}
+    usernames = {username.lstrip("@").lower() for _, username in rows if username}
+    return user_ids, usernames
+
+
+def update_sender(update_json):
+    """(user id, username, chat id) of a raw update, without building PTB objects."""
+    for key, value in update_json.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        sender = value.get("from") or value.get("user")
+        chat = value.get("chat") or (value.get("message") or {}).get("chat") or {}
+        if sender:
+            return sender.get("id"), sender.get("username"), chat.get("id")
+        return None, None, chat.get("id")
+    return None, None, None
+
+
+class Authorizer:
+    """Checks senders against the environment allow-list plus an optional file or SQLite
+    source, reloaded when it changes.
+
+    With a source configured the bot never falls back to allowing everyone: until the
+    source is loaded only the environment entries are allowed, a failed first load stops
+    startup, and an empty source allows no one beyond them. A reload that fails to read or
+    parse the source keeps the current list.
+
+    Denials are rate-limited per user: a flood from one account logs one line per
+    `log_interval` (with the count of suppressed attempts) and gets one reply per
+    `reply_interval`, instead of one log line and one Bot API call per message.
+    """
+
+    def __init__(self, user_ids=(), usernames=(), file_path=None, db_path=None, reload_interval=30.0,
+                 log_interval=60.0, reply_interval=3600.0, max_tracked=100_000):
+        self._static = (frozenset(user_ids), frozenset(u.lstrip("@").lower() for u in usernames))
+        self.file_path = file_path
+        self.db_path = db_path
+        self.reload_interval = reload_interval
+        self.log_interval = log_interval
+        self.reply_interval = reply_interval
+        self.max_tracked = max_tracked
+        self.allow_list = AllowList(*self._static, restricted=bool(file_path or db_path))
+        self._source_version = None
+        self._reloader: asyncio.Task | None = None
+        # user -> [last log time, attempts since, last reply time]
+        self._denials: dict[object, list] = {}
+        self.denied = 0
+        self.replies = 0
+        self.reloads = 0
+        self.reload_errors = 0
+
+    @property
+    def _source(self):
+        return self.file_path or self.db_path
+
+    def _version(self):
+        """Modification times of the source (and of a SQLite WAL file) or None."""
+        paths = [self.file_path] if self.file_path else [self.db_path, f"{self.db_path}-wal"]
+        return tuple(os.stat(p).st_mtime_ns if os.path.exists(p) else None for p in paths)
+
+    def _load(self):
+        user_ids, usernames = load_file(self.file_path) if self.file_path else load_sqlite(self.db_path)
+        entries = len(user_ids) + len(usernames)
+        return AllowList(self._static[0] | user_ids, self._static[1] | usernames, restricted=True), entries
+
+    async def reload(self, force=False):
+        """Reload the source if it changed; if it cannot be read, the current list stays in place."""
+        if not self._source:
+            return
+        first = not self.reloads
+        try:
+            version = await asyncio.to_thread(self._version)
+            if not force and version == self._source_version:
+                return
+            allow_list, entries = await asyncio.to_thread(self._load)
+        except (OSError, sqlite3.Error, ValueError) as e:
+            self.reload_errors += 1
+            logger.error(f"Failed to load the allow-list from {self._source}: {e}")
+            if first:
+                raise AllowListError(f"Allow-list source {self._source} could not be loaded: {e}") from e
+            return
+        if not entries:
+            # Emptying the source revokes everyone in it
+            logger.warning(f"Allow-list {self._source} is empty - only the environment entries are allowed")
+        self.allow_list = allow_list
+        self._source_version = version
+        self.reloads += 1
+        logger.info(f"Allow-list loaded from {self._source}: {len(allow_list)} entries")
+
+    async def _reload_loop(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload()
+
+    async def start(self):
+        await self.reload(force=True)
+        if self.allow_list.open:
+            logger.warning("No allow-list configured - the bot accepts every user")
+        if self._source and self.reload_interval > 0 and self._reloader is None:
+            self._reloader = asyncio.create_task(self._reload_loop())
+
+    async def aclose(self):
+        if self._reloader is not None:
+            self._reloader.cancel()
+            await asyncio.gather(self._reloader, return_exceptions=True)
+            self._reloader = None
+
+    def is_authorized(self, user_id, username):
+        return self.allow_list.allows(user_id, username)
+
+    def deny(self, user_id, username) -> bool:
+        """Record a denied attempt (logged at most once per `log_interval` per user);
+        returns whether the user should be told, at most once per `reply_interval`."""
+        now = time.monotonic()
+        self.denied += 1
+        key = user_id if user_id is not None else username
+        state = self._denials.get(key)
+        if state is None:
+            if len(self._denials) >= self.max_tracked:
+                self._denials.clear()
+            state = self._denials[key] = [-self.log_interval, 0, -self.reply_interval]
+        state[1] += 1
+        if now - state[0] >= self.log_interval:
+            logger.warning(
+                f"Unauthorized access attempt from user ID: {user_id} or username: {username}"
+                + (f" ({state[1]} attempts since the last warning)" if state[1] > 1 else "")
+            )
+            state[0], state[1] = now, 0
+        if now - state[2] >= self.reply_interval:
+            state[2] = now
+            self.replies += 1
+            return True
+        return False
+
+    def stats(self):
+        return {
+            "entries": len(self.allow_list),
+            "open": self.allow_list.open,
+            "denied": self.denied,
+            "denial_replies": self.replies,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
@@ -0,0 +1,110 @@
+"""Agent calls under injected faults, with and without the resilience layer.
+
+Runs bot.py's agent relay against a local fake agent that fails or stalls a fraction of
+requests. "plain" is a pass-through configuration (no retries, no circuit breaker, no
+hedging, unbounded concurrency), "resilient" the defaults plus hedging. Telegram is
+replaced by an in-memory message. Run from `src/`:
+
+    python benchmarks/bench_agent_resilience.py --requests 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeAgent, FakeMessage, free_port, serve_in_thread  # noqa: E402
+
+SCENARIOS = {
+    # name: (agent mode, fault settings)
+    "flaky 20% 503": ("stream", {"error_rate": 0.2}),
+    "outage": ("stream", {"error_rate": 1.0}),
+    "slow tail 3% +3s": ("completion", {"slow_rate": 0.03, "slow_delay": 3.0}),
+}
+
+
+def upstream(bot, resilient):
+    from resilience import AdaptiveConcurrencyLimit, CircuitBreaker, ResilientUpstream
+
+    if not resilient:
+        return ResilientUpstream(
+            CircuitBreaker(failure_threshold=10**9), AdaptiveConcurrencyLimit(initial=10**6, max_limit=10**6),
+            max_retries=0,
+        )
+    return ResilientUpstream(
+        CircuitBreaker(failure_threshold=bot.AGENT_CIRCUIT_FAILURES, reset_timeout=bot.AGENT_CIRCUIT_RESET),
+        AdaptiveConcurrencyLimit(initial=bot.AGENT_CONCURRENCY_INITIAL, max_limit=bot.AGENT_CONCURRENCY_MAX),
+        max_retries=bot.AGENT_MAX_RETRIES, attempt_timeout=bot.AGENT_ATTEMPT_TIMEOUT,
+        first_byte_timeout=bot.AGENT_FIRST_BYTE_TIMEOUT, hedge=True, hedge_min_delay=0.2,
+    )
+
+
+async def run(bot, agent, scenario, resilient, requests, concurrency):
+    mode, faults = SCENARIOS[scenario]
+    for name, value in {"error_rate": 0.0, "slow_rate": 0.0, **faults}.items():
+        setattr(agent, name, value)
+    bot.agent_upstream = upstream(bot, resilient)
+    relay = bot.stream_from_abi_api if mode == "stream" else bot.complete_with_abi_api
+    agent_requests = agent.requests
+    slots = asyncio.Semaphore(concurrency)
+    outcomes, latencies = [], []
+
+    async def conversation(i):
+        async with slots:
+            message = FakeMessage()
+            started = time.perf_counter()
+            await relay("hello", f"thread-{i}", message)
+            latencies.append(time.perf_counter() - started)
+            if message.text.startswith("word"):
+                outcomes.append("answered")
+            elif message.text == bot.AGENT_UNAVAILABLE_TEXT:
+                outcomes.append("fast-failed")
+            else:
+                outcomes.append("error")
+
+    await asyncio.gather(*(conversation(i) for i in range(requests)))
+    latencies.sort()
+    stats = bot.agent_upstream.stats()
+    print(
+        f"{scenario:>17} {'resilient' if resilient else 'plain':>9}: "
+        f"answered {outcomes.count('answered'):4d}  errors {outcomes.count('error'):4d}  "
+        f"fast-failed {outcomes.count('fast-failed'):4d}  agent requests {agent.requests - agent_requests:4d}  "
+        f"p50 {statistics.median(latencies):5.2f}s  p99 {latencies[int(len(latencies) * 0.99) - 1]:5.2f}s  "
+        f"retries {stats['retries']:3d}  hedges {stats['hedges']:3d}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    args = parser.parse_args()
+
+    agent = FakeAgent(tokens=20, token_delay=0.005, first_token_delay=0.1)
+    port = free_port()
+    serve_in_thread(agent.app, port)
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "AGENT_API_URL": f"http://127.0.0.1:{port}/completion",
+        "AGENT_API_TOKEN": "bench",
+        "UPDATE_JOURNAL_PATH": "",
+        "TRANSCRIPTION_CACHE_PATH": "",
+        "LOG_LEVEL": "CRITICAL",
+    })
+    import bot
+
+    await bot.http_clients.start()
+    try:
+        for scenario in args.scenarios.split(","):
+            for resilient in (False, True):
+                await run(bot, agent, scenario, resilient, args.requests, args.concurrency)
+    finally:
+        await bot.http_clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""Cost of a flood of updates from an unauthorized user, and allow-list reload time.
+
+Runs bot.py's intake (`dispatch_update`) against a fake Bot API with an allow-list file.
+"legacy" replays the previous behaviour: every denied update is journaled, parsed and
+answered by the handler, with one warning per message. "current" rejects it at intake,
+before the journal and `Update.de_json`, with rate-limited warnings and replies. Run from `src/`:
+
+    python benchmarks/bench_authorization.py --updates 2000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeBotAPI, free_port, serve_in_thread, text_update  # noqa: E402
+
+ALLOWED = 1000
+
+
+class CountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        if "Unauthorized" in record.getMessage():
+            self.count += 1
+
+
+async def flood(bot, bot_api, warnings, updates, first_update_id, intruder):
+    sent, logged = bot_api.calls.get("sendMessage", 0), warnings.count
+    started = time.perf_counter()
+    for i in range(updates):
+        await bot.dispatch_update(text_update(first_update_id + i, intruder, f"spam {i}"))
+    intake = time.perf_counter() - started
+    while bot.scheduler.queued or bot.scheduler.running:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.2)  # let the outbound queue flush
+    return updates / intake, bot_api.calls.get("sendMessage", 0) - sent, warnings.count - logged
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--entries", type=int, default=100_000, help="allow-list size")
+    args = parser.parse_args()
+
+    bot_api = FakeBotAPI()
+    port = free_port()
+    serve_in_thread(bot_api.app, port)
+    state_dir = tempfile.mkdtemp()
+    allow_file = os.path.join(state_dir, "allowed.txt")
+    with open(allow_file, "w") as f:
+        f.write("\n".join(str(ALLOWED + i) for i in range(args.entries)))
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{port}",
+        "AGENT_API_URL": "http://127.0.0.1:9/completion",
+        "AGENT_API_TOKEN": "bench",
+        "AUTHORIZED_USERS_FILE": allow_file,
+        "UPDATE_JOURNAL_PATH": os.path.join(state_dir, "journal.sqlite3"),
+        "TRANSCRIPTION_CACHE_PATH": "",
+        "HTTP2_ENABLED": "false",
+        "OUTBOUND_GLOBAL_RATE": "100000",
+        "OUTBOUND_CHAT_RATE": "100000",
+        "SCHEDULER_MAX_QUEUE_PER_CHAT": "100000",  # the flood comes from a single chat
+        "LOG_LEVEL": "WARNING",
+        "LOG_QUEUE": "false",
+    })
+    import bot
+
+    warnings = CountingHandler()
+    logging.getLogger().addHandler(warnings)
+    logging.getLogger().handlers[0].setLevel(logging.CRITICAL)  # keep the console quiet
+    await bot.start_application()
+    try:
+        reject_unauthorized = bot.reject_unauthorized
+        bot.reject_unauthorized = lambda update_json: False
+        bot.authorizer.log_interval = bot.authorizer.reply_interval = 0
+        rate, replies, logged = await flood(bot, bot_api, warnings, args.updates, 1, 666)
+        print(f" legacy: intake {rate:8.1f} updates/s  replies {replies:5d}  warnings {logged:5d}")
+
+        bot.reject_unauthorized = reject_unauthorized
+        bot.authorizer.log_interval, bot.authorizer.reply_interval = 60.0, 3600.0
+        rate, replies, logged = await flood(bot, bot_api, warnings, args.updates, args.updates + 1, 667)
+        print(f"current: intake {rate:8.1f} updates/s  replies {replies:5d}  warnings {logged:5d}")
+
+        with open(allow_file, "a") as f:
+            f.write("\n667\n")
+        started = time.perf_counter()
+        await bot.authorizer.reload()
+        reload_ms = (time.perf_counter() - started) * 1000
+        print(
+            f"reload of {args.entries + 1} entries: {reload_ms:.1f} ms, "
+            f"user 667 now allowed: {bot.authorizer.is_authorized(667, None)}"
+        )
+    finally:
+        await bot.stop_application()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
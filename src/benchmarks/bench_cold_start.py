@@ -0,0 +1,142 @@
+"""Time to first webhook acknowledgement after a deploy, and answers kept across a SIGTERM.
+
+Starts `python bot.py` as a new process, the way Render does, against a fake Bot API and a
+fake streaming agent, and POSTs an update to /webhook every few milliseconds until one is
+acknowledged. Measured for a first deploy (no webhook registered yet) and a redeploy (the
+webhook is already set). Then sends updates whose answers take a few seconds, SIGTERMs the
+bot right after they were acknowledged and counts the answers that were still completed.
+
+`--src` runs another checkout of `src/` (e.g. a `git worktree` of an older commit) against
+the same fakes. Run from `src/`:
+
+    python benchmarks/bench_cold_start.py --servers asgi,flask --runs 3
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fakes import FakeAgent, FakeBotAPI, free_port, serve_in_subprocess, serve_in_thread, text_update  # noqa: E402
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bench_agent():
+    return FakeAgent(tokens=30, token_delay=0.1, first_token_delay=0.5)
+
+
+def start_bot(args, server, bot_api_port, agent_port, port, log):
+    env = {
+        **os.environ,
+        "BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{bot_api_port}",
+        "AGENT_API_URL": f"http://127.0.0.1:{agent_port}/completion",
+        "AGENT_API_TOKEN": "bench",
+        "OPENAI_API_KEY": "bench",
+        "WEBHOOK_URL": f"http://127.0.0.1:{port}",
+        "WEBHOOK_SERVER": server,
+        "PORT": str(port),
+        "UPDATE_JOURNAL_PATH": os.path.join(tempfile.mkdtemp(), "journal.sqlite3"),
+        "TRANSCRIPTION_CACHE_PATH": "",
+        "HTTP2_ENABLED": "false",
+        "LOG_QUEUE": "false",
+    }
+    return subprocess.Popen([sys.executable, "bot.py"], cwd=args.src, env=env, stdout=log, stderr=log)
+
+
+def first_ack(process, port, update_id, timeout=60.0):
+    """POST one update until it is acknowledged; returns when (`time.monotonic()`)."""
+    deadline = time.monotonic() + timeout
+    with httpx.Client(timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"bot exited with {process.returncode} before serving")
+            try:
+                response = client.post(f"http://127.0.0.1:{port}/webhook", json=text_update(update_id, 1, "hello"))
+                if response.status_code == 200:
+                    return time.monotonic()
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.005)
+    raise RuntimeError("no acknowledgement before the timeout")
+
+
+def stop(process, timeout=60.0):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def cold_start(args, server, bot_api, ports, port, update_ids, log):
+    for deploy in ("first deploy", "redeploy"):
+        times, set_calls = [], 0
+        for _ in range(args.runs):
+            if deploy == "first deploy":
+                bot_api.webhook = {}
+            before = bot_api.calls.get("setWebhook", 0)
+            started = time.monotonic()
+            process = start_bot(args, server, *ports, port, log)
+            try:
+                times.append(first_ack(process, port, next(update_ids)) - started)
+            finally:
+                stop(process)
+            set_calls += bot_api.calls.get("setWebhook", 0) - before
+        print(f"{server:>5} {deploy:>12}: first ack p50 {statistics.median(times):5.2f} s  "
+              f"min {min(times):5.2f} s  setWebhook calls/start {set_calls / args.runs:.1f}")
+
+
+def sigterm_drain(args, server, bot_api, ports, port, update_ids, log):
+    process = start_bot(args, server, *ports, port, log)
+    first_ack(process, port, next(update_ids))
+    time.sleep(5)  # let the warm-up update finish
+    first_chat = max((chat_id for chat_id, _ in bot_api.texts), default=0) + 1
+    chats = range(first_chat, first_chat + args.drain_updates)
+    with httpx.Client(timeout=5.0) as client:
+        for chat_id in chats:
+            client.post(f"http://127.0.0.1:{port}/webhook", json=text_update(next(update_ids), chat_id, "question"))
+    time.sleep(0.3)
+    started = time.monotonic()
+    stop(process)
+    stopped = time.monotonic() - started
+    answered = sum(
+        1 for (chat_id, _), text in bot_api.texts.items() if chat_id in chats and "word29" in text
+    )
+    print(f"{server:>5} SIGTERM with {len(chats)} answers in flight: {answered} completed, "
+          f"exited after {stopped:4.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", default="asgi,flask")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--drain-updates", type=int, default=5)
+    parser.add_argument("--bot-api-latency", type=float, default=0.05, help="seconds per Bot API call")
+    parser.add_argument("--src", default=SRC, help="directory with the bot.py to start")
+    args = parser.parse_args()
+
+    bot_api = FakeBotAPI(latency=args.bot_api_latency)
+    ports = (free_port(), free_port())
+    serve_in_thread(bot_api.app, ports[0])
+    serve_in_subprocess(bench_agent, ports[1])
+    update_ids = iter(range(1, 1_000_000))
+    with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as log:
+        print(f"bot logs: {log.name}")
+        for server in args.servers.split(","):
+            # The same URL on every start, as on Render
+            port = free_port()
+            cold_start(args, server, bot_api, ports, port, update_ids, log)
+            sigterm_drain(args, server, bot_api, ports, port, update_ids, log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Per-update CPU cost of webhook intake, stage by stage.
+
+"legacy" is what every POST used to cost before any check: `json` decoding plus
+`Update.de_json`. "current" is the new intake path: constant-time secret check, orjson (if
+installed), the handled-update pre-filter, and `Update.de_json` only for updates a handler
+can match. The update mix is `--handled` text/voice messages, the rest other kinds
+(photos, stickers, member changes, callback queries). Run from `src/`:
+
+    python benchmarks/bench_intake.py --handled 0.5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import text_update, voice_update  # noqa: E402
+
+from telegram import Bot, Update  # noqa: E402
+from webhook_intake import MESSAGE_UPDATE_TYPES, WebhookIntake, orjson  # noqa: E402
+
+SECRET = "bench-secret-token-0123456789"
+
+
+def unhandled_update(update_id, chat_id, kind):
+    user = {"id": chat_id, "is_bot": False, "first_name": "User"}
+    chat = {"id": chat_id, "type": "private"}
+    message = {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": user}
+    if kind == "photo":
+        photo = [{"file_id": f"p{update_id}_{size}", "file_unique_id": f"u{size}", "width": size, "height": size}
+                 for size in (90, 320, 800)]
+        return {"update_id": update_id, "message": {**message, "photo": photo}}
+    if kind == "sticker":
+        sticker = {"file_id": "s", "file_unique_id": "s", "type": "regular", "width": 512, "height": 512,
+                   "is_animated": False, "is_video": False}
+        return {"update_id": update_id, "message": {**message, "sticker": sticker}}
+    if kind == "my_chat_member":
+        member = {"user": user, "status": "member"}
+        return {"update_id": update_id, "my_chat_member": {
+            "chat": chat, "from": user, "date": int(time.time()),
+            "old_chat_member": {**member, "status": "left"}, "new_chat_member": member,
+        }}
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user, "chat_instance": "1", "data": "button", "message": {**message, "text": "menu"},
+    }}
+
+
+def updates(count, handled):
+    rng = random.Random(1)
+    bodies = []
+    for i in range(count):
+        if rng.random() < handled:
+            update = text_update(i, 1000 + i, f"question {i} " * 5) if i % 4 else voice_update(i, 1000 + i, "v", 5, 9000)
+        else:
+            update = unhandled_update(i, 1000 + i, rng.choice(("photo", "sticker", "my_chat_member", "callback_query")))
+        bodies.append(json.dumps(update).encode())
+    return bodies
+
+
+def per_update(fn, items, repeat):
+    best = min(timeit.repeat(lambda: [fn(item) for item in items], number=1, repeat=repeat))
+    return best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--handled", type=float, default=0.5, help="fraction of updates a handler matches")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    bot = Bot("123:bench")
+    intake = WebhookIntake(SECRET, MESSAGE_UPDATE_TYPES, ("text", "voice"))
+    bodies = updates(args.updates, args.handled)
+    decoded = [json.loads(body) for body in bodies]
+
+    def legacy(body):
+        return Update.de_json(json.loads(body), bot)
+
+    def current(body):
+        if not intake.authentic(SECRET):
+            return None
+        update_json = intake.decode(body)
+        return Update.de_json(update_json, bot) if intake.wanted(update_json) else None
+
+    rows = [
+        ("json.loads", per_update(json.loads, bodies, args.repeat)),
+        ("orjson.loads" if orjson else "json.loads (no orjson)", per_update(intake.decode, bodies, args.repeat)),
+        ("secret check", per_update(lambda body: intake.authentic(SECRET), bodies, args.repeat)),
+        ("pre-filter", per_update(intake.wanted, decoded, args.repeat)),
+        ("Update.de_json", per_update(lambda update: Update.de_json(update, bot), decoded, args.repeat)),
+        ("legacy intake", per_update(legacy, bodies, args.repeat)),
+        ("current intake", per_update(current, bodies, args.repeat)),
+    ]
+    print(f"{len(bodies)} updates, {args.handled:.0%} handled, avg {sum(map(len, bodies)) / len(bodies):.0f} bytes")
+    for name, cost in rows:
+        print(f"  {name:>24}: {cost:7.2f} us/update")
+    print(f"  current intake is x{rows[-2][1] / rows[-1][1]:.1f} faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Load test: synthetic traffic from many chats through the whole bot, webhook and polling mode.
+
+Everything upstream is a local stand-in (see fakes.py): the Bot API (sendMessage,
+editMessageText, getFile, file download, getUpdates), the agent (completion or SSE) and
+OpenAI transcription, each with configurable latency and errors. The bot runs as its own
+process, started like in production: `bot.py` for webhook mode (updates are POSTed to
+/webhook) and `bot_polling.py` for polling mode (updates are served by getUpdates).
+
+Updates arrive at `--rate` per second, spread over `--chats` chats (a `--voice-share` of them
+voice messages). A reply counts as done when its message shows the agent's complete answer.
+Reported per mode:
+
+- updates/s: replies done per second, from the first update sent to the last reply done
+- time to reply p50/p99: from sending the update to its complete answer being visible
+- edits per reply: editMessageText calls on the reply message
+- failed: replies without the complete answer when the run ends
+- memory: peak and final RSS of the bot process
+
+`--json` appends the results to a file, one JSON object per mode and run, to compare runs.
+Run from `src/`:
+
+    python benchmarks/bench_load.py --modes webhook,polling --updates 300 --chats 100 --rate 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fakes import (  # noqa: E402
+    FakeAgent, FakeBotAPI, FakeOpenAI, free_port, serve_in_subprocess, serve_in_thread, text_update, voice_update,
+)
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VOICE_FILE = "loadvoice"
+
+
+def memory_kb(pid):
+    """Peak and current resident memory of `pid` in KiB (Linux), or (None, None)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["VmHWM"].split()[0]), int(fields["VmRSS"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+def start_bot(args, mode, ports, port, log):
+    env = {
+        **os.environ,
+        "BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{ports['bot_api']}",
+        "AGENT_API_URL": f"http://127.0.0.1:{ports['agent']}/completion",
+        "AGENT_API_TOKEN": "bench",
+        "AGENT_API_MODE": args.agent_mode,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{ports['openai']}/v1",
+        "WEBHOOK_URL": f"http://127.0.0.1:{port}",
+        "PORT": str(port),
+        "POLLING_TIMEOUT": "5",
+        "UPDATE_JOURNAL_PATH": os.path.join(tempfile.mkdtemp(), "journal.sqlite3"),
+        "TRANSCRIPTION_CACHE_PATH": "",
+        "HTTP2_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    if args.unthrottled:
+        # Measure the bot itself rather than Telegram's rate limits
+        env.update({"OUTBOUND_GLOBAL_RATE": "100000", "OUTBOUND_CHAT_RATE": "100000",
+                    "STREAM_EDITS_PER_SECOND": "100000"})
+    script = "bot.py" if mode == "webhook" else "bot_polling.py"
+    return subprocess.Popen([sys.executable, script], cwd=args.src, env=env, stdout=log, stderr=log)
+
+
+async def wait_ready(process, mode, bot_api, port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"bot exited with {process.returncode} before serving")
+            if mode == "polling":
+                if bot_api.calls.get("getUpdates", 0) > 0:
+                    return
+            else:
+                try:
+                    if (await client.get(f"http://127.0.0.1:{port}/")).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError("bot not ready before the timeout")
+
+
+def make_updates(args, first_update_id, first_chat):
+    rng = random.Random(first_update_id)
+    updates = []
+    for i in range(args.updates):
+        update_id, chat_id = first_update_id + i, first_chat + i % args.chats
+        if rng.random() < args.voice_share:
+            updates.append(voice_update(update_id, chat_id, VOICE_FILE, 5, args.voice_bytes))
+        else:
+            # Distinct texts, so the response cache (when enabled) does not answer them
+            updates.append(text_update(update_id, chat_id, f"question {update_id}"))
+    return updates
+
+
+async def send(args, mode, bot_api, port, updates):
+    """Deliver `updates` at `--rate` per second; returns the send time of each, by update_id."""
+    sent_at = {}
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    started = time.monotonic()
+    async with httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_connections=40)) as client:
+        posts = set()
+        for i, update in enumerate(updates):
+            delay = started + i * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sent_at[update["update_id"]] = time.monotonic()
+            if mode == "polling":
+                bot_api.push_updates([update])
+            else:
+                # Like Telegram, up to max_connections deliveries at once
+                post = asyncio.create_task(client.post(f"http://127.0.0.1:{port}/webhook", json=update))
+                posts.add(post)
+                post.add_done_callback(posts.discard)
+                if len(posts) >= 40:
+                    await asyncio.wait(posts, return_when=asyncio.FIRST_COMPLETED)
+        await asyncio.gather(*posts, return_exceptions=True)
+    return sent_at
+
+
+def replies(bot_api, updates, marker):
+    """Per update: (reply message key, time its complete answer appeared or None, edits).
+
+    A chat's updates are answered in order, so its n-th reply message belongs to its n-th update.
+    """
+    chats = {update["message"]["chat"]["id"] for update in updates}
+    messages: dict[int, list] = {chat_id: [] for chat_id in chats}
+    done_at, edits = {}, {}
+    for at, method, chat_id, message_id, text in bot_api.history:
+        if chat_id not in chats:
+            continue
+        key = (chat_id, message_id)
+        if method == "sendMessage":
+            messages[chat_id].append(key)
+        else:
+            edits[key] = edits.get(key, 0) + 1
+        if marker in text and key not in done_at:
+            done_at[key] = at
+    results, seen = {}, {}
+    for update in updates:
+        chat_id = update["message"]["chat"]["id"]
+        n = seen[chat_id] = seen.get(chat_id, -1) + 1
+        key = messages[chat_id][n] if n < len(messages[chat_id]) else None
+        results[update["update_id"]] = (key, done_at.get(key), edits.get(key, 0))
+    return results
+
+
+async def run(args, mode, bot_api, ports, first_update_id, first_chat, log):
+    port = free_port()
+    process = start_bot(args, mode, ports, port, log)
+    try:
+        await wait_ready(process, mode, bot_api, port)
+        updates = make_updates(args, first_update_id, first_chat)
+        marker = f"word{args.agent_tokens - 1}"
+        sent_at = await send(args, mode, bot_api, port, updates)
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            if all(done for _, done, _ in replies(bot_api, updates, marker).values()):
+                break
+            await asyncio.sleep(0.2)
+        peak_kb, rss_kb = memory_kb(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    results = replies(bot_api, updates, marker)
+    done = {update_id: (at, edits) for update_id, (_, at, edits) in results.items() if at is not None}
+    times = [at - sent_at[update_id] for update_id, (at, _) in done.items()]
+    elapsed = (max(at for at, _ in done.values()) - min(sent_at.values())) if done else float("nan")
+    report = {
+        "mode": mode,
+        "agent_mode": args.agent_mode,
+        "updates": len(updates),
+        "chats": args.chats,
+        "rate": args.rate,
+        "updates_per_second": round(len(done) / elapsed, 2) if done else 0.0,
+        "time_to_reply_p50": round(statistics.median(times), 3) if times else None,
+        "time_to_reply_p99": round(percentile(times, 0.99), 3) if times else None,
+        "edits_per_reply": round(statistics.mean(edits for _, edits in done.values()), 2) if done else None,
+        "failed": len(updates) - len(done),
+        "peak_rss_mib": round(peak_kb / 1024, 1) if peak_kb else None,
+        "rss_mib": round(rss_kb / 1024, 1) if rss_kb else None,
+    }
+    print(
+        f"{mode:>8}: {report['updates_per_second']:6.1f} updates/s  "
+        f"time to reply p50 {report['time_to_reply_p50'] or float('nan'):6.2f} s  "
+        f"p99 {report['time_to_reply_p99'] or float('nan'):6.2f} s  "
+        f"edits/reply {report['edits_per_reply'] or 0:5.1f}  failed {report['failed']:4d}  "
+        f"RSS peak {report['peak_rss_mib'] or float('nan'):6.1f} MiB"
+    )
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="webhook,polling")
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=20.0, help="updates per second, 0 for all at once")
+    parser.add_argument("--voice-share", type=float, default=0.1, help="fraction of voice messages")
+    parser.add_argument("--voice-bytes", type=int, default=20_000)
+    parser.add_argument("--agent-mode", choices=("stream", "completion"), default="stream")
+    parser.add_argument("--agent-tokens", type=int, default=40, help="words per answer")
+    parser.add_argument("--agent-token-delay", type=float, default=0.05)
+    parser.add_argument("--agent-first-token-delay", type=float, default=0.5)
+    parser.add_argument("--agent-error-rate", type=float, default=0.0)
+    parser.add_argument("--bot-api-latency", type=float, default=0.05, help="seconds per Bot API call")
+    parser.add_argument("--bot-api-error-rate", type=float, default=0.0,
+                        help="fraction of sendMessage/editMessageText answered with --bot-api-error-status")
+    parser.add_argument("--bot-api-error-status", type=int, default=429)
+    parser.add_argument("--transcription-delay", type=float, default=0.5)
+    parser.add_argument("--unthrottled", action="store_true", help="lift the bot's Telegram rate limits")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for replies after sending")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--json", help="append the results to this file (JSON lines)")
+    parser.add_argument("--src", default=SRC, help="directory with the bot.py to start")
+    args = parser.parse_args()
+
+    bot_api = FakeBotAPI(files={VOICE_FILE: os.urandom(args.voice_bytes)}, latency=args.bot_api_latency,
+                         error_rate=args.bot_api_error_rate, error_status=args.bot_api_error_status, record=True)
+    ports = {"bot_api": free_port(), "agent": free_port(), "openai": free_port()}
+    serve_in_thread(bot_api.app, ports["bot_api"])
+    serve_in_subprocess(FakeAgent, ports["agent"], args.agent_tokens, args.agent_token_delay,
+                        args.agent_first_token_delay, args.agent_error_rate)
+    serve_in_subprocess(FakeOpenAI, ports["openai"], args.transcription_delay)
+
+    first_update_id, first_chat = 1, 1
+    with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as log:
+        print(f"bot logs: {log.name}")
+        for _ in range(args.runs):
+            for mode in args.modes.split(","):
+                report = await run(args, mode, bot_api, ports, first_update_id, first_chat, log)
+                first_update_id += args.updates
+                first_chat += args.chats
+                if args.json:
+                    with open(args.json, "a") as out:
+                        out.write(json.dumps({**report, "time": time.time()}) + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""Update throughput of bot.py with logging off, on (queued or inline), and the old intake logging.
+
+Each configuration runs in a fresh subprocess: updates go through `dispatch_update`, the
+scheduler and the text handler, against a fake Bot API and a fake streaming agent. Log lines
+are written to a file. "intake" is the rate `dispatch_update` accepts updates at, "end to
+end" includes answering all of them. "legacy" puts back the old per-update logging done at
+intake (full payload plus the `dir(update)` walk) in front of the same code. Run from `src/`:
+
+    python benchmarks/bench_logging.py --updates 2000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeAgent, FakeBotAPI, free_port, serve_in_thread, text_update  # noqa: E402
+
+CONFIGS = {
+    "off": {"LOG_LEVEL": "WARNING"},
+    "on/queue": {"LOG_LEVEL": "INFO", "LOG_QUEUE": "true"},
+    "on/inline": {"LOG_LEVEL": "INFO", "LOG_QUEUE": "false"},
+    "on/sampled": {"LOG_LEVEL": "INFO", "LOG_QUEUE": "true", "LOG_SAMPLE_RATE": "0.1"},
+    "legacy": {"LOG_LEVEL": "INFO", "LOG_QUEUE": "false", "LOG_LEVELS": ""},
+}
+
+
+async def legacy_dispatch(bot, update_json):
+    """The intake logging bot.py used to do for every update."""
+    bot.logger.info(f"Webhook message received: {update_json}")
+    await bot.dispatch_update(update_json)
+    update = bot.Update.de_json(update_json, bot.app.bot)
+    bot.logger.info("Update attributes:")
+    for attr in dir(update):
+        if attr.startswith("__") and attr.endswith("__"):
+            continue
+        value = getattr(update, attr)
+        bot.logger.info(f"  {attr}: {value}")
+
+
+async def child(config, updates, chats):
+    bot_api, agent = FakeBotAPI(), FakeAgent(tokens=30, token_delay=0, first_token_delay=0)
+    bot_port, agent_port = free_port(), free_port()
+    serve_in_thread(bot_api.app, bot_port)
+    serve_in_thread(agent.app, agent_port)
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{bot_port}",
+        "AGENT_API_URL": f"http://127.0.0.1:{agent_port}/completion",
+        "AGENT_API_TOKEN": "bench",
+        "UPDATE_JOURNAL_PATH": "",
+        "TRANSCRIPTION_CACHE_PATH": "",
+        "HTTP2_ENABLED": "false",
+        "OUTBOUND_GLOBAL_RATE": "100000",
+        "OUTBOUND_CHAT_RATE": "100000",
+        **CONFIGS[config],
+    })
+    import bot
+
+    dispatch = (lambda u: legacy_dispatch(bot, u)) if config == "legacy" else bot.dispatch_update
+    await bot.start_application()
+    try:
+        started = time.perf_counter()
+        for i in range(updates):
+            await dispatch(text_update(i + 1, 1000 + i % chats, f"message {i} " + "lorem ipsum " * 20))
+        intake = time.perf_counter() - started
+        while bot.scheduler.queued or bot.scheduler.running:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    finally:
+        await bot.stop_application()
+    print(f"{updates / intake:.1f} {updates / elapsed:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args.child, args.updates, args.chats))
+        return
+
+    for config in args.configs.split(","):
+        with tempfile.TemporaryFile() as log_file:
+            result = subprocess.run(
+                [sys.executable, __file__, "--child", config, "--updates", str(args.updates), "--chats", str(args.chats)],
+                stdout=subprocess.PIPE, stderr=log_file, text=True, check=True,
+            )
+            log_bytes = log_file.tell()
+        intake, handled = map(float, result.stdout.strip().splitlines()[-1].split())
+        print(
+            f"{config:>11}: intake {intake:8.1f} updates/s  end to end {handled:6.1f} updates/s  "
+            f"log output {log_bytes / 1024:9.1f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
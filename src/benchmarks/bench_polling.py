@@ -0,0 +1,102 @@
+"""Messages per second in polling mode: PTB's default polling against bot_polling.py.
+
+Queues text messages from many chats on a fake Bot API, then lets the bot fetch them with
+getUpdates and answer each from a fake streaming agent (~0.6 s per answer). "legacy" is
+`Updater.start_polling()` with default settings, which handles one update at a time.
+"current" is `bot_polling.UpdatePoller`, which feeds the per-chat scheduler. Run from `src/`:
+
+    python benchmarks/bench_polling.py --updates 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeAgent, FakeBotAPI, free_port, serve_in_subprocess, serve_in_thread, text_update  # noqa: E402
+
+
+def bench_agent():
+    return FakeAgent(tokens=20, token_delay=0.02, first_token_delay=0.2)
+
+
+async def wait_handled(counter, target):
+    while counter[0] < target:
+        await asyncio.sleep(0.01)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--modes", default="legacy,current")
+    args = parser.parse_args()
+
+    bot_api = FakeBotAPI()
+    bot_api_port, agent_port = free_port(), free_port()
+    serve_in_thread(bot_api.app, bot_api_port)
+    serve_in_subprocess(bench_agent, agent_port)
+    state_dir = tempfile.mkdtemp()
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{bot_api_port}",
+        "AGENT_API_URL": f"http://127.0.0.1:{agent_port}/completion",
+        "AGENT_API_TOKEN": "bench",
+        "UPDATE_JOURNAL_PATH": os.path.join(state_dir, "journal.sqlite3"),
+        "TRANSCRIPTION_CACHE_PATH": "",
+        "HTTP2_ENABLED": "false",
+        "OUTBOUND_GLOBAL_RATE": "100000",
+        "OUTBOUND_CHAT_RATE": "100000",
+        "AGENT_CONCURRENCY_INITIAL": "1000",
+        "AGENT_CONCURRENCY_MAX": "1000",
+        "POLLING_TIMEOUT": "1",
+        "LOG_LEVEL": "WARNING",
+        "LOG_QUEUE": "false",
+    })
+    import bot
+    import bot_polling
+    from telegram.ext import TypeHandler
+    from telegram import Update
+
+    # Group 1 runs after the answering handler of group 0 has returned
+    handled = [0]
+
+    async def count(update, context):
+        handled[0] += 1
+    bot.app.add_handler(TypeHandler(Update, count), group=1)
+
+    await bot.start_application()
+    try:
+        first_update_id = 1
+        for mode in args.modes.split(","):
+            bot_api.push_updates(
+                text_update(first_update_id + i, 1000 + i % args.chats, f"question {i}") for i in range(args.updates)
+            )
+            first_update_id += args.updates
+            target = handled[0] + args.updates
+            started = time.perf_counter()
+            if mode == "legacy":
+                await bot.app.updater.start_polling(timeout=1)
+                await wait_handled(handled, target)
+                elapsed = time.perf_counter() - started
+                await bot.app.updater.stop()
+                polls = bot_api.calls.get("getUpdates", 0)
+            else:
+                poller = bot_polling.create_poller()
+                polling = asyncio.create_task(poller.run())
+                await wait_handled(handled, target)
+                elapsed = time.perf_counter() - started
+                poller.stop()
+                await polling
+                await poller.confirm()
+                polls = poller.polls
+            print(f"{mode:>7}: {args.updates / elapsed:7.1f} messages/s  ({elapsed:.1f} s, {polls} getUpdates calls)")
+    finally:
+        await bot.stop_application()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""Failed Bot API calls per answer: raw Markdown edits against the rendering engine.
+
+Streams Markdown-heavy agent answers (code, snake_case names, formulas, links, some longer
+than one message) into Telegram messages through `streaming.StreamRelay`, against a fake
+Bot API that rejects markup Telegram would not parse and texts over 4096 characters.
+"legacy" sends the raw text with `ParseMode.MARKDOWN` and, like bot.py did, replaces the
+answer with an error when the final edit fails. "html" and "markdownv2" render with
+`rendering.Renderer`. Run from `src/`:
+
+    python benchmarks/bench_rendering.py --answers 40
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeBotAPI, free_port, serve_in_thread  # noqa: E402
+
+from telegram.constants import ParseMode  # noqa: E402
+from telegram.error import TelegramError  # noqa: E402
+from telegram.ext import ExtBot  # noqa: E402
+
+from outbound import FINAL, OutboundRateLimiter, edit_text  # noqa: E402
+from rendering import Renderer  # noqa: E402
+from streaming import EditRateGovernor, StreamRelay  # noqa: E402
+
+SNIPPETS = [
+    "## Setup\n\nInstall the package, then set `BOT_TOKEN` and **AGENT_API_URL** in your `.env` file.\n",
+    "The function `parse_user_input` calls get_user_id() and returns a dict.\n",
+    "Complexity is O(n*log n) when n > 1000, and 2*3 = 6 in the worst case.\n",
+    "See [the docs](https://core.telegram.org/bots/api#formatting-options) for *details*.\n",
+    "```python\ndef handle(update):\n    return update.message.text or '*empty*'\n```\n",
+    "- first item with an_underscore\n- second item (optional)\n- third item: **done**\n",
+    "Use ~~old_api~~ the new `send_text` helper; it keeps the topic_id.\n",
+    "A half-finished **bold marker and a stray [bracket are common in model output.\n",
+    "> Quoted text with a # hash, a + plus and a | pipe. Done!\n",
+]
+
+
+def answer(rng, min_chars):
+    parts, length = [], 0
+    while length < min_chars:
+        snippet = rng.choice(SNIPPETS)
+        parts.append(snippet + "\n")
+        length += len(snippet) + 1
+    return "".join(parts)
+
+
+async def stream(relay, text, chunk_chars, chunk_delay):
+    for i in range(0, len(text), chunk_chars):
+        relay.append(text[i:i + chunk_chars])
+        await asyncio.sleep(chunk_delay)
+
+
+async def run(bot, bot_api, mode, answers, args):
+    renderer = None if mode == "legacy" else Renderer(ParseMode.HTML if mode == "html" else ParseMode.MARKDOWN_V2)
+    governor = EditRateGovernor(per_chat_interval=args.edit_interval, global_rate=1000)
+    calls_before = sum(bot_api.calls.get(m, 0) for m in ("sendMessage", "editMessageText"))
+    errors_before = sum(bot_api.errors.values())
+    delivered = messages = 0
+    started = time.perf_counter()
+
+    async def conversation(i, text):
+        nonlocal delivered, messages
+        placeholder = await bot.send_message(1000 + i, "⏳ Thinking...", rate_limit_args=FINAL)
+        relay = StreamRelay(placeholder, governor, renderer=renderer)
+        await stream(relay, text, args.chunk_chars, args.chunk_delay)
+        try:
+            await relay.finish()
+            delivered += 1
+        except TelegramError as e:
+            # What bot.py did when the answer could not be sent
+            await edit_text(relay.message, f"⚠️ Internal error: {e}", parse_mode=ParseMode.MARKDOWN,
+                            rate_limit_args=FINAL)
+        finally:
+            messages += len(relay.messages)
+
+    await asyncio.gather(*(conversation(i, text) for i, text in enumerate(answers)))
+    elapsed = time.perf_counter() - started
+    calls = sum(bot_api.calls.get(m, 0) for m in ("sendMessage", "editMessageText")) - calls_before
+    failed = sum(bot_api.errors.values()) - errors_before
+    print(f"{mode:>10}: delivered {delivered:3d}/{len(answers)}  failed calls/answer {failed / len(answers):5.2f}  "
+          f"calls/answer {calls / len(answers):5.1f}  messages/answer {messages / len(answers):4.2f}  "
+          f"({elapsed:.1f} s)")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--answers", type=int, default=40)
+    parser.add_argument("--long-share", type=float, default=0.25, help="fraction of answers over one message")
+    parser.add_argument("--chunk-chars", type=int, default=12)
+    parser.add_argument("--chunk-delay", type=float, default=0.005)
+    parser.add_argument("--edit-interval", type=float, default=0.1)
+    parser.add_argument("--modes", default="legacy,html,markdownv2")
+    args = parser.parse_args()
+    # Every rejected legacy edit is logged; only the totals matter here
+    logging.getLogger("streaming").setLevel(logging.CRITICAL)
+
+    rng = random.Random(7)
+    answers = [answer(rng, 6000 if rng.random() < args.long_share else 800) for _ in range(args.answers)]
+
+    bot_api = FakeBotAPI()
+    port = free_port()
+    serve_in_thread(bot_api.app, port)
+    limiter = OutboundRateLimiter(global_rate=100_000, chat_rate=100_000)
+    bot = ExtBot("123:bench", base_url=f"http://127.0.0.1:{port}/bot", rate_limiter=limiter)
+    await bot.initialize()
+    try:
+        for mode in args.modes.split(","):
+            await run(bot, bot_api, mode, answers, args)
+    finally:
+        await bot.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
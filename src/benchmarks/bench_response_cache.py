@@ -0,0 +1,109 @@
+"""Agent calls and answer latency for repeated prompts, with the response cache off and on.
+
+Runs bot.py's `send_to_abi_api` against a local fake agent: every conversation is a new
+thread asking one of a few common questions (phrased with varying case and punctuation),
+and a share of threads send a follow-up, which must bypass the cache. Telegram is replaced
+by an in-memory message. Run from `src/`:
+
+    python benchmarks/bench_response_cache.py --requests 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeAgent, FakeMessage, free_port, serve_in_thread  # noqa: E402
+
+QUESTIONS = [
+    "How do I reset my password?",
+    "how do i reset my password",
+    "What are your opening hours?",
+    "How can I cancel my subscription?",
+    "Where is my invoice?",
+    "How do I change my email address?",
+]
+
+
+async def run(bot, agent, cached, requests, concurrency, follow_ups):
+    from response_cache import ResponseCache
+
+    bot.response_cache = ResponseCache(ttl=bot.RESPONSE_CACHE_TTL) if cached else None
+    # The fake agent keeps no per-thread memory, so answers can be shared between chats
+    bot.RESPONSE_CACHE_SHARED = True
+    agent_requests = agent.requests
+    rng = random.Random(1)
+    plan = [(rng.choice(QUESTIONS), rng.random() < follow_ups) for _ in range(requests)]
+    slots = asyncio.Semaphore(concurrency)
+    offset = bot.sessions.created
+    latencies = []
+
+    async def ask(prompt, session):
+        message = FakeMessage()
+        started = time.perf_counter()
+        await bot.send_to_abi_api(prompt, session, message)
+        latencies.append(time.perf_counter() - started)
+        assert message.text.startswith("word"), message.text
+
+    async def conversation(i):
+        async with slots:
+            question, follow_up = plan[i]
+            # A new chat per conversation, offset so each run starts new threads
+            session = bot.sessions.get(offset + i)
+            await ask(question, session)
+            if follow_up:
+                await ask("and on mobile?", session)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(conversation(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    line = (
+        f"cache {'on' if cached else 'off':>3}: {len(latencies)} prompts in {elapsed:5.2f}s  "
+        f"agent requests {agent.requests - agent_requests:4d}  "
+        f"mean {statistics.mean(latencies) * 1000:6.1f} ms  median {statistics.median(latencies) * 1000:6.1f} ms"
+    )
+    if cached:
+        stats = bot.response_cache.stats()
+        line += (
+            f"  hits {stats['hits']}  bypassed {stats['bypassed']}  "
+            f"calls saved {stats['agent_calls_saved']}  seconds saved {stats['seconds_saved']}"
+        )
+    print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--follow-ups", type=float, default=0.3, help="share of threads sending a follow-up")
+    parser.add_argument("--mode", choices=("stream", "completion"), default="stream")
+    args = parser.parse_args()
+
+    agent = FakeAgent(tokens=20, token_delay=0.005, first_token_delay=0.2)
+    port = free_port()
+    serve_in_thread(agent.app, port)
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "AGENT_API_URL": f"http://127.0.0.1:{port}/completion",
+        "AGENT_API_TOKEN": "bench",
+        "AGENT_API_MODE": args.mode,
+        "UPDATE_JOURNAL_PATH": "",
+        "TRANSCRIPTION_CACHE_PATH": "",
+        "LOG_LEVEL": "CRITICAL",
+    })
+    import bot
+
+    await bot.http_clients.start()
+    try:
+        for cached in (False, True):
+            await run(bot, agent, cached, args.requests, args.concurrency, args.follow_ups)
+    finally:
+        await bot.http_clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+"""Session store footprint and lookup cost, and what cancelling superseded requests saves.
+
+1. Memory per chat for `session_store.Session` records against plain dict records, and the
+   cost of a thread key lookup against hashing the chat id on every message.
+2. End to end through bot.py's intake with a fake streaming agent (~1.2 s per answer): every
+   chat sends a burst of messages, a few tenths of a second apart. Compared with and without SESSION_CANCEL_SUPERSEDED, by the time until each
+   chat's last message is answered and by the number of agent calls. Run from `src/`:
+
+    python benchmarks/bench_sessions.py --chats 200000 --burst-chats 20
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeAgent, FakeBotAPI, free_port, serve_in_subprocess, serve_in_thread, text_update  # noqa: E402
+
+from session_store import SessionStore, thread_key  # noqa: E402
+
+
+def bench_agent():
+    return FakeAgent(tokens=10, token_delay=0.1, first_token_delay=0.3)
+
+
+def footprint(chats):
+    def measure(build):
+        gc.collect()
+        tracemalloc.start()
+        store = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del store
+        return size / chats
+
+    def slotted():
+        store = SessionStore(max_sessions=chats)
+        for chat_id in range(chats):
+            store.get(chat_id)
+        return store
+
+    def dicts():
+        return {chat_id: {"thread_id": thread_key(chat_id), "last_active": time.monotonic(), "in_flight": None,
+                          "reply": None, "summary": ""} for chat_id in range(chats)}
+
+    slotted_bytes, dict_bytes = measure(slotted), measure(dicts)
+    print(f"memory per chat: __slots__ {slotted_bytes:.0f} B, dict records {dict_bytes:.0f} B "
+          f"-> {slotted_bytes * 1_000_000 / 2**20:.0f} MiB per million chats")
+
+    store = SessionStore(max_sessions=chats)
+    for chat_id in range(chats):
+        store.get(chat_id)
+    n = 200_000
+    lookup = timeit.timeit(lambda: store.get(12345).thread_id, number=n) / n * 1e6
+    hashing = timeit.timeit(lambda: thread_key(12345), number=n) / n * 1e6
+    print(f"thread key: store lookup {lookup:.2f} us, sha256 per message {hashing:.2f} us")
+
+
+async def bursts(bot, chats, burst, gap, first_update_id, answered):
+    """Send `burst` messages per chat, `gap` seconds apart; seconds until every chat's last message was answered."""
+    last_ids = {}
+    started = time.perf_counter()
+    for j in range(burst):
+        if j:
+            await asyncio.sleep(gap)
+        for c in range(chats):
+            update_id = first_update_id + j * chats + c
+            await bot.dispatch_update(text_update(update_id, 5000 + c, f"question {j}"))
+            last_ids[5000 + c] = update_id
+    while not all(answered.get(chat) == update_id for chat, update_id in last_ids.items()):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    while bot.scheduler.queued or bot.scheduler.running:
+        await asyncio.sleep(0.01)
+    return elapsed
+
+
+async def end_to_end(chats, burst, gap):
+    bot_api = FakeBotAPI()
+    bot_api_port, agent_port = free_port(), free_port()
+    serve_in_thread(bot_api.app, bot_api_port)
+    serve_in_subprocess(bench_agent, agent_port)
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{bot_api_port}",
+        "AGENT_API_URL": f"http://127.0.0.1:{agent_port}/completion",
+        "AGENT_API_TOKEN": "bench",
+        "UPDATE_JOURNAL_PATH": os.path.join(tempfile.mkdtemp(), "journal.sqlite3"),
+        "TRANSCRIPTION_CACHE_PATH": "",
+        "HTTP2_ENABLED": "false",
+        "OUTBOUND_GLOBAL_RATE": "100000",
+        "OUTBOUND_CHAT_RATE": "100000",
+        "AGENT_CONCURRENCY_INITIAL": "1000",
+        "AGENT_CONCURRENCY_MAX": "1000",
+        "LOG_LEVEL": "WARNING",
+        "LOG_QUEUE": "false",
+    })
+    import bot
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    # Group 1 runs only once the answering handler of group 0 has returned (not when it was cancelled)
+    answered = {}
+
+    async def record(update, context):
+        answered[update.effective_chat.id] = update.update_id
+    bot.app.add_handler(TypeHandler(Update, record), group=1)
+
+    await bot.start_application()
+    try:
+        first_update_id = 1
+        for cancel in (False, True):
+            bot.SESSION_CANCEL_SUPERSEDED = cancel
+            agent_calls, superseded = bot.http_clients.agent.requests, bot.sessions.superseded
+            elapsed = await bursts(bot, chats, burst, gap, first_update_id, answered)
+            first_update_id += chats * burst
+            print(f"cancel superseded={cancel!s:5}: last answers after {elapsed:5.2f} s  "
+                  f"agent calls {bot.http_clients.agent.requests - agent_calls:4d}  "
+                  f"superseded {bot.sessions.superseded - superseded:4d}")
+    finally:
+        await bot.stop_application()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=200_000, help="sessions for the footprint measurement")
+    parser.add_argument("--burst-chats", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=3, help="messages per chat in each burst")
+    parser.add_argument("--gap", type=float, default=0.3, help="seconds between a chat's messages")
+    args = parser.parse_args()
+
+    footprint(args.chats)
+    await end_to_end(args.burst_chats, args.burst, args.gap)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
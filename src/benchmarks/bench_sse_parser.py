@@ -0,0 +1,93 @@
+"""Microbenchmark: parse a multi-megabyte agent SSE stream, old line loop vs SSEDecoder.
+
+The "legacy" variant replays the loop bot_polling.py used to run: httpx's line decoder
+(what `aiter_lines` uses), strip `data:` and `accumulated += chunk`, with a full-text
+snapshot kept for every edit. The
+"decoder" variant feeds the same bytes to `sse.SSEDecoder` and buffers chunks in a list.
+Run from `src/`:
+
+    python benchmarks/bench_sse_parser.py --megabytes 1,4,16
+"""
+import argparse
+import os
+import sys
+import time
+
+from httpx._decoders import LineDecoder, TextDecoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sse import SSEDecoder  # noqa: E402
+
+NETWORK_CHUNK = 4096
+
+
+def make_stream(megabytes):
+    event = b"event: message\ndata: token-ab \n\n"
+    count = megabytes * 1024 * 1024 // len(event)
+    body = event * count
+    return [body[i:i + NETWORK_CHUNK] for i in range(0, len(body), NETWORK_CHUNK)], count
+
+
+def legacy(chunks, edit_every):
+    text_decoder = TextDecoder()
+    line_decoder = LineDecoder()
+    accumulated = ""
+    last_sent_text = ""
+    event_name = None
+    lines_seen = 0
+    for chunk in chunks:
+        for raw_line in line_decoder.decode(text_decoder.decode(chunk)):
+            if not raw_line:
+                continue
+            if raw_line.startswith("event:"):
+                event_name = raw_line[len("event:"):].strip()
+                continue
+            if not raw_line.startswith("data:") or event_name != "message":
+                continue
+            data = raw_line[len("data:"):].strip()
+            accumulated += data
+            lines_seen += 1
+            if edit_every and lines_seen % edit_every == 0 and accumulated != last_sent_text:
+                last_sent_text = accumulated
+    return len(accumulated)
+
+
+def decoder(chunks, edit_every):
+    sse = SSEDecoder()
+    parts = []
+    dirty = False
+    events_seen = 0
+    for chunk in chunks:
+        for event in sse.feed(chunk):
+            if event.event != "message":
+                continue
+            parts.append(event.data)
+            dirty = True
+            events_seen += 1
+            if edit_every and events_seen % edit_every == 0 and dirty:
+                parts[:] = ["".join(parts)]
+                dirty = False
+    sse.close()
+    return len("".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", default="1,4,16")
+    parser.add_argument(
+        "--edit-every", type=int, default=50,
+        help="events between full-text snapshots (an edit); 0 measures parsing alone",
+    )
+    args = parser.parse_args()
+
+    for megabytes in map(int, args.megabytes.split(",")):
+        chunks, events = make_stream(megabytes)
+        for name, parse in (("legacy", legacy), ("decoder", decoder)):
+            started = time.perf_counter()
+            parse(chunks, args.edit_every)
+            elapsed = time.perf_counter() - started
+            print(f"{megabytes:>3} MB {name:>8}: {elapsed * 1000:8.1f} ms  {megabytes / elapsed:7.1f} MB/s  ({events} events)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measure time to first visible text and edits per answer, streaming vs completion mode.
+
+Runs bot.py's agent relay against a local fake agent (SSE and JSON endpoints). Telegram is
+replaced by an in-memory message whose edits take `--edit-latency` seconds. Run from `src/`:
+
+    python benchmarks/bench_streaming.py --chats 1,50 --tokens 300
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeAgent, FakeMessage, free_port, serve_in_thread  # noqa: E402
+
+
+async def run(bot, mode, chats, edit_latency):
+    relay = bot.stream_from_abi_api if mode == "stream" else bot.complete_with_abi_api
+
+    async def conversation(i):
+        message = FakeMessage(edit_latency)
+        started = time.perf_counter()
+        await relay("hello", f"thread-{i}", message)
+        return message.edit_times[0] - started, len(message.edit_times), time.perf_counter() - started
+
+    results = await asyncio.gather(*(conversation(i) for i in range(chats)))
+    first, edits, total = zip(*results)
+    print(
+        f"{mode:>10} x{chats:<4} first text p50 {statistics.median(first) * 1000:8.1f} ms  "
+        f"max {max(first) * 1000:8.1f} ms  edits/answer {statistics.mean(edits):6.1f}  "
+        f"answer done p50 {statistics.median(total):6.2f} s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", default="1,50", help="comma-separated concurrent conversations")
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--edit-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    agent = FakeAgent(args.tokens, args.token_delay, args.first_token_delay)
+    port = free_port()
+    serve_in_thread(agent.app, port)
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "AGENT_API_URL": f"http://127.0.0.1:{port}/completion",
+        "AGENT_API_TOKEN": "bench",
+        "UPDATE_JOURNAL_PATH": "",
+    })
+    import bot
+    bot.logging.getLogger().setLevel("WARNING")
+
+    await bot.http_clients.start()
+    try:
+        for chats in map(int, args.chats.split(",")):
+            for mode in ("completion", "stream"):
+                await run(bot, mode, chats, args.edit_latency)
+    finally:
+        await bot.http_clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""Concurrent voice-note transcription: sync OpenAI client in the default executor vs AsyncOpenAI.
+
+The previous code ran the synchronous client through `run_in_executor(None, ...)`, so at most
+`min(32, cpu_count + 4)` notes were transcribed at once and the rest queued for a thread.
+A fake OpenAI endpoint answers each note after `--delay` seconds. Run from `src/`:
+
+    python benchmarks/bench_transcription.py --notes 50 --delay 0.5
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+
+import httpx
+from openai import OpenAI
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeOpenAI, free_port, serve_in_thread  # noqa: E402
+from http_clients import HttpClients, PoolConfig  # noqa: E402
+from transcription import create_transcriber  # noqa: E402
+
+
+def voice_note(size):
+    audio = io.BytesIO(os.urandom(size))
+    audio.name = "note.ogg"
+    return audio
+
+
+async def executor_flow(client, audio):
+    def _transcribe():
+        return client.audio.transcriptions.create(model="gpt-4o-mini-transcribe", file=audio).text
+    return await asyncio.get_running_loop().run_in_executor(None, _transcribe)
+
+
+async def run(name, transcribe, notes, size):
+    latencies = []
+
+    async def one():
+        started = time.perf_counter()
+        await transcribe(voice_note(size))
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(notes)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(
+        f"{name:>10}: {notes / elapsed:6.1f} notes/s  p50 {statistics.median(latencies):5.2f}s  "
+        f"p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:5.2f}s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.5)
+    parser.add_argument("--size", type=int, default=240_000, help="bytes per note (~1 minute of Opus)")
+    args = parser.parse_args()
+
+    port = free_port()
+    serve_in_thread(FakeOpenAI(delay=args.delay).app, port)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    sync_client = OpenAI(api_key="bench", base_url=base_url, http_client=httpx.Client(http2=False))
+    await run("executor", lambda audio: executor_flow(sync_client, audio), args.notes, args.size)
+
+    http_clients = HttpClients(openai=PoolConfig(http2=False))
+    await http_clients.start()
+    transcriber = create_transcriber(["openai"], openai_api_key="bench", openai_http=http_clients.openai)
+    await transcriber.start()
+    try:
+        await run("async", transcriber.transcribe, args.notes, args.size)
+    finally:
+        await transcriber.aclose()
+        await http_clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""Memory and latency of the voice download path, old temp-file flow vs in-memory streaming.
+
+Serves 1- and 10-minute voice notes (Opus at `--kbps`) from a fake Bot API in a separate
+process. "tempfile" replays the previous flow: `response.content`, write to the temp dir,
+reopen for the upload. "streaming" is bot.download_voice_file. The transcription upload is
+simulated by reading the file object. Run from `src/`:
+
+    python benchmarks/bench_voice.py --minutes 1,10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fakes import FakeBotAPI, free_port, serve_in_subprocess  # noqa: E402
+
+
+async def tempfile_flow(bot, voice):
+    client = bot.http_clients.telegram
+    resp = await client.get(f"{bot.TELEGRAM_API_URL}/bot{bot.BOT_TOKEN}/getFile", params={"file_id": voice.file_id})
+    file_path = resp.json()["result"]["file_path"]
+    response = await client.get(f"{bot.TELEGRAM_API_URL}/file/bot{bot.BOT_TOKEN}/{file_path}")
+    ogg_file = os.path.join(tempfile.gettempdir(), f"{voice.file_unique_id}.ogg")
+    with open(ogg_file, "wb") as f:
+        f.write(response.content)
+    with open(ogg_file, "rb") as audio_file:
+        size = len(audio_file.read())
+    os.remove(ogg_file)
+    return size
+
+
+async def streaming_flow(bot, voice):
+    with await bot.download_voice_file(voice, bot.BOT_TOKEN) as audio:
+        return len(audio.read())
+
+
+async def measure(bot, flow, voice, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await flow(bot, voice)
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    await flow(bot, voice)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(latencies), peak
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", default="1,10")
+    parser.add_argument("--kbps", type=int, default=32)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    minutes = [int(m) for m in args.minutes.split(",")]
+    files = {f"voice{m}m": os.urandom(m * 60 * args.kbps * 1000 // 8) for m in minutes}
+    port = free_port()
+    serve_in_subprocess(FakeBotAPI, port, files)
+    os.environ.update({
+        "BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{port}",
+        "AGENT_API_URL": "http://127.0.0.1:9/completion",
+        "AGENT_API_TOKEN": "bench",
+        "UPDATE_JOURNAL_PATH": "",
+        "HTTP2_ENABLED": "false",
+    })
+    import bot
+    bot.logging.getLogger().setLevel("WARNING")
+
+    await bot.http_clients.start()
+    try:
+        for m in minutes:
+            file_id = f"voice{m}m"
+            voice = SimpleNamespace(file_id=file_id, file_unique_id=file_id, file_size=len(files[file_id]))
+            for name, flow in (("tempfile", tempfile_flow), ("streaming", streaming_flow)):
+                latency, peak = await measure(bot, flow, voice, args.runs)
+                print(
+                    f"{m:>3} min ({len(files[file_id]) / 1024:7.0f} KiB) {name:>9}: "
+                    f"p50 {latency * 1000:7.2f} ms  peak Python memory {peak / 1024:8.0f} KiB  "
+                    f"disk writes {len(files[file_id]) // 1024 if name == 'tempfile' else 0:6d} KiB"
+                )
+    finally:
+        await bot.http_clients.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
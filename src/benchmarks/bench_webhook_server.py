@@ -0,0 +1,139 @@
+"""Compare webhook ack throughput and latency of the ASGI and Flask servers in bot.py.
+
+Starts a fake Bot API, runs `bot.py` in each WEBHOOK_SERVER mode as a subprocess and
+POSTs `/start` updates from many chats. Besides ack rate and latency it reports how fast
+the replies actually went out, since a server can ack quickly while its backlog grows.
+Run from `src/`:
+
+    python benchmarks/bench_webhook_server.py --updates 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fakes import FakeBotAPI, free_port, serve_in_thread, text_update  # noqa: E402
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# update_ids must never repeat across runs, or the intake journal drops them as redeliveries
+UPDATE_IDS = itertools.count(1)
+
+
+def start_bot(mode, telegram_url, port, journal_path, extra_env=None):
+    env = {
+        **os.environ,
+        "ENV": "prod",
+        "BOT_TOKEN": "123:bench",
+        "TELEGRAM_API_URL": telegram_url,
+        "WEBHOOK_URL": f"http://127.0.0.1:{port}",
+        "WEBHOOK_SERVER": mode,
+        "PORT": str(port),
+        "AGENT_API_URL": "http://127.0.0.1:9/agent",
+        "AGENT_API_TOKEN": "bench",
+        "UPDATE_JOURNAL_PATH": journal_path,
+        # The fake Bot API has no flood limits; measure the server, not Telegram's 30 msg/s
+        "OUTBOUND_GLOBAL_RATE": "100000",
+        # The fakes speak plain HTTP/1.1; PTB's HTTP/2 mode would require h2c prior knowledge
+        "HTTP2_ENABLED": "false",
+        **(extra_env or {}),
+    }
+    return subprocess.Popen(
+        [sys.executable, "bot.py"], cwd=SRC_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"bot at {base_url} did not become ready")
+
+
+async def drive(base_url, updates, concurrency):
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(updates):
+        queue.put_nowait(text_update(next(UPDATE_IDS), 1000 + i % 500, "/start"))
+
+    async def worker(client):
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            resp = await client.post(f"{base_url}/webhook", json=update)
+            resp.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies)
+
+
+async def wait_replies(fake, expected, timeout=120):
+    deadline = time.monotonic() + timeout
+    while fake.calls.get("sendMessage", 0) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def report(mode, elapsed, latencies, replies, drained):
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{mode:>5}: {len(latencies) / elapsed:8.1f} acks/s  "
+        f"p50 ack {statistics.median(latencies) * 1000:7.2f} ms  p99 ack {p99 * 1000:7.2f} ms  "
+        f"{replies / drained:8.1f} replies/s ({replies}/{len(latencies)} sent)"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--modes", default="flask,asgi")
+    args = parser.parse_args()
+
+    fake = FakeBotAPI()
+    fake_port = free_port()
+    serve_in_thread(fake.app, fake_port)
+    telegram_url = f"http://127.0.0.1:{fake_port}"
+
+    journal_dir = tempfile.mkdtemp(prefix="bench-journal-")
+    for mode in args.modes.split(","):
+        port = free_port()
+        bot = start_bot(mode, telegram_url, port, os.path.join(journal_dir, f"{mode}.sqlite3"))
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            await wait_ready(base_url)
+            warmup = min(args.updates, 100)
+            sent = fake.calls.get("sendMessage", 0) + warmup
+            await drive(base_url, warmup, args.concurrency)
+            await wait_replies(fake, sent)
+
+            started = time.perf_counter()
+            elapsed, latencies = await drive(base_url, args.updates, args.concurrency)
+            await wait_replies(fake, sent + args.updates)
+            replies = fake.calls.get("sendMessage", 0) - sent
+            report(mode, elapsed, latencies, replies, time.perf_counter() - started)
+        finally:
+            bot.terminate()
+            bot.wait(timeout=15)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""End-to-end update throughput of `python bot.py` with 1 to N worker processes.
+
+Starts the bot in router mode (`BOT_ROLE=router`, `WORKERS=n`) against a fake Bot API and
+a fake completion agent, each in its own process, posts updates from many chats to the
+router's `/webhook` and waits until every answer was edited in. Scaling is bounded by the
+CPU cores available: compare the numbers with the core count printed first. Run from `src/`:
+
+    python benchmarks/bench_workers.py --workers 1,2,4 --updates 3000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fakes import FakeAgent, FakeBotAPI, free_port, serve_in_subprocess, text_update  # noqa: E402
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.py")
+
+
+def bench_agent():
+    return FakeAgent(tokens=50, token_delay=0, first_token_delay=0.05)
+
+
+async def edits(client, bot_api_url):
+    return (await client.get(f"{bot_api_url}/calls")).json().get("editMessageText", 0)
+
+
+async def run(workers, updates, chats, concurrency, bot_api_url, agent_url, first_update_id, state_store):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = {
+            **os.environ,
+            "BOT_TOKEN": "123:bench",
+            "BOT_ROLE": "router",
+            "WORKERS": str(workers),
+            "PORT": str(port),
+            "WEBHOOK_URL": f"http://127.0.0.1:{port}",
+            "TELEGRAM_API_URL": bot_api_url,
+            "AGENT_API_URL": agent_url,
+            "AGENT_API_TOKEN": "bench",
+            "AGENT_API_MODE": "completion",
+            "UPDATE_JOURNAL_PATH": os.path.join(state_dir, "journal.sqlite3"),
+            "STATE_STORE": state_store or f"sqlite:///{os.path.join(state_dir, 'state.sqlite3')}",
+            "TRANSCRIPTION_CACHE_PATH": "",
+            "OUTBOUND_GLOBAL_RATE": "100000",
+            "OUTBOUND_CHAT_RATE": "100000",
+            # Per worker: a low cap would make more workers look faster than they are
+            "AGENT_CONCURRENCY_INITIAL": "1000",
+            "AGENT_CONCURRENCY_MAX": "1000",
+            "HTTP2_ENABLED": "false",
+            "LOG_LEVEL": "WARNING",
+        }
+        bot = subprocess.Popen([sys.executable, BOT_SCRIPT], env=env, cwd=state_dir, stderr=subprocess.DEVNULL)
+        try:
+            async with httpx.AsyncClient(timeout=30) as client:
+                while True:
+                    try:
+                        if (await client.get(f"http://127.0.0.1:{port}/")).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.1)
+
+                baseline = await edits(client, bot_api_url)
+                slots = asyncio.Semaphore(concurrency)
+
+                async def post(i):
+                    update = text_update(first_update_id + i, 1000 + i % chats, f"question {i}")
+                    async with slots:
+                        response = await client.post(f"http://127.0.0.1:{port}/webhook", json=update)
+                        response.raise_for_status()
+
+                started = time.perf_counter()
+                await asyncio.gather(*(post(i) for i in range(updates)))
+                acked = time.perf_counter() - started
+                while await edits(client, bot_api_url) - baseline < updates:
+                    await asyncio.sleep(0.05)
+                elapsed = time.perf_counter() - started
+        finally:
+            bot.terminate()
+            bot.wait(60)
+    return updates / acked, updates / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--state-store", help="STATE_STORE for the workers (default: a SQLite file)")
+    args = parser.parse_args()
+
+    bot_api_port, agent_port = free_port(), free_port()
+    serve_in_subprocess(FakeBotAPI, bot_api_port)
+    serve_in_subprocess(bench_agent, agent_port)
+    bot_api_url = f"http://127.0.0.1:{bot_api_port}"
+    agent_url = f"http://127.0.0.1:{agent_port}/completion"
+
+    print(f"CPU cores: {os.cpu_count()}")
+    baseline = None
+    for n, workers in enumerate(int(w) for w in args.workers.split(",")):
+        intake, handled = await run(
+            workers, args.updates, args.chats, args.concurrency, bot_api_url, agent_url, n * args.updates + 1, args.state_store
+        )
+        baseline = baseline or handled
+        print(
+            f"{workers:2d} worker(s): intake {intake:7.1f} updates/s  end to end {handled:7.1f} updates/s  "
+            f"speedup x{handled / baseline:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,440 @@
+"""Local stand-ins for upstream services, used by the benchmarks in this folder."""
+import asyncio
+import html
+import itertools
+import multiprocessing
+import random
+import re
+import socket
+import threading
+import time
+from urllib.parse import parse_qsl
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(asgi_app, port):
+    """Run `asgi_app` with uvicorn on its own thread and event loop; returns the server."""
+    config = uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning", access_log=False,
+                            timeout_keep_alive=75)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def _serve_forever(factory, args, port):
+    uvicorn.run(factory(*args).app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def serve_in_subprocess(factory, port, *args):
+    """Run `factory(*args).app` in a separate process (keeps its CPU and memory out of the
+    measurement); returns the process, already accepting connections."""
+    process = multiprocessing.Process(target=_serve_forever, args=(factory, args, port), daemon=True)
+    process.start()
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.02)
+
+
+_HTML_TAG = re.compile(r"<(/?)([a-z-]+)(?:\s[^<>]*)?>|<|&(?![a-z]+;|#\d+;|#x[0-9a-f]+;)", re.IGNORECASE)
+_HTML_TAGS = {"b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "a", "code", "pre", "tg-spoiler",
+              "span", "blockquote", "tg-emoji"}
+_MARKDOWN_V2_RESERVED = set("_*[]()~`>#+-=|{}.!")
+
+
+def _entity_error(offset):
+    return f"Bad Request: can't parse entities: Can't find end of the entity starting at byte offset {offset}"
+
+
+def _check_html(text):
+    """Visible text of `text` if Telegram's HTML parser accepts it, else raise ValueError."""
+    open_tags = []
+    for match in _HTML_TAG.finditer(text):
+        closing, tag = match.group(1), (match.group(2) or "").lower()
+        if not tag or tag not in _HTML_TAGS:
+            raise ValueError(f"Bad Request: can't parse entities: Unsupported start tag at byte offset {match.start()}")
+        if not closing:
+            open_tags.append(tag)
+        elif not open_tags or open_tags.pop() != tag:
+            raise ValueError(f"Bad Request: can't parse entities: Unmatched end tag at byte offset {match.start()}")
+    if open_tags:
+        raise ValueError(_entity_error(len(text)))
+    return html.unescape(re.sub(r"<[^>]*>", "", text))
+
+
+def _check_markdown_v2(text):
+    """Reserved characters outside entities must be escaped; in code only ` and \\ are special."""
+    visible, entities, i = [], [], 0
+    while i < len(text):
+        char = text[i]
+        in_code = entities and entities[-1] in ("`", "```")
+        if char == "\\" and i + 1 < len(text):
+            visible.append(text[i + 1])
+            i += 2
+            continue
+        if text.startswith("```", i) and (not entities or entities[-1] == "```"):
+            if entities:
+                entities.pop()
+            else:
+                entities.append("```")
+            i += 3
+            continue
+        if in_code and char != "`":
+            visible.append(char)
+        elif char in "*_~`" and entities and entities[-1] == char:
+            entities.pop()
+        elif char in "*_~`[":
+            entities.append(char)
+        elif char == "]" and entities and entities[-1] == "[":
+            entities.pop()
+            if text.startswith("(", i + 1):
+                url = re.match(r"\(((?:\\.|[^\\)])*)\)", text[i + 1:])
+                if url is None:
+                    raise ValueError(_entity_error(i))
+                i += url.end()
+        elif char in _MARKDOWN_V2_RESERVED:
+            raise ValueError(f"Bad Request: can't parse entities: Character '{char}' is reserved and must be "
+                             f"escaped with the preceding '\\'")
+        else:
+            visible.append(char)
+        i += 1
+    if entities:
+        raise ValueError(_entity_error(len(text)))
+    return "".join(visible)
+
+
+def _check_markdown(text):
+    """Legacy Markdown: entities cannot nest, and an unclosed *, _, ` or [ is an error."""
+    visible, entity, i = [], None, 0
+    while i < len(text):
+        char = text[i]
+        if entity is None and char == "\\" and i + 1 < len(text) and text[i + 1] in "_*`[":
+            visible.append(text[i + 1])
+            i += 2
+            continue
+        marker = "```" if text.startswith("```", i) else char
+        if entity is None and marker in ("```", "*", "_", "`", "["):
+            entity, start = marker, i
+        elif marker == entity or (entity == "[" and char == "]"):
+            entity = None
+        else:
+            visible.append(char)
+        i += len(marker) if marker == "```" else 1
+    if entity is not None:
+        raise ValueError(_entity_error(len(text[:start].encode())))
+    return "".join(visible)
+
+
+_PARSERS = {"HTML": _check_html, "MarkdownV2": _check_markdown_v2, "Markdown": _check_markdown}
+
+
+class FakeBotAPI:
+    """Minimal Telegram Bot API: answers the methods the bot calls with plausible results.
+
+    `files` maps file_id to content served by getFile and the file download endpoint.
+    Updates added with `push_updates` are served by getUpdates (long polling included).
+    Message texts are checked like Telegram does: markup that does not parse in its
+    `parse_mode` and visible text over 4096 characters are rejected with a 400.
+    Call counts per method are served on `/calls` (for instances in another process),
+    rejected calls are counted in `errors`. The last text of every message is kept in
+    `texts` by (chat_id, message_id), and the webhook settings from setWebhook are
+    returned by getWebhookInfo. Every call takes `latency` seconds.
+
+    Faults can be injected (and changed while serving): an `error_rate` fraction of
+    sendMessage and editMessageText calls is answered with `error_status` (a 429 asks to
+    retry after a second, like Telegram's flood control). With `record`, every message
+    text is appended to `history` as (time.monotonic(), method, chat_id, message_id, text).
+    """
+
+    def __init__(self, files=None, latency=0.0, error_rate=0.0, error_status=429, record=False):
+        self.calls: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.files: dict[str, bytes] = dict(files or {})
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.record = record
+        self.history: list[tuple] = []
+        self._message_ids = itertools.count(1)
+        self.updates: list[dict] = []
+        self.texts: dict[tuple, str] = {}
+        self.webhook: dict = {}
+        self.app = Starlette(routes=[
+            Route("/bot{token}/{method}", self.handle, methods=["GET", "POST"]),
+            Route("/file/bot{token}/{file_path:path}", self.download),
+            Route("/calls", self.calls_route),
+        ])
+
+    async def _params(self, request: Request):
+        params = dict(request.query_params)
+        content_type = request.headers.get("content-type", "")
+        if "json" in content_type:
+            params.update(await request.json())
+        elif request.method == "POST":
+            params.update(parse_qsl((await request.body()).decode()))
+        return params
+
+    def _message(self, params):
+        return {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    async def handle(self, request: Request):
+        method = request.path_params["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = await self._params(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            if self.error_rate and random.random() < self.error_rate:
+                self.errors[method] = self.errors.get(method, 0) + 1
+                return self._fault()
+            error = self._check_text(params)
+            if error:
+                self.errors[method] = self.errors.get(method, 0) + 1
+                return JSONResponse({"ok": False, "error_code": 400, "description": error}, status_code=400)
+            result = self._message(params)
+            self.texts[(result["chat"]["id"], result["message_id"])] = result["text"]
+            if self.record:
+                self.history.append(
+                    (time.monotonic(), method, result["chat"]["id"], result["message_id"], result["text"])
+                )
+        elif method == "getFile" and params.get("file_id") in self.files:
+            file_id = params["file_id"]
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.files[file_id]),
+                "file_path": f"voice/{file_id}.oga",
+            }
+        elif method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "setWebhook":
+            self.webhook = {
+                "url": params["url"],
+                "max_connections": int(params.get("max_connections") or 40),
+                "allowed_updates": list(params.get("allowed_updates") or []),
+            }
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook = {}
+            result = True
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0, **self.webhook}
+        else:
+            return JSONResponse({"ok": False, "error_code": 404, "description": "Not Found"}, status_code=404)
+        return JSONResponse({"ok": True, "result": result})
+
+    def _fault(self):
+        if self.error_status == 429:
+            return JSONResponse({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                 "parameters": {"retry_after": 1}}, status_code=429)
+        return JSONResponse({"ok": False, "error_code": self.error_status, "description": "Internal Server Error"},
+                            status_code=self.error_status)
+
+    @staticmethod
+    def _check_text(params):
+        """The error Telegram would answer for this message text, or None."""
+        text = params.get("text", "")
+        parser = _PARSERS.get(params.get("parse_mode") or "")
+        try:
+            visible = parser(text) if parser else text
+        except ValueError as e:
+            return str(e)
+        if not visible.strip():
+            return "Bad Request: message text is empty"
+        if len(visible.encode("utf-16-le")) // 2 > 4096:
+            return "Bad Request: message is too long"
+        return None
+
+    def push_updates(self, updates):
+        """Queue updates for getUpdates (callable from another thread)."""
+        self.updates.extend(updates)
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        if offset:
+            # Like Telegram, an offset confirms (and forgets) every update before it
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        while not self.updates and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return self.updates[:int(params.get("limit") or 100)]
+
+    async def calls_route(self, request: Request):
+        return JSONResponse(self.calls)
+
+    async def download(self, request: Request):
+        self.calls["download"] = self.calls.get("download", 0) + 1
+        file_id = request.path_params["file_path"].rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        content = self.files.get(file_id)
+        if content is None:
+            return JSONResponse({"ok": False, "error_code": 404}, status_code=404)
+
+        async def chunks():
+            for i in range(0, len(content), 64 * 1024):
+                yield content[i:i + 64 * 1024]
+
+        return StreamingResponse(chunks(), media_type="audio/ogg", headers={"Content-Length": str(len(content))})
+
+
+def text_update(update_id, chat_id, text):
+    """A private-chat text message update as Telegram would POST it."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+            **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text)}]}
+               if text.startswith("/") else {}),
+        },
+    }
+
+
+def voice_update(update_id, chat_id, file_id, duration, file_size):
+    """A private-chat voice message update."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "voice": {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "duration": duration,
+                "mime_type": "audio/ogg",
+                "file_size": file_size,
+            },
+        },
+    }
+
+
+class FakeMessage:
+    """Stands in for a telegram.Message and its bot: keeps the last text and when each edit happened."""
+
+    chat_id = 1
+    message_id = 1
+    business_connection_id = None
+
+    def __init__(self, edit_latency=0.0):
+        self.edit_latency = edit_latency
+        self.edit_times = []
+        self.text = ""
+
+    def get_bot(self):
+        return self
+
+    async def edit_message_text(self, text, **kwargs):
+        if self.edit_latency:
+            await asyncio.sleep(self.edit_latency)
+        self.edit_times.append(time.perf_counter())
+        self.text = text
+
+
+class FakeAgent:
+    """Agent API stand-in with a JSON `/completion` and an SSE `/stream-completion` endpoint.
+
+    Answers are `tokens` words long; the first arrives after `first_token_delay` seconds
+    and the rest every `token_delay` seconds (the completion endpoint waits for all of them).
+    Faults can be injected (and changed while serving): an `error_rate` fraction of requests
+    is answered with `error_status`, and a `slow_rate` fraction is delayed by `slow_delay`.
+    """
+
+    def __init__(self, tokens=200, token_delay=0.02, first_token_delay=0.3,
+                 error_rate=0.0, error_status=503, slow_rate=0.0, slow_delay=5.0):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.requests = 0
+        self.errors = 0
+        self.app = Starlette(routes=[
+            Route("/completion", self.completion, methods=["POST"]),
+            Route("/stream-completion", self.stream_completion, methods=["POST"]),
+        ])
+
+    def words(self):
+        return [f"word{i} " for i in range(self.tokens)]
+
+    async def _fault(self):
+        """An injected error response, or None; may also add the injected delay."""
+        if self.slow_rate and random.random() < self.slow_rate:
+            await asyncio.sleep(self.slow_delay)
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return JSONResponse({"detail": "injected failure"}, status_code=self.error_status)
+        return None
+
+    async def completion(self, request: Request):
+        self.requests += 1
+        fault = await self._fault()
+        if fault is not None:
+            return fault
+        await asyncio.sleep(self.first_token_delay + self.token_delay * (self.tokens - 1))
+        return JSONResponse("".join(self.words()))
+
+    async def stream_completion(self, request: Request):
+        self.requests += 1
+        fault = await self._fault()
+        if fault is not None:
+            return fault
+
+        async def events():
+            await asyncio.sleep(self.first_token_delay)
+            for i, word in enumerate(self.words()):
+                if i:
+                    await asyncio.sleep(self.token_delay)
+                yield f"event: message\ndata: {word}\n\n"
+            yield "event: done\ndata: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+
+class FakeOpenAI:
+    """OpenAI `/v1/audio/transcriptions` stand-in that answers after `delay` seconds.
+
+    `fail_every` > 0 answers every n-th request with a 503, to exercise fallbacks.
+    """
+
+    def __init__(self, delay=0.5, fail_every=0):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.requests = 0
+        self.app = Starlette(routes=[Route("/v1/audio/transcriptions", self.transcriptions, methods=["POST"])])
+
+    async def transcriptions(self, request: Request):
+        self.requests += 1
+        body = await request.body()
+        await asyncio.sleep(self.delay)
+        if self.fail_every and self.requests % self.fail_every == 0:
+            return JSONResponse({"error": {"message": "overloaded", "type": "server_error"}}, status_code=503)
+        return JSONResponse({"text": f"transcribed {len(body)} bytes"})
@@ -4,8 +4,9 @@ import httpx
 import logging
 import threading
 import asyncio
-import tempfile
-from flask import Flask, request
+import io
+from contextvars import ContextVar
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
@@ -15,7 +16,24 @@ from telegram.ext import (
     ContextTypes
 )
 from telegram.constants import ParseMode
-from openai import OpenAI
+from http_clients import HttpClients
+from asgi_server import create_asgi_app, run_asgi_server
+from scheduler import ChatScheduler
+from update_journal import UpdateJournal
+from streaming import EditRateGovernor, StreamRelay, iter_sse_message_chunks
+from rendering import MESSAGE_LIMIT, Renderer, extract_reply
+from outbound import FINAL, PROGRESS, OutboundRateLimiter, edit_text, reply_text
+from transcription import create_transcriber
+from transcription_cache import TranscriptionCache, audio_key, file_key
+from logging_setup import bind_log_fields, configure_logging, truncate
+from metrics import Metrics
+from resilience import AdaptiveConcurrencyLimit, AgentUnavailable, CircuitBreaker, ResilientUpstream
+from response_cache import ResponseCache
+from session_store import SessionStore
+from state_store import create_state_store
+from authorization import Authorizer, update_sender
+from webhook_intake import MESSAGE_UPDATE_TYPES, SECRET_TOKEN_HEADER, WebhookIntake
+from webhook_cli import WebhookConfig, describe, ensure_webhook
 
 # --- Load .env if available ---
 try:
@@ -25,11 +43,19 @@ except ImportError:
     pass
 
 # --- Logging setup ---
-logging.basicConfig(
-    level=logging.INFO,  # DEBUG for SSE streaming details
-    format="%(asctime)s - %(levelname)s - %(message)s"
+configure_logging(
+    level=os.environ.get("LOG_LEVEL", "INFO"),  # DEBUG for SSE streaming details
+    # Per-stage overrides, e.g. "bot.intake=WARNING,bot.agent=DEBUG"; httpx logs every request at INFO
+    stage_levels=os.environ.get("LOG_LEVELS", "httpx=WARNING"),
+    sample_rate=float(os.environ.get("LOG_SAMPLE_RATE", 1.0)),  # fraction of per-update INFO lines kept
+    payload_chars=int(os.environ.get("LOG_PAYLOAD_CHARS", 200)),  # 0 logs message lengths only
+    use_queue=os.environ.get("LOG_QUEUE", "true").lower() not in ("0", "false", "no"),
+    log_format=os.environ.get("LOG_FORMAT", "json").lower(),  # "json" lines with update_id/chat_id fields, or "text"
 )
 logger = logging.getLogger(__name__)
+intake_logger = logging.getLogger("bot.intake")
+voice_logger = logging.getLogger("bot.voice")
+agent_logger = logging.getLogger("bot.agent")
 
 # --- Environment variables ---
 BOT_TOKEN = os.environ["BOT_TOKEN"]
@@ -38,18 +64,88 @@ if os.environ.get("ENV") == "dev":
     WEBHOOK_URL = WEBHOOK_URL_DEV
 else:
     WEBHOOK_URL = os.getenv("WEBHOOK_URL", WEBHOOK_URL_DEV)
+WEBHOOK_SERVER = os.environ.get("WEBHOOK_SERVER", "asgi").lower()  # "asgi" or "flask"
+WEBHOOK_ACK_TIMEOUT = float(os.environ.get("WEBHOOK_ACK_TIMEOUT", 5))
+WEBHOOK_SECRET_TOKEN = os.environ.get("WEBHOOK_SECRET_TOKEN") or None  # sent with setWebhook; POSTs without it are refused
+STARTUP_TIMEOUT = float(os.environ.get("STARTUP_TIMEOUT", 30))  # Flask server: max seconds to wait for the Application
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", 25))  # on SIGTERM, finish in-flight updates for up to this long
+BOT_ROLE = os.environ.get("BOT_ROLE", "all").lower()  # "all", "router" (forwards updates to workers) or "worker"
+WORKERS = int(os.environ.get("WORKERS", 1))  # above 1, `python bot.py` runs a router in front of local workers
+WORKER_URLS = [u.strip() for u in os.environ.get("WORKER_URLS", "").split(",") if u.strip()]  # remote workers of a router
+STATE_STORE = os.environ.get("STATE_STORE", "memory://")  # sqlite:///path shares dedup and rate limits between workers
+SCHEDULER_MAX_CONCURRENCY = int(os.environ.get("SCHEDULER_MAX_CONCURRENCY", 64))
+SCHEDULER_MAX_QUEUE_PER_CHAT = int(os.environ.get("SCHEDULER_MAX_QUEUE_PER_CHAT", 10))
+UPDATE_JOURNAL_PATH = os.environ.get("UPDATE_JOURNAL_PATH", "update_journal.sqlite3")  # empty to disable
+UPDATE_JOURNAL_RETENTION = float(os.environ.get("UPDATE_JOURNAL_RETENTION", 86400))
+BUSY_REPLY_TEXT = os.environ.get(
+    "BUSY_REPLY_TEXT",
+    "⏳ I'm still working on your previous messages. Please wait a moment and try again."
+)
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
 AGENT_API_URL = os.environ["AGENT_API_URL"]
 AGENT_API_TOKEN = os.environ["AGENT_API_TOKEN"]
+# "stream" relays the agent's SSE answer as it is generated; "completion" waits for the full answer
+AGENT_API_MODE = os.environ.get("AGENT_API_MODE", "stream").lower()
+AGENT_STREAM_URL = os.environ.get("AGENT_STREAM_URL") or (
+    AGENT_API_URL[:-len("/completion")] + "/stream-completion"
+    if AGENT_API_URL.endswith("/completion") else AGENT_API_URL
+)
+# Agent resilience: fail fast while the agent is down, retry only requests it never processed
+AGENT_CIRCUIT_FAILURES = int(os.environ.get("AGENT_CIRCUIT_FAILURES", 5))  # consecutive failures that open the circuit
+AGENT_CIRCUIT_RESET = float(os.environ.get("AGENT_CIRCUIT_RESET", 30))  # seconds before probing again
+AGENT_MAX_RETRIES = int(os.environ.get("AGENT_MAX_RETRIES", 2))
+AGENT_ATTEMPT_TIMEOUT = float(os.environ.get("AGENT_ATTEMPT_TIMEOUT", 120))  # completion mode, per attempt
+AGENT_FIRST_BYTE_TIMEOUT = float(os.environ.get("AGENT_FIRST_BYTE_TIMEOUT", 30))  # stream mode, until response headers
+AGENT_HEDGING = os.environ.get("AGENT_HEDGING", "false").lower() in ("1", "true", "yes")  # duplicates slow prompts
+AGENT_HEDGE_MIN_DELAY = float(os.environ.get("AGENT_HEDGE_MIN_DELAY", 1.0))
+AGENT_CONCURRENCY_INITIAL = int(os.environ.get("AGENT_CONCURRENCY_INITIAL", 20))
+AGENT_CONCURRENCY_MAX = int(os.environ.get("AGENT_CONCURRENCY_MAX", 100))
+AGENT_UNAVAILABLE_TEXT = os.environ.get(
+    "AGENT_UNAVAILABLE_TEXT",
+    "🛠 The assistant is temporarily unavailable. Please try again in a minute."
+)
+OUTBOUND_GLOBAL_RATE = float(os.environ.get("OUTBOUND_GLOBAL_RATE", 30))  # Bot API calls/s across all chats
+OUTBOUND_CHAT_RATE = float(os.environ.get("OUTBOUND_CHAT_RATE", 1))  # calls/s per chat
+OUTBOUND_GROUP_PER_MINUTE = int(os.environ.get("OUTBOUND_GROUP_PER_MINUTE", 20))  # messages/min per group
+VOICE_MAX_BYTES = int(os.environ.get("VOICE_MAX_BYTES", 20 * 1024 * 1024))  # Bot API download limit is 20 MB
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", 1.0))  # min seconds between edits per chat
+STREAM_EDITS_PER_SECOND = float(os.environ.get("STREAM_EDITS_PER_SECOND", 25))  # edit budget across all chats
+RENDER_PARSE_MODE = os.environ.get("RENDER_PARSE_MODE", "html").lower()  # agent Markdown sent as "html", "markdownv2" or "none"
+RENDER_MESSAGE_LIMIT = int(os.environ.get("RENDER_MESSAGE_LIMIT", MESSAGE_LIMIT))  # longer answers continue in new messages
+# Export each /metrics stage as an OpenTelemetry span too (needs opentelemetry-api and a configured SDK)
+OTEL_TRACING_ENABLED = os.environ.get("OTEL_TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai_client: OpenAI | None = None
-if OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-else:
-    logger.warning("OPENAI_API_KEY not set - voice transcription will not work")
+# Tried in order until one succeeds: "openai" (remote) and/or "local" (faster-whisper, offline)
+TRANSCRIPTION_BACKENDS = [b.strip().lower() for b in os.environ.get("TRANSCRIPTION_BACKENDS", "openai").split(",") if b.strip()]
+TRANSCRIPTION_OPENAI_MODEL = os.environ.get("TRANSCRIPTION_OPENAI_MODEL", "gpt-4o-mini-transcribe")
+TRANSCRIPTION_LOCAL_MODEL = os.environ.get("TRANSCRIPTION_LOCAL_MODEL", "base")
+TRANSCRIPTION_LOCAL_WORKERS = int(os.environ.get("TRANSCRIPTION_LOCAL_WORKERS", 1))
+TRANSCRIPTION_LANGUAGE = os.environ.get("TRANSCRIPTION_LANGUAGE") or None  # None = auto-detect
+TRANSCRIPTION_CACHE_PATH = os.environ.get("TRANSCRIPTION_CACHE_PATH", "transcription_cache.sqlite3")  # empty = memory only
+TRANSCRIPTION_CACHE_TTL = float(os.environ.get("TRANSCRIPTION_CACHE_TTL", 30 * 86400))
+TRANSCRIPTION_CACHE_MEMORY_ENTRIES = int(os.environ.get("TRANSCRIPTION_CACHE_MEMORY_ENTRIES", 1024))
+TRANSCRIPTION_CACHE_MAX_ENTRIES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_ENTRIES", 100_000))
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")  # reuse answers to repeated prompts, per thread
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+RESPONSE_CACHE_CONTEXT_WINDOW = float(os.environ.get("RESPONSE_CACHE_CONTEXT_WINDOW", 600))  # seconds a thread stays in conversation
+# Share answers between users; only for an agent without per-thread memory (answers could leak across users)
+RESPONSE_CACHE_SHARED = os.environ.get("RESPONSE_CACHE_SHARED", "false").lower() in ("1", "true", "yes")
+SESSION_MAX_CHATS = int(os.environ.get("SESSION_MAX_CHATS", 1_000_000))  # chats whose state is kept in memory
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", 86400))  # seconds without activity before a chat's state is dropped
+SESSION_SUMMARY_CHARS = int(os.environ.get("SESSION_SUMMARY_CHARS", 0))  # rolling conversation tail sent with each prompt; 0 disables
+SESSION_CANCEL_SUPERSEDED = os.environ.get("SESSION_CANCEL_SUPERSEDED", "false").lower() in ("1", "true", "yes")  # a new message cancels the unfinished answer
+SUPERSEDED_TEXT = os.environ.get("SUPERSEDED_TEXT", "⏭ Skipped — answering your newer message.")
 
 # --- Authorization ---
 AUTHORIZED_USER_IDS_STR = os.environ.get("AUTHORIZED_USER_IDS_STR", "")
 AUTHORIZED_USERNAMES_STR = os.environ.get("AUTHORIZED_USERNAMES_STR", "")  # Comma-separated Telegram usernames (without @)
+AUTHORIZED_USERS_FILE = os.environ.get("AUTHORIZED_USERS_FILE")  # one user ID or username per line, reloaded on change
+AUTHORIZED_USERS_DB = os.environ.get("AUTHORIZED_USERS_DB")  # SQLite file with an authorized_users(user_id, username) table
+AUTHORIZATION_RELOAD_INTERVAL = float(os.environ.get("AUTHORIZATION_RELOAD_INTERVAL", 30))  # seconds between change checks
+AUTHORIZATION_LOG_INTERVAL = float(os.environ.get("AUTHORIZATION_LOG_INTERVAL", 60))  # min seconds between warnings per user
+AUTHORIZATION_REPLY_INTERVAL = float(os.environ.get("AUTHORIZATION_REPLY_INTERVAL", 3600))  # min seconds between denial replies per user
+UNAUTHORIZED_TEXT = os.environ.get("UNAUTHORIZED_TEXT", "❌ You are not authorized to use this bot.")
 
 AUTHORIZED_USER_IDS = set()
 AUTHORIZED_USERNAMES = set()
@@ -61,7 +157,7 @@ if AUTHORIZED_USER_IDS_STR:
     except ValueError as e:
         logger.error(f"Invalid AUTHORIZED_USER_IDS format: {e}")
         AUTHORIZED_USER_IDS = set()
-else:
+elif not AUTHORIZED_USERS_FILE and not AUTHORIZED_USERS_DB:
     logger.warning("AUTHORIZED_USER_IDS not set - bot will accept all user IDs")
 
 if AUTHORIZED_USERNAMES_STR:
@@ -71,12 +167,23 @@ if AUTHORIZED_USERNAMES_STR:
     except Exception as e:
         logger.error(f"Invalid AUTHORIZED_USERNAMES format: {e}")
         AUTHORIZED_USERNAMES = set()
-else:
+elif not AUTHORIZED_USERS_FILE and not AUTHORIZED_USERS_DB:
     logger.warning("AUTHORIZED_USERNAMES not set - bot will accept all usernames")
 
+# The environment lists plus the file or SQLite allow-list, swapped atomically on reload
+authorizer = Authorizer(
+    AUTHORIZED_USER_IDS,
+    AUTHORIZED_USERNAMES,
+    file_path=AUTHORIZED_USERS_FILE,
+    db_path=AUTHORIZED_USERS_DB,
+    reload_interval=AUTHORIZATION_RELOAD_INTERVAL,
+    log_interval=AUTHORIZATION_LOG_INTERVAL,
+    reply_interval=AUTHORIZATION_REPLY_INTERVAL,
+)
+
 def is_authorized_user(update: Update) -> bool:
     """Check if the user is authorized to use the bot (by user ID or username)."""
-    if not AUTHORIZED_USER_IDS and not AUTHORIZED_USERNAMES:
+    if authorizer.allow_list.open:
         # If no authorized users/usernames are set, allow all users
         return True
     
@@ -93,20 +200,59 @@ def is_authorized_user(update: Update) -> bool:
         logger.warning("Could not extract user ID or username from update")
         return False
 
-    is_authorized = (
-        (user_id in AUTHORIZED_USER_IDS) if user_id is not None else False
-    ) or (
-        (username in AUTHORIZED_USERNAMES) if username is not None else False
-    )
+    return authorizer.is_authorized(user_id, username)
+
+async def reply_unauthorized(update: Update):
+    """Log and answer a denied user, both rate-limited per user; other attempts are dropped silently."""
+    user = update.effective_user
+    if authorizer.deny(user.id if user else None, user.username if user else None) and update.effective_message:
+        await reply_text(update.effective_message, UNAUTHORIZED_TEXT, rate_limit_args=PROGRESS)
+
+# --- Shared HTTP clients (agent API, Telegram files), opened with the Application ---
+http_clients = HttpClients.from_env()
+
+# --- Transcription backends ---
+transcriber = create_transcriber(
+    TRANSCRIPTION_BACKENDS,
+    openai_api_key=OPENAI_API_KEY,
+    openai_http=http_clients.openai,
+    openai_model=TRANSCRIPTION_OPENAI_MODEL,
+    local_model=TRANSCRIPTION_LOCAL_MODEL,
+    local_workers=TRANSCRIPTION_LOCAL_WORKERS,
+    language=TRANSCRIPTION_LANGUAGE,
+)
+if not transcriber.available():
+    logger.warning("No transcription backend available (set OPENAI_API_KEY or install faster-whisper) - voice transcription will not work")
+transcription_cache = TranscriptionCache(
+    TRANSCRIPTION_CACHE_PATH or None,
+    ttl=TRANSCRIPTION_CACHE_TTL,
+    memory_entries=TRANSCRIPTION_CACHE_MEMORY_ENTRIES,
+    max_entries=TRANSCRIPTION_CACHE_MAX_ENTRIES,
+)
 
-    if not is_authorized:
-        logger.warning(
-            f"Unauthorized access attempt from user ID: {user_id} or username: {username}"
-        )
-    return is_authorized
+# --- State shared between worker processes (update dedup, bot-wide rate limit) ---
+state_store = create_state_store(STATE_STORE)
+
+# --- Outbound Bot API scheduler (rate limits, flood control, edit merging, priorities) ---
+outbound_limiter = OutboundRateLimiter(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    chat_rate=OUTBOUND_CHAT_RATE,
+    group_per_minute=OUTBOUND_GROUP_PER_MINUTE,
+    shared_store=state_store if state_store.shared else None,
+)
 
 # --- Telegram application ---
-app = ApplicationBuilder().token(BOT_TOKEN).build()
+app = (
+    ApplicationBuilder()
+    .token(BOT_TOKEN)
+    .rate_limiter(outbound_limiter)
+    .base_url(f"{TELEGRAM_API_URL}/bot")
+    .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    .connection_pool_size(http_clients.telegram.config.max_connections)
+    .pool_timeout(http_clients.telegram.config.pool_timeout)
+    .http_version("2" if http_clients.telegram.config.use_http2 else "1.1")
+    .build()
+)
 
 # Global variable to store the event loop for webhook processing
 application_event_loop = None
@@ -114,9 +260,7 @@ application_event_loop = None
 # --- Command handlers ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_authorized_user(update):
-        await update.message.reply_text(
-            "❌ You are not authorized to use this bot."
-        )
+        await reply_unauthorized(update)
         return
     
     await update.message.reply_text(
@@ -124,195 +268,342 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     logger.info(f"User {update.message.chat_id} started the bot")
 
+# Built once: the text only depends on the configuration
+HELP_TEXT = (
+    "🤖 *How this bot works:*\n\n"
+    "This bot connects to an AI agent API to process your messages. "
+    f"The bot communicates with the agent at:\n`{AGENT_API_URL}`\n\n"
+    "Just send me a message or voice note, and I'll forward it to the AI agent for processing.\n\n"
+    "📚 *About ABI:*\n"
+    "ABI is built with the open source project:\n"
+    "https://github.com/jupyter-naas/abi\n\n"
+    "📧 *Support:*\n"
+    "For any inquiries, please send an email to: support@naas.ai"
+)
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_authorized_user(update):
-        await update.message.reply_text(
-            "❌ You are not authorized to use this bot."
-        )
+        await reply_unauthorized(update)
         return
     
-    help_text = (
-        "🤖 *How this bot works:*\n\n"
-        "This bot connects to an AI agent API to process your messages. "
-        f"The bot communicates with the agent at:\n`{AGENT_API_URL}`\n\n"
-        "Just send me a message or voice note, and I'll forward it to the AI agent for processing.\n\n"
-        "📚 *About ABI:*\n"
-        "ABI is built with the open source project:\n"
-        "https://github.com/jupyter-naas/abi\n\n"
-        "📧 *Support:*\n"
-        "For any inquiries, please send an email to: support@naas.ai"
-    )
-    
     await update.message.reply_text(
-        help_text,
+        HELP_TEXT,
         parse_mode=ParseMode.MARKDOWN
     )
     logger.info(f"User {update.message.chat_id} requested help")
 
 # --- Voice message handling functions ---
-async def download_voice_file(voice, bot_token, save_dir=None):
-    """Download voice file from Telegram and return the file path."""
+class VoiceTooLarge(ValueError):
+    """The voice note exceeds VOICE_MAX_BYTES."""
+
+async def download_voice_file(voice, bot_token, max_bytes=None):
+    """Stream a voice file from Telegram into memory and return it as a named file object.
+
+    Nothing touches the disk; the download is aborted as soon as it exceeds `max_bytes`.
+    """
     if not voice or not hasattr(voice, 'file_id'):
         logger.error("No voice message found")
         return None
     
+    max_bytes = max_bytes or VOICE_MAX_BYTES
     file_id = voice.file_id
+    if (getattr(voice, 'file_size', None) or 0) > max_bytes:
+        raise VoiceTooLarge(f"voice note is {voice.file_size} bytes (limit {max_bytes})")
     
-    # Step 1: Get file_path for the voice file using async httpx
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(
-            f"https://api.telegram.org/bot{bot_token}/getFile",
-            params={"file_id": file_id}
-        )
-        resp.raise_for_status()
-        file_info = resp.json()
-        if not file_info.get("ok") or "file_path" not in file_info.get("result", {}):
-            logger.error("Failed to get file_path from Telegram API")
-            return None
-        
-        file_path = file_info["result"]["file_path"]
-        download_url = f"https://api.telegram.org/file/bot{bot_token}/{file_path}"
-        
-        # Step 2: Download the file
-        response = await client.get(download_url)
-        response.raise_for_status()
-        
-        # Step 3: Save the file temporarily
-        if save_dir is None:
-            save_dir = tempfile.gettempdir()
-        os.makedirs(save_dir, exist_ok=True)
-        unique_id = getattr(voice, 'file_unique_id', file_id)
-        ogg_file = os.path.join(save_dir, f"{unique_id}.ogg")
-        
-        with open(ogg_file, "wb") as f:
-            f.write(response.content)
-        
-        logger.info(f"Voice file downloaded to: {ogg_file}")
-        return ogg_file
-
-async def transcribe_audio_with_openai(audio_file_path):
-    """Transcribe audio file using OpenAI. Supports OGG and other formats."""
-    if not openai_client:
-        raise RuntimeError("OPENAI_API_KEY not set - cannot transcribe audio")
+    # Step 1: Get file_path for the voice file over the shared Telegram pool
+    client = http_clients.telegram
+    resp = await client.get(
+        f"{TELEGRAM_API_URL}/bot{bot_token}/getFile",
+        params={"file_id": file_id}
+    )
+    resp.raise_for_status()
+    file_info = resp.json()
+    if not file_info.get("ok") or "file_path" not in file_info.get("result", {}):
+        logger.error("Failed to get file_path from Telegram API")
+        return None
     
-    # Run the synchronous OpenAI call in an executor to avoid blocking the event loop
-    def _transcribe():
-        with open(audio_file_path, "rb") as audio_file:
-            transcription = openai_client.audio.transcriptions.create(
-                model="gpt-4o-mini-transcribe",
-                file=audio_file
-            )
-        return transcription.text
+    file_path = file_info["result"]["file_path"]
+    download_url = f"{TELEGRAM_API_URL}/file/bot{bot_token}/{file_path}"
+    
+    # Step 2: Stream the file into an in-memory buffer, chunk by chunk
+    audio = io.BytesIO()
+    async with client.stream("GET", download_url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            if audio.tell() + len(chunk) > max_bytes:
+                raise VoiceTooLarge(f"voice note exceeds {max_bytes} bytes")
+            audio.write(chunk)
     
-    loop = asyncio.get_event_loop()
-    transcribed_text = await loop.run_in_executor(None, _transcribe)
-    logger.info(f"Transcription: {transcribed_text}")
+    # The transcription upload reads the buffer from the start and uses its name for the format
+    audio.seek(0)
+    unique_id = getattr(voice, 'file_unique_id', file_id)
+    audio.name = f"{unique_id}.ogg"
+    voice_logger.info("Voice file downloaded to memory: %s (%d bytes)", audio.name, audio.getbuffer().nbytes)
+    return audio
+
+async def transcribe_audio(audio_file):
+    """Transcribe an audio file object with the configured backends. Supports OGG and other formats."""
+    transcribed_text = await transcriber.transcribe(audio_file)
+    voice_logger.info("Transcription: %s", truncate(transcribed_text))
     return transcribed_text
 
-# --- Shared function to send message to ABI API ---
-async def send_to_abi_api(user_message, thread_id, reply_msg):
-    """Send user message to ABI API and update the reply message."""
+# --- Shared functions to send message to ABI API ---
+# One edit budget shared by every streaming answer, sized to Telegram's rate limits (split between workers)
+edit_governor = EditRateGovernor(per_chat_interval=STREAM_EDIT_INTERVAL, global_rate=STREAM_EDITS_PER_SECOND / WORKERS)
+# Agent answers are converted from Markdown into markup Telegram always accepts, split at the message limit
+renderer = Renderer(
+    {"html": ParseMode.HTML, "markdownv2": ParseMode.MARKDOWN_V2, "none": None}[RENDER_PARSE_MODE],
+    limit=RENDER_MESSAGE_LIMIT,
+)
+
+async def edit_escaped(message, text, rate_limit_args=FINAL):
+    """Edit in text that may contain anything (error details, transcriptions) as literal text."""
+    await edit_text(message, renderer.escape(text), parse_mode=renderer.parse_mode, rate_limit_args=rate_limit_args)
+
+# Every agent request goes through one circuit breaker and one adaptive concurrency limit
+agent_upstream = ResilientUpstream(
+    CircuitBreaker(failure_threshold=AGENT_CIRCUIT_FAILURES, reset_timeout=AGENT_CIRCUIT_RESET),
+    AdaptiveConcurrencyLimit(initial=AGENT_CONCURRENCY_INITIAL, max_limit=AGENT_CONCURRENCY_MAX),
+    max_retries=AGENT_MAX_RETRIES,
+    attempt_timeout=AGENT_ATTEMPT_TIMEOUT,
+    first_byte_timeout=AGENT_FIRST_BYTE_TIMEOUT,
+    hedge=AGENT_HEDGING,
+    hedge_min_delay=AGENT_HEDGE_MIN_DELAY,
+)
+
+async def reply_agent_unavailable(reply_msg, thread_id, e):
+    await edit_text(reply_msg, AGENT_UNAVAILABLE_TEXT, parse_mode=ParseMode.MARKDOWN, rate_limit_args=FINAL)
+    logger.warning(f"Agent unavailable for {thread_id}: {e}")
+
+# Opt-in: answers to repeated prompts, per agent, outside ongoing conversations
+response_cache = ResponseCache(
+    ttl=RESPONSE_CACHE_TTL,
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    context_window=RESPONSE_CACHE_CONTEXT_WINDOW,
+) if RESPONSE_CACHE_ENABLED else None
+
+# Per-chat state: the agent thread key (shared by text and voice), the request in flight
+sessions = SessionStore(
+    max_sessions=SESSION_MAX_CHATS,
+    idle_ttl=SESSION_IDLE_TTL,
+    summary_chars=SESSION_SUMMARY_CHARS,
+)
+
+async def send_to_abi_api(user_message, session, reply_msg):
+    """Send user message to ABI API and update the reply message; returns the answer."""
+    thread_id = session.thread_id
+    session.reply = reply_msg
+    # With a summary the answer depends on the conversation, so it is neither looked up nor stored
+    cacheable = response_cache is not None and not session.summary and response_cache.cacheable(thread_id)
+    cache_scope = None if RESPONSE_CACHE_SHARED else thread_id
+    if cacheable:
+        cached = response_cache.get(AGENT_API_URL, user_message, cache_scope)
+        if cached is not None:
+            await StreamRelay(reply_msg, edit_governor, renderer=renderer).deliver(cached)
+            response_cache.record_exchange(thread_id)
+            agent_logger.info("Cached answer sent to %s: %s", thread_id, truncate(cached))
+            sessions.remember(session, user_message, cached)
+            return cached
+
+    started = time.perf_counter()
+    prompt = sessions.prompt(session, user_message)
+    if AGENT_API_MODE == "stream":
+        answer = await stream_from_abi_api(prompt, thread_id, reply_msg)
+    else:
+        answer = await complete_with_abi_api(prompt, thread_id, reply_msg)
+    if response_cache is not None:
+        response_cache.record_exchange(thread_id)
+        if cacheable and answer:
+            response_cache.put(AGENT_API_URL, user_message, answer, time.perf_counter() - started, cache_scope)
+    if answer:
+        sessions.remember(session, user_message, answer)
+    return answer
+
+async def stream_from_abi_api(user_message, thread_id, reply_msg):
+    """Relay the ABI API's SSE answer into the reply message while it is generated; returns the answer."""
     payload = {"prompt": user_message, "thread_id": thread_id}
     headers = {
         "Authorization": f"Bearer {AGENT_API_TOKEN}",
-        # "Accept": "text/event-stream",  # Streaming - commented for completion endpoint
+        "Accept": "text/event-stream",
     }
+    relay = StreamRelay(reply_msg, edit_governor, renderer=renderer)
+
+    def open_stream(resume_headers):
+        return agent_upstream.stream(lambda: http_clients.agent.stream(
+            "POST", AGENT_STREAM_URL, headers={**headers, **resume_headers}, json=payload
+        ))
 
     try:
-        async with httpx.AsyncClient(timeout=300) as client:
-            # For completion (non-streaming), use the regular completion endpoint
-            resp = await client.post(AGENT_API_URL, headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            logger.info(f"Completion response: {data}")
-            # Expecting that the response json contains the reply text under 'text'
-            # Adjust key as needed depending on endpoint output format
-            reply_text = str(data)
-            
-            if reply_text and reply_text.strip():
-                await reply_msg.edit_text(reply_text.strip(), parse_mode=ParseMode.MARKDOWN)
-                logger.info(f"Final message sent to {thread_id}: {reply_text.strip()}")
-            else:
-                await reply_msg.edit_text("✅ Got it — but no reply was returned.", parse_mode=ParseMode.MARKDOWN)
-                logger.info(f"No reply returned for {thread_id}")
+        with metrics.stage("agent_call"):
+            async for chunk in iter_sse_message_chunks(open_stream):
+                relay.append(chunk)
+
+        # Final message after streaming finishes
+        with metrics.stage("final_edit"):
+            reply_text = await relay.finish()
+        if relay.first_edit_at:
+            metrics.observe("first_edit", relay.first_edit_at - relay.started_at)
+        if reply_text:
+            agent_logger.info("Final message sent to %s: %s (%s)", thread_id, truncate(reply_text), relay.stats())
+            return reply_text
+        else:
+            await edit_text(reply_msg, "✅ Got it — but no reply was returned.", parse_mode=ParseMode.MARKDOWN, rate_limit_args=FINAL)
+            agent_logger.info("No reply returned for %s", thread_id)
+
+    except asyncio.CancelledError:
+        # Superseded or shut down: the edit pump stops with the request
+        await relay.close()
+        raise
+    except AgentUnavailable as e:
+        await relay.close()
+        await reply_agent_unavailable(reply_msg, thread_id, e)
+    except httpx.HTTPStatusError as e:
+        await relay.close()
+        error_text = f"HTTP error {e.response.status_code}: {e.response.text}"
+        await edit_escaped(reply_msg, f"❌ {error_text}")
+        logger.error(error_text)
+    except Exception as e:
+        await relay.close()
+        await edit_escaped(reply_msg, f"⚠️ Internal error: {e}")
+        logger.error(f"Internal error for {thread_id}: {e}")
 
+async def complete_with_abi_api(user_message, thread_id, reply_msg):
+    """Send user message to the ABI completion endpoint and edit in the full answer; returns the answer."""
+    payload = {"prompt": user_message, "thread_id": thread_id}
+    headers = {
+        "Authorization": f"Bearer {AGENT_API_TOKEN}",
+    }
+    started = time.perf_counter()
+    try:
+        # For completion (non-streaming), use the regular completion endpoint
+        # over the shared keep-alive pool, through the circuit breaker, retries and concurrency limit
+        with metrics.stage("agent_call"):
+            resp = await agent_upstream.request(
+                lambda: http_clients.agent.post(AGENT_API_URL, headers=headers, json=payload)
+            )
+            data = resp.json()
+        agent_logger.debug("Completion response: %s", truncate(data))
+        # A plain string, or the text under a key such as "text", "content" or "answer"
+        reply_text = extract_reply(data).strip()
+
+        if reply_text:
+            relay = StreamRelay(reply_msg, edit_governor, renderer=renderer)
+            with metrics.stage("final_edit"):
+                await relay.deliver(reply_text)
+            # The whole answer is the first visible text
+            metrics.observe("first_edit", time.perf_counter() - started)
+            agent_logger.info("Final message sent to %s: %s (%s)", thread_id, truncate(reply_text), relay.stats())
+            return reply_text
+        elif isinstance(data, (dict, list)) and data:
+            await edit_text(reply_msg, "⚠️ The agent's answer had no text to show.", rate_limit_args=FINAL)
+            agent_logger.warning("No answer text in the completion response for %s: %s", thread_id, truncate(data))
+        else:
+            await edit_text(reply_msg, "✅ Got it — but no reply was returned.", parse_mode=ParseMode.MARKDOWN, rate_limit_args=FINAL)
+            agent_logger.info("No reply returned for %s", thread_id)
+
+    except AgentUnavailable as e:
+        await reply_agent_unavailable(reply_msg, thread_id, e)
     except httpx.HTTPStatusError as e:
         error_text = f"HTTP error {e.response.status_code}: {e.response.text}"
-        await reply_msg.edit_text(f"❌ {error_text}", parse_mode=ParseMode.MARKDOWN)
+        await edit_escaped(reply_msg, f"❌ {error_text}")
         logger.error(error_text)
     except Exception as e:
-        await reply_msg.edit_text(f"⚠️ Internal error: {e}", parse_mode=ParseMode.MARKDOWN)
+        await edit_escaped(reply_msg, f"⚠️ Internal error: {e}")
         logger.error(f"Internal error for {thread_id}: {e}")
 
-# --- Non-streaming message handler ---
+# --- Text message handler ---
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not is_authorized_user(update):
-        await update.message.reply_text(
-            "❌ You are not authorized to use this bot."
-        )
+    with metrics.stage("authorization"):
+        authorized = is_authorized_user(update)
+    if not authorized:
+        await reply_unauthorized(update)
         return
     
     user_message = update.message.text
-    import hashlib
-    chat_id_str = str(update.message.chat_id)
-    thread_id = hashlib.sha256(chat_id_str.encode()).hexdigest()
-    logger.info(f"Received message from {thread_id}: {user_message}")
+    session = sessions.get(update.message.chat_id)
+    intake_logger.info("Received message from %s: %s", session.thread_id, truncate(user_message))
 
-    reply_msg = await update.message.reply_text("⏳ Thinking...", parse_mode=ParseMode.MARKDOWN)
-    await send_to_abi_api(user_message, thread_id, reply_msg)
+    with metrics.stage("placeholder_reply"):
+        reply_msg = await reply_text(update.message, "⏳ Thinking...", parse_mode=ParseMode.MARKDOWN, rate_limit_args=PROGRESS)
+    await send_to_abi_api(user_message, session, reply_msg)
+    observe_time_to_reply()
 
 # --- Voice message handler ---
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle voice messages by downloading, transcribing, and processing them."""
-    if not is_authorized_user(update):
-        await update.message.reply_text(
-            "❌ You are not authorized to use this bot."
-        )
+    with metrics.stage("authorization"):
+        authorized = is_authorized_user(update)
+    if not authorized:
+        await reply_unauthorized(update)
         return
     
     voice = update.message.voice
-    thread_id = str(update.message.chat_id)
-    logger.info(f"Received voice message from {thread_id}")
+    session = sessions.get(update.message.chat_id)
+    thread_id = session.thread_id
+    intake_logger.info("Received voice message from %s", thread_id)
     
-    if not openai_client:
+    # Forwards and retries of the same note reuse its transcription: no download and no
+    # transcription backend needed. Not a miss yet: the audio content may still be cached
+    voice_key = file_key(voice.file_unique_id)
+    transcribed_text = await transcription_cache.get(voice_key, count_miss=False)
+    if transcribed_text is None and not transcriber.available():
+        transcription_cache.record_miss()
         await update.message.reply_text(
-            "❌ Voice transcription is not available. Please set OPENAI_API_KEY environment variable.",
+            "❌ Voice transcription is not available. Please set OPENAI_API_KEY or install faster-whisper.",
             parse_mode=ParseMode.MARKDOWN
         )
         return
     
-    reply_msg = await update.message.reply_text("🎤 Transcribing voice...", parse_mode=ParseMode.MARKDOWN)
+    with metrics.stage("placeholder_reply"):
+        reply_msg = await reply_text(update.message, "🎤 Transcribing voice...", parse_mode=ParseMode.MARKDOWN, rate_limit_args=PROGRESS)
     
     try:
-        # Download the voice file
-        ogg_file = await download_voice_file(voice, BOT_TOKEN)
-        if not ogg_file:
-            await reply_msg.edit_text("❌ Failed to download voice file", parse_mode=ParseMode.MARKDOWN)
-            return
-        
-        # Transcribe the audio
-        await reply_msg.edit_text("📝 Processing transcription...", parse_mode=ParseMode.MARKDOWN)
-        transcribed_text = await transcribe_audio_with_openai(ogg_file)
-        
-        # Clean up the temporary file
-        try:
-            os.remove(ogg_file)
-        except Exception as e:
-            logger.warning(f"Failed to delete temporary file {ogg_file}: {e}")
+        if transcribed_text is None:
+            # Download the voice note into memory
+            audio = None
+            try:
+                with metrics.stage("download"):
+                    audio = await download_voice_file(voice, BOT_TOKEN)
+            except VoiceTooLarge as e:
+                await edit_escaped(reply_msg, f"❌ Voice message is too long to transcribe ({e})")
+                return
+            finally:
+                if not audio:
+                    # No audio lookup follows, so the file-key miss is counted here
+                    transcription_cache.record_miss()
+            if not audio:
+                await edit_text(reply_msg, "❌ Failed to download voice file", parse_mode=ParseMode.MARKDOWN, rate_limit_args=FINAL)
+                return
+            
+            # Transcribe the audio unless the same content was seen under another file; the buffer is released with this handler
+            with audio:
+                content_key = audio_key(audio)
+                transcribed_text = await transcription_cache.get(content_key)
+                if transcribed_text is None:
+                    await edit_text(reply_msg, "📝 Processing transcription...", parse_mode=ParseMode.MARKDOWN, rate_limit_args=PROGRESS)
+                    with metrics.stage("transcription"):
+                        transcribed_text = await transcribe_audio(audio)
+                    await transcription_cache.put((voice_key, content_key), transcribed_text)
+                else:
+                    await transcription_cache.put((voice_key,), transcribed_text)
+        else:
+            voice_logger.info("Transcription cache hit for %s", voice.file_unique_id)
         
         if not transcribed_text or not transcribed_text.strip():
-            await reply_msg.edit_text("❌ Could not transcribe the voice message", parse_mode=ParseMode.MARKDOWN)
+            await edit_text(reply_msg, "❌ Could not transcribe the voice message", parse_mode=ParseMode.MARKDOWN, rate_limit_args=FINAL)
             return
         
-        logger.info(f"Transcribed text from {thread_id}: {transcribed_text}")
+        voice_logger.debug("Transcribed text from %s: %s", thread_id, truncate(transcribed_text))
         
         # Send the transcribed text to ABI API
-        await reply_msg.edit_text(f"⏳ Responding to: {transcribed_text}...", parse_mode=ParseMode.MARKDOWN)
-        await send_to_abi_api(transcribed_text, thread_id, reply_msg)
+        await edit_escaped(reply_msg, f"⏳ Responding to: {transcribed_text}...", rate_limit_args=PROGRESS)
+        await send_to_abi_api(transcribed_text, session, reply_msg)
+        observe_time_to_reply()
         
     except Exception as e:
+        metrics.error("voice", e)
         error_msg = f"⚠️ Error processing voice message: {e}"
-        await reply_msg.edit_text(error_msg, parse_mode=ParseMode.MARKDOWN)
+        await edit_escaped(reply_msg, error_msg)
         logger.error(f"Error processing voice message for {thread_id}: {e}")
 
 # --- Add handlers ---
@@ -321,111 +612,412 @@ app.add_handler(CommandHandler("help", help_command))
 app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 app.add_handler(MessageHandler(filters.VOICE, handle_voice))
 
-# --- Flask app for webhook ---
-flask_app = Flask(__name__)
+# Messages that ask the agent something; only these supersede an unfinished answer
+PROMPT_FILTER = (filters.TEXT & ~filters.COMMAND) | filters.VOICE
+
+# Update kinds and message contents the handlers above can match; anything else is acknowledged and dropped at intake
+HANDLED_UPDATE_TYPES = MESSAGE_UPDATE_TYPES
+HANDLED_MESSAGE_FIELDS = ("text", "voice")
+webhook_intake = WebhookIntake(WEBHOOK_SECRET_TOKEN, HANDLED_UPDATE_TYPES, HANDLED_MESSAGE_FIELDS)
 
-@flask_app.route("/webhook", methods=["POST"])
-def webhook():
-    update_json = request.get_json(force=True)
-    logger.info(f"Webhook message received: {update_json}")
+# --- Update intake (shared by the ASGI and Flask webhook servers) ---
+# Updates from one chat run in order; different chats run in parallel under a global cap
+scheduler = ChatScheduler(
+    max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+    max_queue_per_chat=SCHEDULER_MAX_QUEUE_PER_CHAT,
+)
+
+# When the update being handled in the current task was received (perf_counter)
+update_received_at: ContextVar[float | None] = ContextVar("update_received_at", default=None)
+
+def observe_time_to_reply():
+    """Record the time from webhook intake to the final answer of the current update."""
+    received_at = update_received_at.get()
+    if received_at is not None:
+        metrics.observe("time_to_reply", time.perf_counter() - received_at)
+
+# Updates are journaled by update_id before Telegram is acknowledged, so redeliveries are
+# skipped and updates interrupted by a restart are replayed on startup
+journal = UpdateJournal(UPDATE_JOURNAL_PATH, retention=UPDATE_JOURNAL_RETENTION) if UPDATE_JOURNAL_PATH else None
+
+async def reply_busy(update: Update):
+    """Tell the user their chat's queue is full instead of silently dropping the update."""
+    if update.effective_message:
+        await update.effective_message.reply_text(BUSY_REPLY_TEXT)
+
+def schedule_update(update_json, received_at=None):
+    """Queue a (journaled) update for processing behind earlier updates from the same chat."""
     update = Update.de_json(update_json, app.bot)
-    logger.info(f"Update attributes:")
-    for attr in dir(update):
-        # Skip private and built-in methods
-        if attr.startswith("__") and attr.endswith("__"):
-            continue
-        value = getattr(update, attr)
-        logger.info(f"  {attr}: {value}")
-    
-    # Process update directly using the application's event loop
-    global application_event_loop
-    if application_event_loop and application_event_loop.is_running():
-        try:
-            asyncio.run_coroutine_threadsafe(
-                app.process_update(update),
-                application_event_loop
-            )
-        except Exception as e:
-            logger.error(f"Error processing update: {e}")
-            # Fallback: put in queue if processing fails
+    received_at = received_at or time.perf_counter()
+    queued_at = time.perf_counter()
+    # Commands such as /help neither cancel an answer nor are cancelled
+    prompt = bool(update.effective_chat and PROMPT_FILTER.check_update(update))
+
+    async def process():
+        metrics.observe("queue_wait", time.perf_counter() - queued_at)
+        bind_log_fields(update_id=update.update_id, chat_id=update.effective_chat.id if update.effective_chat else None)
+        # Handlers inherit this context, so they can measure time to reply from intake
+        update_received_at.set(received_at)
+        session = sessions.get(update.effective_chat.id) if prompt else None
+        if session is not None and sessions.is_superseded(session, update.update_id):
+            intake_logger.info("Update %s superseded by a newer message before it started", update.update_id)
+        else:
+            # Handled in its own task so that a newer message from the chat can cancel just this update
+            handling = asyncio.ensure_future(app.process_update(update))
+            if session is not None:
+                sessions.begin(session, handling)
             try:
-                app.update_queue.put_nowait(update)
-            except Exception as e2:
-                logger.error(f"Failed to queue update: {e2}")
-    else:
-        # Fallback: put in queue if event loop not ready
+                await handling
+            except asyncio.CancelledError:
+                if session is None or session.in_flight is handling:
+                    # Interrupted by shutdown: left unfinished in the journal and replayed on next start
+                    raise
+                intake_logger.info("Update %s superseded by a newer message", update.update_id)
+                if session.reply is not None:
+                    app.create_task(edit_text(session.reply, SUPERSEDED_TEXT, rate_limit_args=FINAL))
+            except Exception as e:
+                metrics.error("handler", e)
+                logger.error(f"Failed to process update {update.update_id}: {e}")
+            finally:
+                if session is not None:
+                    sessions.end(session, handling)
+        if journal:
+            journal.mark_done(update.update_id)
+
+    # Updates without a chat (e.g. inline queries) get their own key and only share the global cap
+    chat_key = update.effective_chat.id if update.effective_chat else ("update", update.update_id)
+    if not scheduler.submit(chat_key, process):
+        if journal:
+            journal.mark_done(update.update_id)
+        app.create_task(reply_busy(update), update=update)
+    elif SESSION_CANCEL_SUPERSEDED and prompt:
+        sessions.supersede(chat_key, update.update_id)
+    return update
+
+def reject_unauthorized(update_json) -> bool:
+    """Drop updates from senders outside the allow-list before they are journaled or parsed.
+
+    Updates without a sender are left to the handlers' own check.
+    """
+    if authorizer.allow_list.open:
+        return False
+    user_id, username, chat_id = update_sender(update_json)
+    if user_id is None or authorizer.is_authorized(user_id, username):
+        return False
+    if authorizer.deny(user_id, username) and chat_id is not None:
+        app.create_task(app.bot.send_message(chat_id, UNAUTHORIZED_TEXT, rate_limit_args=PROGRESS))
+    return True
+
+async def admit_update(update_json) -> bool:
+    """Filter, authorize, journal and claim an incoming update; True if it is to be scheduled."""
+    if not webhook_intake.wanted(update_json):
+        return False
+    update_id = update_json.get("update_id")
+    bind_log_fields(update_id=update_id, chat_id=update_sender(update_json)[2])
+    intake_logger.info("Update %s received: %s", update_id, truncate(update_json))
+    with metrics.stage("webhook_ack"):
+        if reject_unauthorized(update_json):
+            return False
+        if journal and update_id is not None and not await journal.record(update_id, update_json):
+            intake_logger.info("Skipping duplicate update %s", update_id)
+            return False
+        # Claimed only once journaled: a failed write leaves the redelivery unclaimed
+        if update_id is not None and not await state_store.claim(f"update:{update_id}", UPDATE_JOURNAL_RETENTION):
+            intake_logger.info("Skipping duplicate update %s", update_id)
+            if journal:
+                journal.mark_done(update_id)
+            return False
+    return True
+
+async def dispatch_update(update_json):
+    """Journal an incoming update and schedule it; handlers run after Telegram is acknowledged."""
+    received_at = time.perf_counter()
+    if await admit_update(update_json):
+        schedule_update(update_json, received_at)
+
+async def dispatch_updates(updates):
+    """`dispatch_update` for a batch (a getUpdates result).
+
+    The updates are journaled together, sharing one group commit, and then scheduled in
+    their original order, so each chat's updates still run in order.
+    """
+    received_at = time.perf_counter()
+    admitted = await asyncio.gather(*(admit_update(update_json) for update_json in updates), return_exceptions=True)
+    for update_json, result in zip(updates, admitted):
+        if isinstance(result, Exception):
+            logger.error(f"Error processing update {update_json.get('update_id')}: {result}")
+        elif result:
+            schedule_update(update_json, received_at)
+
+async def replay_unfinished_updates():
+    """Re-schedule updates that were journaled but not processed before the last shutdown."""
+    updates = await journal.unfinished()
+    if updates:
+        logger.info(f"Replaying {len(updates)} unfinished update(s) from the journal")
+    for update_json in updates:
+        schedule_update(update_json)
+
+def service_stats():
+    stats = {
+        "http_clients": http_clients.stats(),
+        "scheduler": scheduler.stats(),
+        "outbound": outbound_limiter.stats(),
+        "agent": agent_upstream.stats(),
+        "transcription": transcriber.stats(),
+        "transcription_cache": transcription_cache.stats(),
+        "state_store": state_store.stats(),
+        "authorization": authorizer.stats(),
+        "intake": webhook_intake.stats(),
+        "sessions": sessions.stats(),
+    }
+    if response_cache:
+        stats["response_cache"] = response_cache.stats()
+    if journal:
+        stats["journal"] = journal.stats()
+    return stats
+
+# --- Metrics ---
+# Per-stage latency histograms and error counters, plus the /stats numbers as gauges
+metrics = Metrics(stats=service_stats, tracing=OTEL_TRACING_ENABLED)
+
+# --- Flask app for webhook ---
+def create_flask_app():
+    """The legacy Flask server; Flask is only imported when it is used."""
+    from flask import Flask, request
+
+    flask_app = Flask(__name__)
+
+    @flask_app.route("/webhook", methods=["POST"])
+    def webhook():
+        if not webhook_intake.authentic(request.headers.get(SECRET_TOKEN_HEADER)):
+            return "forbidden", 403
         try:
-            app.update_queue.put_nowait(update)
-            logger.info("Update queued (event loop not ready)")
-        except Exception as e:
-            logger.error(f"Failed to queue update: {e}")
-    
-    return "ok", 200
+            update_json = webhook_intake.decode(request.get_data())
+        except ValueError:
+            return "bad request", 400
 
-@flask_app.route("/")
-def home():
-    return "Bot is alive 🚀", 200
+        # Process update directly using the application's event loop
+        if application_event_loop and application_event_loop.is_running():
+            try:
+                # Wait (bounded) for intake so the update is journaled before Telegram gets its ack
+                asyncio.run_coroutine_threadsafe(
+                    dispatch_update(update_json),
+                    application_event_loop
+                ).result(timeout=WEBHOOK_ACK_TIMEOUT)
+            except FutureTimeoutError:
+                # Not journaled yet: Telegram delivers the update again
+                logger.warning(f"Update intake exceeded {WEBHOOK_ACK_TIMEOUT}s - asking Telegram to retry")
+                return "intake timeout", 503
+            except Exception as e:
+                logger.error(f"Error processing update: {e}")
+                return "intake failed", 503
+        else:
+            # Fallback: put in queue if event loop not ready
+            try:
+                app.update_queue.put_nowait(Update.de_json(update_json, app.bot))
+                logger.info("Update queued (event loop not ready)")
+            except Exception as e:
+                logger.error(f"Failed to queue update: {e}")
+
+        return "ok", 200
+
+    @flask_app.route("/")
+    def home():
+        return "Bot is alive 🚀", 200
+
+    @flask_app.route("/stats")
+    def stats():
+        return service_stats(), 200
+
+    @flask_app.route("/metrics")
+    def metrics_route():
+        return metrics.render(), 200, {"Content-Type": metrics.content_type}
+
+    return flask_app
+
+# --- Webhook registration ---
+# Set by __main__ when this process registers the webhook (not in workers behind a router)
+webhook_config: WebhookConfig | None = None
+
+async def register_webhook(client):
+    """Point Telegram at this service; skipped when getWebhookInfo shows it already is."""
+    info, changed = await ensure_webhook(client, BOT_TOKEN, webhook_config, TELEGRAM_API_URL)
+    if changed:
+        logger.info(
+            f"Webhook set: max_connections={webhook_config.max_connections} "
+            f"allowed_updates={list(webhook_config.allowed_updates) or 'default'} "
+            f"drop_pending_updates={webhook_config.drop_pending_updates}"
+        )
+    else:
+        logger.info("Webhook already set with these settings - setWebhook skipped")
+    logger.info(f"Webhook info:\n{describe(info)}")
 
 # --- Start Telegram Application in background thread ---
 async def start_application():
-    await app.initialize()
+    started = time.perf_counter()
+    await http_clients.start()
+    # Independent of each other, so startup takes as long as the slowest one
+    # (getMe and the webhook check are Bot API round trips, the stores open SQLite files)
+    startup = [
+        transcriber.start(),
+        transcription_cache.open(),
+        state_store.open(),
+        authorizer.start(),
+        sessions.start(),
+        app.initialize(),
+    ]
+    if journal:
+        startup.append(journal.open())
+    if webhook_config:
+        startup.append(register_webhook(http_clients.telegram))
+    await asyncio.gather(*startup)
     await app.start()
-    logger.info("Telegram Application started (handlers active)")
-
-def run_async_loop():
+    if journal:
+        await replay_unfinished_updates()
+    logger.info(f"Telegram Application started in {time.perf_counter() - started:.2f}s (handlers active)")
+
+async def stop_application(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT):
+    """Finish in-flight updates (for up to `drain_timeout` seconds), then close everything."""
+    pending = scheduler.queued + scheduler.running
+    if pending and drain_timeout > 0:
+        logger.info(f"Draining {pending} update(s) for up to {drain_timeout}s")
+        if not await scheduler.drain(drain_timeout):
+            # Cancelled below; they stay unfinished in the journal and are replayed on next start
+            logger.warning(f"Drain timed out with {scheduler.queued + scheduler.running} update(s) left")
+    await scheduler.close()
+    if journal:
+        await journal.close()
+    await app.stop()
+    await app.shutdown()
+    await transcriber.aclose()
+    await transcription_cache.close()
+    await state_store.close()
+    await authorizer.aclose()
+    await sessions.aclose()
+    await http_clients.aclose()
+    logger.info("Telegram Application stopped")
+
+def run_async_loop(started: Future):
+    """Run the Application on this thread's loop; `started` resolves once it serves updates."""
     global application_event_loop
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     application_event_loop = loop
-    loop.run_until_complete(start_application())
+    try:
+        loop.run_until_complete(start_application())
+    except Exception as e:
+        started.set_exception(e)
+        return
+    started.set_result(True)
     # Keep the loop running to process updates
     loop.run_forever()
 
-# --- Run Flask server ---
+# --- ASGI app for webhook (PTB and HTTP endpoint on one event loop) ---
+asgi_app = create_asgi_app(
+    on_update=dispatch_update,
+    on_startup=start_application,
+    on_shutdown=stop_application,
+    stats=service_stats,
+    metrics=metrics,
+    webhook_intake=webhook_intake,
+    ack_timeout=WEBHOOK_ACK_TIMEOUT,
+    health_text="Bot is alive 🚀",
+)
+
+# --- Run webhook server ---
 if __name__ == "__main__":
+    import signal
     import sys
-    import requests
 
     port = int(os.environ.get("PORT", 10000))
-    logger.info(f"Starting Flask webhook server on port {port}")
+    # With several workers, this process only routes updates to them
+    role = "router" if BOT_ROLE == "all" and WORKERS > 1 else BOT_ROLE
+    logger.info(f"Starting {'router' if role == 'router' else WEBHOOK_SERVER} webhook server on port {port}")
+
+    # --- Webhook registration (workers are behind the router) ---
+    if role != "worker":
+        # Delivery settings (max_connections, allowed_updates, ...) come from WEBHOOK_* variables;
+        # registered during startup, concurrently with the rest of it
+        webhook_config = WebhookConfig.from_env(WEBHOOK_URL)
+        logger.info(f"Webhook URL: {WEBHOOK_URL}")
+
+    if role == "router":
+        async def register_router_webhook():
+            async with httpx.AsyncClient(timeout=10) as client:
+                await register_webhook(client)
 
-    # --- Set webhook with Telegram API before starting server ---
-    try:
-        telegram_token = BOT_TOKEN
-        webhook_url = f"{WEBHOOK_URL}/webhook"
-        resp = requests.post(
-            f"https://api.telegram.org/bot{telegram_token}/setWebhook",
-            data={"url": webhook_url},
-            timeout=10
+        try:
+            asyncio.run(register_router_webhook())
+        except Exception as e:
+            logger.error(f"Failed to set Telegram webhook: {e}")
+            sys.exit(1)
+
+        from http_clients import PoolConfig, PooledClient
+        from worker_router import create_router_app, spawn_workers, stop_workers
+
+        def local_worker_env(i):
+            env = {"BOT_ROLE": "worker", "PORT": str(port + 1 + i), "WORKER_ID": str(i), "WORKERS": str(WORKERS)}
+            if "STATE_STORE" not in os.environ:
+                env["STATE_STORE"] = "sqlite:///bot_state.sqlite3"
+            if UPDATE_JOURNAL_PATH:
+                # Each worker replays only its own unfinished updates
+                root, ext = os.path.splitext(UPDATE_JOURNAL_PATH)
+                env["UPDATE_JOURNAL_PATH"] = f"{root}.worker{i}{ext}"
+            return env
+
+        processes = []
+        worker_urls = WORKER_URLS
+        if not worker_urls:
+            # Local workers listen on the next ports
+            processes = spawn_workers(os.path.abspath(__file__), WORKERS, local_worker_env)
+            worker_urls = [f"http://127.0.0.1:{port + 1 + i}" for i in range(WORKERS)]
+        router_app = create_router_app(
+            worker_urls,
+            PooledClient("workers", PoolConfig.from_env("WORKER", http2=False)),
+            webhook_intake=webhook_intake,
+            ack_timeout=WEBHOOK_ACK_TIMEOUT,
+            health_text="Bot is alive 🚀",
         )
-        logger.info(f"Set webhook response: {resp.status_code} {resp.text}")
-        resp.raise_for_status()
-    except Exception as e:
-        logger.error(f"Failed to set Telegram webhook: {e}")
-        sys.exit(1)
-
-    # --- Get webhook info with Telegram API ---
+        try:
+            run_asgi_server(router_app, port=port)
+        finally:
+            stop_workers(processes)
+        sys.exit(0)
+
+    if WEBHOOK_SERVER == "asgi":
+        # The Application is started by the ASGI lifespan before the first request is served;
+        # on SIGTERM uvicorn stops accepting and the lifespan shutdown drains in-flight updates
+        run_asgi_server(asgi_app, port=port)
+        sys.exit(0)
+
+    # Legacy Flask server: Telegram app in background
+    flask_app = create_flask_app()
+    started = Future()
+    threading.Thread(target=run_async_loop, args=(started,), daemon=True).start()
+
+    # Serve as soon as the Application is ready
     try:
-        resp = requests.get(
-            f"https://api.telegram.org/bot{telegram_token}/getWebhookInfo",
-            timeout=10
-        )
-        logger.info(f"Get webhook info response: {resp.status_code} {resp.text}")
-        resp.raise_for_status()
+        started.result(timeout=STARTUP_TIMEOUT)
     except Exception as e:
-        logger.error(f"Failed to get Telegram webhook info: {e}")
+        logger.error(f"Failed to start Telegram Application: {e!r}")
         sys.exit(1)
 
-    logger.info(f"Webhook URL: {WEBHOOK_URL}")
-
-    # Start Telegram app in background
-    threading.Thread(target=run_async_loop, daemon=True).start()
-    
-    # Give the app time to initialize
-    time.sleep(2)
+    def on_sigterm(signum, frame):
+        # Leaves flask_app.run() so that the Application is drained and stopped below
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, on_sigterm)
 
     try:
         flask_app.run(host="0.0.0.0", port=port)
     except Exception as e:
         logger.error(f"Failed to start Flask server: {e}")
         sys.exit(1)
+    finally:
+        # Close the Application and its HTTP pools on the loop that owns them
+        if application_event_loop and application_event_loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(stop_application(), application_event_loop).result(
+                    timeout=SHUTDOWN_DRAIN_TIMEOUT + 10
+                )
+            except Exception as e:
+                logger.error(f"Failed to stop Telegram Application cleanly: {e}")
@@ -1,129 +1,172 @@
-import os
-import time
+"""Long-polling mode: a fallback for when Telegram cannot reach a webhook (no public URL, local runs).
+
+Runs the Application, handlers and intake of bot.py. Updates fetched with getUpdates go
+through `bot.dispatch_updates`, the intake of webhook POSTs for a whole batch, so they are filtered, checked against the
+allow-list, journaled and scheduled per chat. A slow answer in one chat does not hold up the
+others, and SCHEDULER_MAX_CONCURRENCY caps how many updates are handled at once.
+
+    python bot_polling.py
+"""
 import asyncio
-import httpx
 import logging
-from telegram import Update
-from telegram.ext import (
-    ApplicationBuilder,
-    CommandHandler,
-    MessageHandler,
-    filters,
-    ContextTypes
-)
-from telegram.constants import ParseMode
-
-# --- Load .env if available ---
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
-
-# --- Logging setup ---
-logging.basicConfig(
-    level=logging.INFO,  # change to logging.DEBUG to see every SSE line
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-logger = logging.getLogger(__name__)
-
-# --- Environment variables ---
-BOT_TOKEN = os.environ["BOT_TOKEN"]
-WEBHOOK_URL = "https://unsuppressed-observable-arlette.ngrok-free.dev"  # placeholder
-ABI_API_URL = "https://abi-api.default.space.naas.ai/agents/Support/stream-completion"
-ABI_API_TOKEN = os.environ["ABI_API_TOKEN"]
-
-# --- Telegram command handlers ---
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "👋 Hi! I’m your Support Assistant. Tell me any issue or feedback!"
-    )
-    logger.info(f"User {update.message.chat_id} started the bot")
+import os
+import signal
+import sys
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "Just send me a message — I'll forward it to Support."
-    )
-    logger.info(f"User {update.message.chat_id} requested help")
+import httpx
 
-# --- Streaming handler with logging ---
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_message = update.message.text
-    thread_id = str(update.message.chat_id)
+import bot
+from webhook_cli import delete_webhook, parse_allowed_updates
+from webhook_intake import MESSAGE_UPDATE_TYPES
 
-    logger.info(f"Received message from {thread_id}: {user_message}")
+logger = logging.getLogger(__name__)
 
-    payload = {"prompt": user_message, "thread_id": thread_id}
-    headers = {
-        "Authorization": f"Bearer {ABI_API_TOKEN}",
-        "Accept": "text/event-stream",
-    }
+# --- Environment variables ---
+POLLING_TIMEOUT = int(os.environ.get("POLLING_TIMEOUT", 30))  # long-poll seconds per getUpdates; 0 is short polling
+POLLING_LIMIT = int(os.environ.get("POLLING_LIMIT", 100))  # updates per getUpdates call, 1-100
+_allowed_updates = os.environ.get("POLLING_ALLOWED_UPDATES")  # comma-separated kinds, "all" for Telegram's default set
+POLLING_ALLOWED_UPDATES = MESSAGE_UPDATE_TYPES if _allowed_updates is None else parse_allowed_updates(_allowed_updates)
+POLLING_MAX_BACKLOG = int(os.environ.get("POLLING_MAX_BACKLOG", 1000))  # stop fetching while this many updates wait
+POLLING_DRAIN_TIMEOUT = float(os.environ.get("POLLING_DRAIN_TIMEOUT", 30))  # seconds to finish in-flight updates on shutdown
+POLLING_DROP_PENDING_UPDATES = os.environ.get("POLLING_DROP_PENDING_UPDATES", "false").lower() in ("1", "true", "yes")
+
+
+class UpdatePoller:
+    """Fetches updates with getUpdates and hands each batch of raw updates to `on_updates`.
+
+    The offset moves past a batch only once `on_updates` has returned (its updates are
+    journaled by then). Fetching pauses while `backlog()` is at `max_backlog`, so a slow
+    agent leaves the excess on Telegram's side instead of in memory.
+    """
+
+    def __init__(self, http, api_url, on_updates, timeout=30, limit=100, allowed_updates=(),
+                 max_backlog=1000, backlog=lambda: 0):
+        self.http = http
+        self.url = f"{api_url}/getUpdates"
+        self.on_updates = on_updates
+        self.timeout = timeout
+        self.limit = limit
+        self.allowed_updates = list(allowed_updates)
+        self.max_backlog = max_backlog
+        self.backlog = backlog
+        self.offset = None
+        self._stopping = False
+        self._poll: asyncio.Future | None = None
+        self.polls = 0
+        self.received = 0
+        self.errors = 0
+        self.paused = 0
+
+    async def get_updates(self, timeout):
+        params = {"timeout": timeout, "limit": self.limit, "allowed_updates": self.allowed_updates}
+        if self.offset is not None:
+            params["offset"] = self.offset
+        # The read timeout has to outlast the long poll itself
+        response = await self.http.post(self.url, json=params, timeout=httpx.Timeout(timeout + 10.0, connect=10.0))
+        data = response.json()
+        if not data.get("ok"):
+            raise RuntimeError(f"getUpdates failed: {data.get('error_code')} {data.get('description')}")
+        return data["result"]
+
+    async def run(self):
+        backoff = 1.0
+        while not self._stopping:
+            if self.backlog() >= self.max_backlog:
+                self.paused += 1
+                await asyncio.sleep(0.1)
+                continue
+            self._poll = asyncio.ensure_future(self.get_updates(self.timeout))
+            try:
+                updates = await self._poll
+            except asyncio.CancelledError:
+                if self._stopping:
+                    break
+                raise
+            except Exception as e:
+                # 409 Conflict: a webhook is set or another poller runs with the same token
+                self.errors += 1
+                logger.error(f"{e} - retrying in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            finally:
+                self._poll = None
+            backoff = 1.0
+            self.polls += 1
+            if not updates:
+                continue
+            self.received += len(updates)
+            try:
+                await self.on_updates(updates)
+            except Exception as e:
+                logger.error(f"Error processing updates {updates[0]['update_id']}-{updates[-1]['update_id']}: {e}")
+            self.offset = updates[-1]["update_id"] + 1
+
+    def stop(self):
+        """Stop fetching; an in-flight long poll is abandoned."""
+        self._stopping = True
+        if self._poll is not None:
+            self._poll.cancel()
+
+    async def confirm(self):
+        """Tell Telegram that updates before the current offset were received."""
+        if self.offset is None:
+            return
+        try:
+            await self.get_updates(0)
+        except Exception as e:
+            logger.warning(f"Failed to confirm the polling offset: {e}")
+
+    def stats(self):
+        return {
+            "polls": self.polls,
+            "received": self.received,
+            "errors": self.errors,
+            "paused": self.paused,
+            "offset": self.offset,
+        }
+
+
+def create_poller():
+    return UpdatePoller(
+        bot.http_clients.telegram,
+        f"{bot.TELEGRAM_API_URL}/bot{bot.BOT_TOKEN}",
+        bot.dispatch_updates,
+        timeout=POLLING_TIMEOUT,
+        limit=POLLING_LIMIT,
+        allowed_updates=POLLING_ALLOWED_UPDATES,
+        max_backlog=POLLING_MAX_BACKLOG,
+        backlog=lambda: bot.scheduler.queued,
+    )
 
-    reply_msg = await update.message.reply_text("⏳ Thinking...", parse_mode=ParseMode.MARKDOWN)
-    accumulated = ""
-    last_edit = time.monotonic()
-    last_sent_text = ""  # Track last text sent to avoid "Message not modified"
-    event_name = None
 
+async def run_polling(poller=None):
+    """Poll until SIGINT/SIGTERM, then finish in-flight updates within POLLING_DRAIN_TIMEOUT."""
+    await bot.start_application()
+    poller = poller or create_poller()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, poller.stop)
     try:
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream("POST", ABI_API_URL, headers=headers, json=payload) as resp:
-                resp.raise_for_status()
-                async for raw_line in resp.aiter_lines():
-                    if not raw_line:
-                        continue
-                    logger.debug(f"Raw SSE line: {raw_line}")
-
-                    # SSE parsing
-                    if raw_line.startswith("event:"):
-                        event_name = raw_line[len("event:"):].strip()
-                        logger.debug(f"Detected event: {event_name}")
-                        continue
-                    if not raw_line.startswith("data:"):
-                        continue
-                    if event_name != "message":
-                        continue
-
-                    chunk = raw_line[len("data:"):].strip()
-                    if not chunk or chunk == "[DONE]":
-                        continue
-
-                    accumulated += chunk
-                    now = time.monotonic()
-
-                    # Edit message only if text changed
-                    if now - last_edit > 0.5 and accumulated != last_sent_text:
-                        try:
-                            await reply_msg.edit_text(accumulated, parse_mode=ParseMode.MARKDOWN)
-                            last_sent_text = accumulated
-                            logger.info(f"Updated message for {thread_id}: {accumulated}")
-                        except Exception as e:
-                            logger.error(f"Failed to edit message: {e}")
-                        last_edit = now
-
-        # Final message after streaming finishes
-        if accumulated.strip() and accumulated != last_sent_text:
-            await reply_msg.edit_text(accumulated.strip(), parse_mode=ParseMode.MARKDOWN)
-            logger.info(f"Final message sent to {thread_id}: {accumulated.strip()}")
-        elif not accumulated.strip():
-            await reply_msg.edit_text("✅ Got it — but no reply was returned.", parse_mode=ParseMode.MARKDOWN)
-            logger.info(f"No reply returned for {thread_id}")
-
-    except httpx.HTTPStatusError as e:
-        error_text = f"HTTP error {e.response.status_code}: {e.response.text}"
-        await reply_msg.edit_text(f"❌ {error_text}", parse_mode=ParseMode.MARKDOWN)
-        logger.error(error_text)
-    except Exception as e:
-        await reply_msg.edit_text(f"⚠️ Internal error: {e}", parse_mode=ParseMode.MARKDOWN)
-        logger.error(f"Internal error for {thread_id}: {e}")
+        await poller.run()
+    finally:
+        pending = bot.scheduler.queued + bot.scheduler.running
+        logger.info(f"Polling stopped - draining {pending} update(s) for up to {POLLING_DRAIN_TIMEOUT}s")
+        if not await bot.scheduler.drain(POLLING_DRAIN_TIMEOUT):
+            # Cancelled by stop_application; they stay unfinished in the journal and are replayed on next start
+            logger.warning(f"Drain timed out with {bot.scheduler.queued + bot.scheduler.running} update(s) left")
+        await poller.confirm()
+        # Already drained above
+        await bot.stop_application(drain_timeout=0)
+        logger.info(f"Polling stats: {poller.stats()}")
 
-# --- Build Telegram app ---
-app = ApplicationBuilder().token(BOT_TOKEN).build()
-app.add_handler(CommandHandler("start", start))
-app.add_handler(CommandHandler("help", help_command))
-app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
-# --- Run polling for local testing / easier debugging ---
 if __name__ == "__main__":
-    logger.info("Bot is starting in polling mode...")
-    app.run_polling()
+    # getUpdates is refused while a webhook is set
+    try:
+        delete_webhook(bot.BOT_TOKEN, POLLING_DROP_PENDING_UPDATES, bot.TELEGRAM_API_URL)
+    except Exception as e:
+        logger.error(f"Failed to delete the Telegram webhook: {e}")
+        sys.exit(1)
+    logger.info(f"Bot is starting in polling mode (timeout={POLLING_TIMEOUT}s, limit={POLLING_LIMIT})...")
+    asyncio.run(run_polling())
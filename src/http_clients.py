@@ -0,0 +1,222 @@
+"""Application-scoped pooled HTTP clients for the agent API, Telegram and OpenAI."""
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# --- HTTP/2 is optional (needs the `h2` package, installed by httpx[http2]) ---
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+@dataclass
+class PoolConfig:
+    """Connection pool, concurrency and timeout settings for one upstream."""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    max_concurrency_per_host: int = 50
+    connect_timeout: float = 10.0
+    read_timeout: float = 30.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+    http2: bool = True
+
+    @classmethod
+    def from_env(cls, prefix, **defaults):
+        """Build a config from `<PREFIX>_HTTP_*` environment variables."""
+        base = cls(**defaults)
+        http2_env = os.environ.get(f"{prefix}_HTTP2", os.environ.get("HTTP2_ENABLED"))
+        return cls(
+            max_connections=_env_int(f"{prefix}_HTTP_MAX_CONNECTIONS", base.max_connections),
+            max_keepalive_connections=_env_int(f"{prefix}_HTTP_MAX_KEEPALIVE", base.max_keepalive_connections),
+            keepalive_expiry=_env_float(f"{prefix}_HTTP_KEEPALIVE_EXPIRY", base.keepalive_expiry),
+            max_concurrency_per_host=_env_int(f"{prefix}_HTTP_MAX_CONCURRENCY", base.max_concurrency_per_host),
+            connect_timeout=_env_float(f"{prefix}_HTTP_CONNECT_TIMEOUT", base.connect_timeout),
+            read_timeout=_env_float(f"{prefix}_HTTP_TIMEOUT", base.read_timeout),
+            write_timeout=_env_float(f"{prefix}_HTTP_WRITE_TIMEOUT", base.write_timeout),
+            pool_timeout=_env_float(f"{prefix}_HTTP_POOL_TIMEOUT", base.pool_timeout),
+            http2=(http2_env.lower() not in ("0", "false", "no")) if http2_env else base.http2,
+        )
+
+    @property
+    def use_http2(self):
+        return self.http2 and HTTP2_AVAILABLE
+
+    def limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self):
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+
+class PooledClient:
+    """A keep-alive `httpx.AsyncClient` with per-host concurrency caps and stats."""
+
+    def __init__(self, name, config: PoolConfig):
+        self.name = name
+        self.config = config
+        self._client: httpx.AsyncClient | None = None
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.connections_opened = 0
+        self.in_flight = 0
+        self.waiters = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError(f"HTTP client '{self.name}' is not started")
+        return self._client
+
+    async def start(self):
+        if self._client is not None:
+            return
+        if self.config.http2 and not HTTP2_AVAILABLE:
+            logger.warning(f"HTTP/2 requested for '{self.name}' but h2 is not installed - using HTTP/1.1")
+        self._client = httpx.AsyncClient(
+            http2=self.config.use_http2,
+            limits=self.config.limits(),
+            timeout=self.config.timeout(),
+        )
+        logger.info(
+            f"HTTP client '{self.name}' started (http2={self.config.use_http2}, "
+            f"max_connections={self.config.max_connections}, "
+            f"max_concurrency_per_host={self.config.max_concurrency_per_host})"
+        )
+
+    async def aclose(self):
+        if self._client is None:
+            return
+        client, self._client = self._client, None
+        await client.aclose()
+        logger.info(f"HTTP client '{self.name}' closed: {self.stats()}")
+
+    def _semaphore(self, url):
+        host = urlsplit(str(url)).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.config.max_concurrency_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _trace(self, event_name, info):
+        # httpcore emits this once per new TCP connection, never on reuse
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    @asynccontextmanager
+    async def _slot(self, url):
+        semaphore = self._semaphore(url)
+        self.waiters += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiters -= 1
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    def _with_trace(self, kwargs):
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions.setdefault("trace", self._trace)
+        kwargs["extensions"] = extensions
+        return kwargs
+
+    async def request(self, method, url, **kwargs) -> httpx.Response:
+        async with self._slot(url):
+            return await self.client.request(method, url, **self._with_trace(kwargs))
+
+    async def get(self, url, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        """Streaming request; the per-host slot is held until the body is consumed."""
+        async with self._slot(url):
+            async with self.client.stream(method, url, **self._with_trace(kwargs)) as response:
+                yield response
+
+    def open_connections(self):
+        # httpx exposes no public API for this; read the httpcore pool best-effort
+        try:
+            return len(self.client._transport._pool.connections)
+        except (AttributeError, RuntimeError):
+            return 0
+
+    def stats(self):
+        reuse_ratio = 1 - (self.connections_opened / self.requests) if self.requests else 0.0
+        return {
+            "http2": self.config.use_http2,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "waiters": self.waiters,
+            "open_connections": self.open_connections() if self._client else 0,
+            "connections_opened": self.connections_opened,
+            "reuse_ratio": round(max(reuse_ratio, 0.0), 4),
+        }
+
+
+class HttpClients:
+    """Registry of pooled clients, one per upstream, started and closed with the Application."""
+
+    def __init__(self, **configs: PoolConfig):
+        self._clients = {name: PooledClient(name, config) for name, config in configs.items()}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            agent=PoolConfig.from_env("AGENT", read_timeout=300.0),
+            telegram=PoolConfig.from_env("TELEGRAM", read_timeout=30.0),
+            openai=PoolConfig.from_env("OPENAI", read_timeout=120.0),
+        )
+
+    def __getattr__(self, name) -> PooledClient:
+        try:
+            return self.__dict__["_clients"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    async def start(self):
+        await asyncio.gather(*(client.start() for client in self._clients.values()))
+
+    async def aclose(self):
+        await asyncio.gather(*(client.aclose() for client in self._clients.values()))
+
+    def stats(self):
+        return {name: client.stats() for name, client in self._clients.items()}
@@ -0,0 +1,134 @@
+"""Logging for the bot's hot paths: non-blocking output, lazy truncated payloads, sampling,
+and JSON lines carrying the update and chat as fields."""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from contextvars import ContextVar
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Record attributes written as JSON keys; set with `extra=` or `bind_log_fields`
+LOG_FIELDS = ("update_id", "chat_id")
+
+_log_fields: ContextVar[dict] = ContextVar("log_fields", default={})
+
+# Per-update loggers; their INFO records can be sampled
+STAGE_LOGGERS = ("bot.intake", "bot.voice", "bot.agent")
+
+_payload_chars = 200
+
+
+class Truncated:
+    """Formats `value` only when the record is emitted, cut to `limit` characters.
+
+    A limit of 0 redacts the value and logs its length only.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = str(self.value)
+        limit = _payload_chars if self.limit is None else self.limit
+        if limit <= 0:
+            return f"<{len(text)} chars>"
+        if len(text) > limit:
+            return f"{text[:limit]}… ({len(text)} chars)"
+        return text
+
+
+def truncate(value, limit=None):
+    return Truncated(value, limit)
+
+
+class SampleFilter(logging.Filter):
+    """Lets through a `rate` fraction of records below WARNING, and every warning or error."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def bind_log_fields(**fields):
+    """Attach `fields` (e.g. update_id, chat_id) to every record logged from the current task."""
+    _log_fields.set({**_log_fields.get(), **fields})
+
+
+class ContextFieldsFilter(logging.Filter):
+    """Copies the fields bound with `bind_log_fields` onto each record, unless given with `extra=`."""
+
+    def filter(self, record):
+        for name, value in _log_fields.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the `LOG_FIELDS` present."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in LOG_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level="INFO", stage_levels="", sample_rate=1.0, payload_chars=200, use_queue=True,
+                      log_format="json"):
+    """Replace the root handlers; log lines are written by a background thread if `use_queue`.
+
+    `stage_levels` is a comma-separated list of `logger=LEVEL` overrides, e.g.
+    "bot.agent=DEBUG,httpx=WARNING". `log_format` is "json" or "text" (the plain `LOG_FORMAT` line).
+    """
+    global _payload_chars
+    _payload_chars = payload_chars
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.setLevel(level.upper())
+
+    if use_queue:
+        records = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+        listener.start()
+        # Flushes what is still queued when the process exits
+        atexit.register(listener.stop)
+        # QueueHandler.prepare formats the message here, before the arguments can change;
+        # sampled-out records are dropped before that
+        root_handler = logging.handlers.QueueHandler(records)
+    else:
+        root_handler = handler
+    # Runs in the task that logs, where the bound fields are visible
+    root_handler.addFilter(ContextFieldsFilter())
+    root.addHandler(root_handler)
+
+    for override in stage_levels.split(","):
+        name, sep, stage_level = override.partition("=")
+        if sep and name.strip():
+            logging.getLogger(name.strip()).setLevel(stage_level.strip().upper())
+
+    if sample_rate < 1.0:
+        for name in STAGE_LOGGERS:
+            logging.getLogger(name).addFilter(SampleFilter(sample_rate))
@@ -0,0 +1,95 @@
+"""Per-stage latency histograms and error counters, served in the Prometheus text format.
+
+Each stage can also be exported as an OpenTelemetry span when `opentelemetry-api` is
+installed and tracing is enabled (the SDK and exporter are configured by the deployment,
+e.g. with `opentelemetry-instrument`).
+"""
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+# From a few milliseconds (ack, authorization) to minutes (long agent answers)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class _StatsCollector:
+    """Exposes the numeric leaves of a nested `stats()` dict as gauges."""
+
+    def __init__(self, namespace, stats):
+        self.namespace = namespace
+        self.stats = stats
+
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            f"{self.namespace}_component_stat", "Component stats, as served on /stats", labels=["component", "stat"]
+        )
+        for component, values in self.stats().items():
+            for stat, value in _flatten(values):
+                gauge.add_metric([component, stat], float(value))
+        yield gauge
+
+
+def _flatten(values, prefix=""):
+    for key, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+class Metrics:
+    """`stage(name)` times a block into `<namespace>_stage_duration_seconds{stage=...}` and
+    counts exceptions escaping it in `<namespace>_errors_total{stage=..., type=...}`."""
+
+    content_type = CONTENT_TYPE_LATEST
+
+    def __init__(self, namespace="telegram_bot", stats=None, tracing=False):
+        self.registry = CollectorRegistry()
+        self.stage_seconds = Histogram(
+            "stage_duration_seconds", "Duration of each update handling stage",
+            ["stage"], namespace=namespace, registry=self.registry, buckets=LATENCY_BUCKETS,
+        )
+        self.errors = Counter(
+            "errors", "Errors by stage and exception type",
+            ["stage", "type"], namespace=namespace, registry=self.registry,
+        )
+        if stats is not None:
+            self.registry.register(_StatsCollector(namespace, stats))
+        self._tracer = None
+        if tracing:
+            if trace is None:
+                logger.warning("OpenTelemetry tracing requested but opentelemetry-api is not installed")
+            else:
+                self._tracer = trace.get_tracer(namespace)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        span = self._tracer.start_as_current_span(name) if self._tracer else nullcontext()
+        with span:
+            try:
+                yield
+            except Exception as e:
+                self.error(name, e)
+                raise
+            finally:
+                self.observe(name, time.perf_counter() - started)
+
+    def observe(self, name, seconds):
+        self.stage_seconds.labels(name).observe(seconds)
+
+    def error(self, name, exception):
+        self.errors.labels(name, type(exception).__name__).inc()
+
+    def render(self) -> bytes:
+        return generate_latest(self.registry)
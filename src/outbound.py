@@ -0,0 +1,361 @@
+"""Outbound Bot API scheduler: token buckets, flood-control retries, edit merging, priorities."""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram import ReplyParameters
+from telegram.constants import ChatType
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Lower value = sent first. Pass as `rate_limit_args={"priority": ...}` on any Bot API call.
+PRIORITY_FINAL = 0      # final answers and errors
+PRIORITY_NORMAL = 1     # default, e.g. streaming snapshots
+PRIORITY_PROGRESS = 2   # placeholders such as "⏳ Thinking..."
+
+FINAL = {"priority": PRIORITY_FINAL}
+NORMAL = {"priority": PRIORITY_NORMAL}
+PROGRESS = {"priority": PRIORITY_PROGRESS}
+
+
+# Message shortcuts (`message.reply_text`, `message.edit_text`) cannot pass `rate_limit_args`,
+# so prioritized calls go through the bot methods with the same arguments the shortcuts use.
+async def reply_text(message, text, rate_limit_args=None, **kwargs):
+    """`message.reply_text` with a priority; quotes the message outside private chats, like PTB."""
+    if message.chat.type != ChatType.PRIVATE:
+        kwargs.setdefault("reply_parameters", ReplyParameters(message_id=message.message_id))
+    if message.is_topic_message:
+        kwargs.setdefault("message_thread_id", message.message_thread_id)
+    return await message.get_bot().send_message(
+        chat_id=message.chat_id,
+        text=text,
+        business_connection_id=message.business_connection_id,
+        rate_limit_args=rate_limit_args,
+        **kwargs,
+    )
+
+
+async def send_text(message, text, rate_limit_args=None, **kwargs):
+    """A new message in the chat (and topic) of `message`, e.g. the continuation of a long answer."""
+    if message.is_topic_message:
+        kwargs.setdefault("message_thread_id", message.message_thread_id)
+    return await message.get_bot().send_message(
+        chat_id=message.chat_id,
+        text=text,
+        business_connection_id=message.business_connection_id,
+        rate_limit_args=rate_limit_args,
+        **kwargs,
+    )
+
+
+async def edit_text(message, text, rate_limit_args=None, **kwargs):
+    """`message.edit_text` with a priority."""
+    return await message.get_bot().edit_message_text(
+        text,
+        chat_id=message.chat_id,
+        message_id=message.message_id,
+        business_connection_id=message.business_connection_id,
+        rate_limit_args=rate_limit_args,
+        **kwargs,
+    )
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = min(self.tokens, 0)
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "chat_id", "edit_key", "callback", "args", "kwargs", "futures", "attempts")
+
+    def __init__(self, priority, seq, chat_id, edit_key, callback, args, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.edit_key = edit_key
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.futures = [asyncio.get_running_loop().create_future()]
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundRateLimiter(BaseRateLimiter[dict]):
+    """PTB rate limiter that throttles every chat-bound Bot API call before it is sent.
+
+    - one global bucket (~30 requests/s) plus a bucket per chat (~1/s) and, for groups,
+      one more for Telegram's 20 messages/minute;
+    - jobs are dispatched by priority (final answers before progress updates), then FIFO;
+    - an `editMessageText` still waiting in the queue is replaced by a newer edit of the
+      same message: only the latest text is sent and both callers get its result;
+    - a message gets one edit at a time: an edit arriving while another one of the same
+      message is being sent waits for it to finish, so an older text never lands last;
+    - `RetryAfter` blocks the chat (or everything, for calls without a chat) for the
+      requested time and re-queues the call instead of surfacing the error.
+
+    Calls without a `chat_id` (getMe, getFile, ...) are not queued, they only wait for a
+    flood-control block to end.
+
+    With several worker processes, pass a shared `state_store.StateStore`: the global rate
+    is then enforced across all of them. Chat buckets stay local, since each chat is routed
+    to a single worker.
+    """
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3, group_per_minute=20, max_retries=3,
+                 shared_store=None):
+        self.global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self.shared_store = shared_store
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self._chat_buckets: dict[object, tuple[TokenBucket, ...]] = {}
+        self._heap: list[_Job] = []
+        self._edits: dict[tuple, _Job] = {}  # edits not sent yet, by (chat_id, message_id)
+        self._sending: set[tuple] = set()  # messages with an edit being sent
+        self._parked: dict[tuple, _Job] = {}  # edits waiting for that send, out of the heap
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self._running: set[asyncio.Task] = set()
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+
+    async def initialize(self):
+        # ExtBot.initialize calls this on every call, not only the first
+        if self._dispatcher is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def shutdown(self):
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        await asyncio.gather(self._dispatcher, *self._running, return_exceptions=True)
+        self._dispatcher = None
+        for job in [*self._heap, *self._parked.values()]:
+            for future in job.futures:
+                if not future.done():
+                    future.cancel()
+        self._heap.clear()
+        self._edits.clear()
+        self._sending.clear()
+        self._parked.clear()
+
+    def _buckets(self, chat_id):
+        buckets = self._chat_buckets.get(chat_id)
+        if buckets is None:
+            if len(self._chat_buckets) >= 100_000:
+                self._prune_buckets()
+            buckets = (TokenBucket(self.chat_rate, self.chat_burst),)
+            if isinstance(chat_id, str) or chat_id < 0:
+                # Groups, supergroups and channels (negative or @username ids)
+                buckets += (TokenBucket(self.group_per_minute / 60, self.group_per_minute),)
+            self._chat_buckets[chat_id] = buckets
+        return buckets
+
+    def _prune_buckets(self):
+        """Forget chats whose buckets are full again; they behave exactly like new ones."""
+        now = time.monotonic()
+        queued = {job.chat_id for job in self._heap}
+        for chat_id, buckets in list(self._chat_buckets.items()):
+            if chat_id not in queued and all(b.delay(now) <= 0 and b.tokens >= b.capacity for b in buckets):
+                del self._chat_buckets[chat_id]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None or self._dispatcher is None:
+            return await self._call_unqueued(callback, args, kwargs)
+
+        priority = (rate_limit_args or {}).get("priority", PRIORITY_NORMAL)
+        edit_key = None
+        if endpoint == "editMessageText" and data.get("message_id") is not None:
+            edit_key = (chat_id, data["message_id"])
+            pending = self._edits.get(edit_key)
+            if pending is not None:
+                # Superseded: the queued edit now carries this newer text
+                pending.args, pending.kwargs, pending.callback = args, kwargs, callback
+                future = asyncio.get_running_loop().create_future()
+                pending.futures.append(future)
+                if priority < pending.priority:
+                    pending.priority = priority
+                    heapq.heapify(self._heap)
+                self.merged += 1
+                return await future
+
+        job = _Job(priority, next(self._seq), chat_id, edit_key, callback, args, kwargs)
+        if edit_key is not None:
+            self._edits[edit_key] = job
+            if edit_key in self._sending:
+                # Queued once the edit being sent finishes; newer edits merge into it meanwhile
+                self._parked[edit_key] = job
+                return await job.futures[0]
+        heapq.heappush(self._heap, job)
+        self._wakeup.set()
+        return await job.futures[0]
+
+    async def _call_unqueued(self, callback, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            wait = self.global_bucket.blocked_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                self.global_bucket.block(time.monotonic() + _seconds(e.retry_after))
+                self.retried += 1
+
+    def _next_ready(self, now):
+        """Pop the best job whose chat can send now; otherwise return the shortest wait."""
+        skipped = []
+        job = None
+        wait = None
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            delay = max(bucket.delay(now) for bucket in self._buckets(candidate.chat_id))
+            if delay <= 0:
+                job = candidate
+                break
+            skipped.append(candidate)
+            wait = delay if wait is None else min(wait, delay)
+        for candidate in skipped:
+            heapq.heappush(self._heap, candidate)
+        return job, wait
+
+    async def _dispatch_loop(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            global_wait = self.global_bucket.delay(now)
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+                continue
+
+            job, wait = self._next_ready(now)
+            if job is None:
+                # Every queued chat is throttled: sleep until the first one frees up or a new job arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if job.edit_key is not None:
+                self._edits.pop(job.edit_key, None)
+                self._sending.add(job.edit_key)
+            self.global_bucket.take(now)
+            for bucket in self._buckets(job.chat_id):
+                bucket.take(now)
+            if self.shared_store is not None:
+                shared_wait = await self.shared_store.reserve(
+                    "outbound:global", self.global_bucket.rate, self.global_bucket.capacity
+                )
+                if shared_wait > 0:
+                    await asyncio.sleep(shared_wait)
+            task = asyncio.create_task(self._send(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _send(self, job: _Job):
+        job.attempts += 1
+        try:
+            result = await job.callback(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            retry_after = _seconds(e.retry_after)
+            for bucket in self._buckets(job.chat_id):
+                bucket.block(time.monotonic() + retry_after)
+            if job.attempts <= self.max_retries:
+                logger.warning(f"Flood control for chat {job.chat_id}: retrying in {retry_after}s")
+                self.retried += 1
+                if job.edit_key is not None:
+                    self._sending.discard(job.edit_key)
+                    newer = self._parked.pop(job.edit_key, None)
+                    if newer is not None:
+                        # The newer text is retried instead and answers both callers
+                        newer.futures[:0] = job.futures
+                        job = newer
+                    else:
+                        self._edits[job.edit_key] = job
+                heapq.heappush(self._heap, job)
+                self._wakeup.set()
+                return
+            _resolve(job, exception=e)
+        except Exception as e:
+            _resolve(job, exception=e)
+        else:
+            self.sent += 1
+            _resolve(job, result=result)
+        if job.edit_key is not None:
+            self._release(job.edit_key)
+
+    def _release(self, edit_key):
+        """The edit of `edit_key` was sent (or failed): queue the one waiting for it, if any."""
+        self._sending.discard(edit_key)
+        parked = self._parked.pop(edit_key, None)
+        if parked is not None:
+            heapq.heappush(self._heap, parked)
+            self._wakeup.set()
+
+    def stats(self):
+        return {
+            "queued": len(self._heap),
+            "in_flight": len(self._running),
+            "sent": self.sent,
+            "merged_edits": self.merged,
+            "retried": self.retried,
+            "chats": len(self._chat_buckets),
+        }
+
+
+def _seconds(retry_after):
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+def _resolve(job, result=None, exception=None):
+    for future in job.futures:
+        if future.done():
+            continue
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
@@ -0,0 +1,215 @@
+"""Agent answers to Telegram messages: reply extraction, Markdown conversion, splitting.
+
+Agents answer in common Markdown, which Telegram's parsers reject as soon as a marker is
+unbalanced (a `snake_case` word, a half-streamed `**bold`, a `*` in a formula) and which can
+exceed the 4096-character message limit. `Renderer` converts it to HTML or MarkdownV2 that
+always parses: recognised constructs become entities, anything else is escaped literal text,
+and a code block still open in a partial answer is closed. `split` cuts long answers at
+paragraph, line or word boundaries so that each part fits in one message.
+"""
+import html
+import re
+
+from telegram.constants import ParseMode
+
+MESSAGE_LIMIT = 4096  # characters (UTF-16 code units) of visible text per message
+
+_REPLY_KEYS = ("text", "content", "answer", "response", "reply", "output", "message", "result", "data")
+
+_FENCE = re.compile(r"^\s*```\s*([\w+#.-]*)\s*$")
+_HEADING = re.compile(r"^#{1,6}\s+(.*?)\s*#*\s*$")
+_BULLET = re.compile(r"^(\s*)[-*+]\s+(?=\S)")
+_INLINE = re.compile(
+    r"`(?P<code>[^`\n]+)`"
+    r"|\[(?P<label>[^\]\n]+)\]\((?P<url>https?://(?:[^()\s]|\([^()\s]*\))+)\)"
+    r"|\*\*\*(?P<bolditalic>\S(?:[^\n]*?\S)?)\*\*\*"
+    r"|\*\*(?P<bold>\S(?:[^\n]*?\S)?)\*\*"
+    r"|~~(?P<strike>\S(?:[^\n]*?\S)?)~~"
+    r"|(?<![\w*])\*(?P<italic>[^\s*](?:[^*\n]*?[^\s*])?)\*(?![\w*])"
+    r"|(?<!\w)_(?P<italic2>[^\s_](?:[^_\n]*?[^\s_])?)_(?!\w)"
+)
+_MARKDOWN_V2_SPECIAL = re.compile(r"([_*\[\]()~`>#+\-=|{}.!\\])")
+_MARKDOWN_V2_CODE = re.compile(r"([`\\])")
+
+
+def _escape_markdown_v2_code(text):
+    """Inside code, pre and link URLs only ` and \\ are escaped."""
+    return _MARKDOWN_V2_CODE.sub(r"\\\1", text)
+
+
+def extract_reply(data) -> str:
+    """The answer text of an agent completion response (a string, or JSON wrapping one).
+
+    "" when a JSON object has no text under any of the known keys: it is not shown as raw JSON.
+    """
+    if data is None:
+        return ""
+    if isinstance(data, str):
+        return data
+    if isinstance(data, list):
+        return "\n\n".join(text for text in (extract_reply(item) for item in data) if text)
+    if isinstance(data, dict):
+        choices = data.get("choices")
+        if isinstance(choices, list) and choices:
+            return extract_reply(choices[0])
+        for key in _REPLY_KEYS:
+            if key in data:
+                text = extract_reply(data[key])
+                if text:
+                    return text
+        return ""
+    return str(data)
+
+
+def utf16_len(text) -> int:
+    """Length as Telegram counts it."""
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+def open_fence(text, fence=None):
+    """The language of the code block still open at the end of `text` ("" if unnamed), or None."""
+    for line in text.split("\n"):
+        match = _FENCE.match(line)
+        if match and fence is None:
+            fence = match.group(1)
+        elif match and not match.group(1):
+            fence = None
+    return fence
+
+
+class Renderer:
+    """Converts agent Markdown to `parse_mode` markup; None renders plain text."""
+
+    def __init__(self, parse_mode=ParseMode.HTML, limit=MESSAGE_LIMIT):
+        if parse_mode not in (ParseMode.HTML, ParseMode.MARKDOWN_V2, None):
+            raise ValueError(f"Unsupported parse mode: {parse_mode}")
+        self.parse_mode = parse_mode
+        self.limit = limit
+
+    # --- Escaping ---
+    def escape(self, text) -> str:
+        """`text` as literal text in this parse mode."""
+        if self.parse_mode == ParseMode.HTML:
+            return html.escape(text, quote=False)
+        if self.parse_mode == ParseMode.MARKDOWN_V2:
+            return _MARKDOWN_V2_SPECIAL.sub(r"\\\1", text)
+        return text
+
+    def _code(self, text):
+        if self.parse_mode == ParseMode.HTML:
+            return f"<code>{html.escape(text, quote=False)}</code>"
+        if self.parse_mode == ParseMode.MARKDOWN_V2:
+            return f"`{_escape_markdown_v2_code(text)}`"
+        return text
+
+    def _pre(self, text, language):
+        if self.parse_mode == ParseMode.HTML:
+            attribute = f' class="language-{html.escape(language)}"' if language else ""
+            return f"<pre><code{attribute}>{html.escape(text, quote=False)}</code></pre>"
+        if self.parse_mode == ParseMode.MARKDOWN_V2:
+            return f"```{language}\n{_escape_markdown_v2_code(text)}\n```"
+        return text
+
+    def _wrap(self, style, inner):
+        if self.parse_mode == ParseMode.HTML:
+            return f"<{style}>{inner}</{style}>"
+        if self.parse_mode == ParseMode.MARKDOWN_V2:
+            marker = {"b": "*", "i": "_", "s": "~"}[style]
+            return f"{marker}{inner}{marker}"
+        return inner
+
+    def _link(self, label, url):
+        if self.parse_mode == ParseMode.HTML:
+            return f'<a href="{html.escape(url)}">{label}</a>'
+        if self.parse_mode == ParseMode.MARKDOWN_V2:
+            url = _escape_markdown_v2_code(url).replace(")", "\\)")
+            return f"[{label}]({url})"
+        return f"{label} ({url})"
+
+    # --- Markdown conversion ---
+    def _inline(self, text, depth=0):
+        out = []
+        position = 0
+        for match in _INLINE.finditer(text):
+            out.append(self.escape(text[position:match.start()]))
+            position = match.end()
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "code":
+                out.append(self._code(value))
+            elif kind == "url":
+                out.append(self._link(self._inline(match.group("label"), depth + 1), value))
+            elif depth > 2:
+                out.append(self.escape(value))
+            elif kind == "bolditalic":
+                out.append(self._wrap("b", self._wrap("i", self._inline(value, depth + 1))))
+            elif kind == "bold":
+                out.append(self._wrap("b", self._inline(value, depth + 1)))
+            elif kind in ("italic", "italic2"):
+                out.append(self._wrap("i", self._inline(value, depth + 1)))
+            else:
+                out.append(self._wrap("s", self._inline(value, depth + 1)))
+        out.append(self.escape(text[position:]))
+        return "".join(out)
+
+    def render(self, text, fence=None) -> str:
+        """Markup for `text` (Markdown, possibly a partial answer) that Telegram accepts.
+
+        `fence` is the language of a code block that `text` continues (see `open_fence`).
+        """
+        out = []
+        code: list[str] | None = None if fence is None else []
+        language = fence or ""
+        for line in text.split("\n"):
+            match = _FENCE.match(line)
+            if code is not None:
+                if match and not match.group(1):
+                    out.append(self._pre("\n".join(code), language))
+                    code = None
+                else:
+                    code.append(line)
+                continue
+            if match:
+                code, language = [], match.group(1)
+                continue
+            heading = _HEADING.match(line)
+            if heading:
+                out.append(self._wrap("b", self._inline(heading.group(1), 1)) if heading.group(1) else "")
+                continue
+            bullet = _BULLET.match(line)
+            if bullet:
+                out.append(bullet.group(1) + "• " + self._inline(line[bullet.end():]))
+                continue
+            out.append(self._inline(line))
+        if code is not None:
+            # Still open in a partial answer: close it so the message parses
+            out.append(self._pre("\n".join(code).rstrip("\n"), language))
+        return "\n".join(out).strip()
+
+    # --- Splitting ---
+    def split(self, text, fence=None) -> list[str]:
+        """Cut `text` into consecutive parts that each fit in one message.
+
+        Parts end after a blank line, a line break, a sentence or a word when possible.
+        The visible text of a rendered part is never longer than the part itself.
+        """
+        # Room for the fence that reopens a code block cut in two
+        limit = self.limit - 32
+        parts = []
+        while utf16_len(text) > limit:
+            cut = self._boundary(text, limit)
+            part, text = text[:cut], text[cut:]
+            parts.append(part)
+        parts.append(text)
+        return parts
+
+    @staticmethod
+    def _boundary(text, limit):
+        window = text[:limit]
+        while utf16_len(window) > limit:
+            window = window[:limit - (utf16_len(window) - len(window))]
+        for separator in ("\n\n", "\n", ". ", " "):
+            index = window.rfind(separator, len(window) // 2)
+            if index != -1:
+                return index + len(separator)
+        return len(window)
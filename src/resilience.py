@@ -0,0 +1,338 @@
+"""Upstream resilience for the agent API: circuit breaker, safe retries, hedging, adaptive concurrency."""
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Responses that mean the request was not processed, so sending it again is safe
+RETRYABLE_STATUS = {429, 502, 503}
+# Errors raised before the request reached the upstream
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class AgentUnavailable(Exception):
+    """The upstream is not called at all: answer the user right away instead."""
+
+
+class CircuitOpenError(AgentUnavailable):
+    pass
+
+
+class AgentOverloaded(AgentUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails fast for `reset_timeout`
+    seconds; then lets a single probe through (half-open) to decide whether to close again."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def check(self):
+        """Raise `CircuitOpenError` unless a request may be sent now."""
+        if self.state == self.CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        # A probe that never reported back (e.g. cancelled) does not block the circuit forever
+        if self.state == self.HALF_OPEN and (not self._probing or now - self._probe_started >= self.reset_timeout):
+            self._probing = True
+            self._probe_started = now
+            return
+        self.rejected += 1
+        raise CircuitOpenError(f"circuit open for {self.reset_timeout:.0f}s after {self.failures} failures")
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Agent circuit closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"Agent circuit opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class AdaptiveConcurrencyLimit:
+    """Caps concurrent upstream requests, adapting the cap to observed latency.
+
+    Gradient algorithm (as in Netflix's concurrency-limits): the ratio of the long-term to
+    the short-term average latency shrinks the limit when the upstream slows down, and a
+    headroom of sqrt(limit) lets it grow while latency holds. The limit only grows while
+    requests actually use at least half of it.
+    """
+
+    def __init__(self, initial=20, min_limit=2, max_limit=200, smoothing=0.2, max_waiters=1000):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.smoothing = smoothing
+        self.max_waiters = max_waiters
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._short_rtt = None
+        self._long_rtt = None
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.in_flight >= int(self.limit) or self._waiters:
+            if len(self._waiters) >= self.max_waiters:
+                self.rejected += 1
+                raise AgentOverloaded(f"{len(self._waiters)} requests already waiting for the agent")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                # The releasing request hands its slot over (in_flight is not decremented)
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release()
+                else:
+                    self._waiters.remove(waiter)
+                raise
+        else:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        while self._waiters and self.in_flight <= int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def observe(self, latency):
+        """Feed the latency of a successful request (time to first byte for streams)."""
+        if self._short_rtt is None:
+            self._short_rtt = self._long_rtt = latency
+            return
+        self._short_rtt += (latency - self._short_rtt) * 0.5
+        self._long_rtt += (latency - self._long_rtt) * 0.05
+        if self._long_rtt / self._short_rtt > 2:
+            # Recovering from a slow period: let the long-term average catch up faster
+            self._long_rtt *= 0.95
+
+        gradient = max(0.5, min(1.0, self._long_rtt / self._short_rtt))
+        app_limited = self.in_flight < self.limit / 2
+        headroom = 0.0 if app_limited else math.sqrt(self.limit)
+        new_limit = self.limit * gradient + headroom
+        self.limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+
+    def stats(self):
+        return {
+            "limit": round(self.limit, 1),
+            "in_flight": self.in_flight,
+            "waiters": len(self._waiters),
+            "rejected": self.rejected,
+        }
+
+
+class ResilientUpstream:
+    """Runs agent requests through a circuit breaker and an adaptive concurrency limit.
+
+    Retries (with full-jitter exponential backoff) only failures where the request never
+    reached the agent or was refused unprocessed. A streaming request is never retried once
+    the response has started. With `hedge` on, a completion request still pending after the
+    recent p95 latency is sent a second time and the first answer wins. Use hedging only if
+    duplicate prompts are harmless for the agent.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, limit: AdaptiveConcurrencyLimit, max_retries=2,
+                 backoff_base=0.25, backoff_max=4.0, attempt_timeout=None, first_byte_timeout=None,
+                 hedge=False, hedge_min_delay=1.0, latency_samples=256):
+        self.breaker = breaker
+        self.limit = limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempt_timeout = attempt_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self._latencies = deque(maxlen=latency_samples)
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _succeeded(self, latency):
+        self.breaker.record_success()
+        self.limit.observe(latency)
+        self._latencies.append(latency)
+
+    def _failed(self, error):
+        """Record a failure; 4xx answers other than 429 are the caller's problem, not an outage."""
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code < 500 \
+                and error.response.status_code != 429:
+            return
+        self.failures += 1
+        self.breaker.record_failure()
+
+    def _can_retry(self, error, attempt):
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUS
+        return isinstance(error, RETRYABLE_ERRORS)
+
+    async def _retry_wait(self, error, attempt):
+        self.retries += 1
+        delay = self._backoff(attempt)
+        logger.warning(f"Agent request failed ({error!r}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+        # Another request may have opened the circuit meanwhile
+        self.breaker.check()
+
+    def p95(self):
+        if len(self._latencies) < 20:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[int(len(latencies) * 0.95)]
+
+    def hedge_delay(self):
+        p95 = self.p95()
+        return None if p95 is None else max(self.hedge_min_delay, p95)
+
+    async def request(self, send) -> httpx.Response:
+        """`send()` performs one attempt and returns the response; error statuses are raised."""
+        self.breaker.check()
+        self.requests += 1
+        async with self.limit.slot():
+            for attempt in range(self.max_retries + 1):
+                started = time.monotonic()
+                try:
+                    response = await self._attempt(send)
+                except Exception as e:
+                    self._failed(e)
+                    if self._can_retry(e, attempt):
+                        await self._retry_wait(e, attempt)
+                        continue
+                    raise
+                self._succeeded(time.monotonic() - started)
+                return response
+
+    @staticmethod
+    async def _send_checked(send):
+        """One request; an error status is raised here, so it counts as a failed attempt."""
+        response = await send()
+        response.raise_for_status()
+        return response
+
+    async def _attempt(self, send):
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None:
+            async with asyncio.timeout(self.attempt_timeout):
+                return await self._send_checked(send)
+
+        # An error answer does not win the race: the other request may still succeed
+        first = asyncio.ensure_future(self._send_checked(send))
+        tasks = {first}
+        deadline = time.monotonic() + self.attempt_timeout if self.attempt_timeout else None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(self._send_checked(send)))
+            error = None
+            while tasks:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @asynccontextmanager
+    async def stream(self, open_stream):
+        """Open `open_stream()` (an httpx streaming context) with breaker, limit and retries.
+
+        The slot is held until the stream is closed; its latency sample is the time to the
+        response headers.
+        """
+        self.breaker.check()
+        self.requests += 1
+        async with self.limit.slot():
+            for attempt in range(self.max_retries + 1):
+                started = time.monotonic()
+                stack = AsyncExitStack()
+                try:
+                    # Entered in this task, which also exits it: httpx's cancel scopes require that
+                    async with asyncio.timeout(self.first_byte_timeout):
+                        response = await stack.enter_async_context(open_stream())
+                    if response.is_error:
+                        await response.aread()  # keep the error body for the caller
+                    response.raise_for_status()
+                except Exception as e:
+                    await stack.aclose()
+                    self._failed(e)
+                    if self._can_retry(e, attempt):
+                        await self._retry_wait(e, attempt)
+                        continue
+                    raise
+                self._succeeded(time.monotonic() - started)
+                async with stack:
+                    try:
+                        yield response
+                    except (httpx.TransportError, asyncio.TimeoutError) as e:
+                        # Dropped mid-stream: an upstream failure too
+                        self._failed(e)
+                        raise
+                return
+
+    def stats(self):
+        return {
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+            "fast_failed": self.breaker.rejected,
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p95_seconds": round(self.p95() or 0.0, 3),
+            **self.limit.stats(),
+        }
@@ -0,0 +1,94 @@
+"""Exact-match cache of agent answers for repeated, context-free prompts."""
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case, accents-as-typed, punctuation and spacing do not change the key:
+    "How do I reset my password?" and "how do i reset my password" share an answer."""
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class ResponseCache:
+    """Agent answers keyed by (agent, scope, normalized prompt), with TTL and LRU eviction.
+
+    `scope` is the thread an answer belongs to, or None for answers shared by every user
+    (only safe with an agent that keeps no per-thread memory: a cached answer may quote an
+    earlier conversation, and the agent never sees the exchange a hit answers).
+
+    A prompt sent in an ongoing conversation may depend on what was said before, so a
+    thread that exchanged messages with the agent in the last `context_window` seconds
+    bypasses the cache, both for lookups and for storing its answers.
+    """
+
+    def __init__(self, ttl=3600.0, max_entries=1024, context_window=600.0, max_threads=100_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.context_window = context_window
+        self.max_threads = max_threads
+        self._entries: OrderedDict[tuple, tuple[str, float, float]] = OrderedDict()
+        self._threads: OrderedDict[str, float] = OrderedDict()  # thread_id -> last exchange
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.seconds_saved = 0.0
+
+    def cacheable(self, thread_id) -> bool:
+        """False while the thread is in an ongoing conversation."""
+        last = self._threads.get(thread_id)
+        if last is not None and time.monotonic() - last < self.context_window:
+            self.bypassed += 1
+            return False
+        return True
+
+    def record_exchange(self, thread_id):
+        self._threads[thread_id] = time.monotonic()
+        self._threads.move_to_end(thread_id)
+        now = time.monotonic()
+        # Oldest first: drop threads whose conversation window has passed
+        while self._threads and (len(self._threads) > self.max_threads
+                                 or now - next(iter(self._threads.values())) >= self.context_window):
+            self._threads.popitem(last=False)
+
+    def get(self, agent, prompt, scope=None) -> str | None:
+        key = (agent, scope, normalize_prompt(prompt))
+        entry = self._entries.get(key)
+        if entry is not None:
+            answer, stored_at, latency = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.seconds_saved += latency
+                return answer
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, agent, prompt, answer, latency, scope=None):
+        """Store `answer`; `latency` is what the agent call took, i.e. what a hit saves."""
+        key = (agent, scope, normalize_prompt(prompt))
+        if not key[2] or not answer:
+            return
+        self._entries[key] = (answer, time.monotonic(), latency)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "agent_calls_saved": self.hits,
+            "seconds_saved": round(self.seconds_saved, 2),
+            "entries": len(self._entries),
+        }
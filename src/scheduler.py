@@ -0,0 +1,114 @@
+"""Per-chat ordered update scheduler with a global concurrency cap and backpressure."""
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ChatScheduler:
+    """Runs jobs for one chat strictly in order, different chats in parallel.
+
+    At most `max_concurrency` jobs run at once across all chats, and each chat can have at
+    most `max_queue_per_chat` jobs waiting or running. `submit` returns False when a chat's
+    queue is full so the caller can answer with a "busy" reply instead.
+    """
+
+    def __init__(self, max_concurrency=64, max_queue_per_chat=10, wait_samples=1024):
+        self.max_concurrency = max_concurrency
+        self.max_queue_per_chat = max_queue_per_chat
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._queues: dict[object, deque] = {}
+        self._workers: dict[object, asyncio.Task] = {}
+        self._running_chats: set = set()
+        self._waits = deque(maxlen=wait_samples)
+        self.submitted = 0
+        self.rejected = 0
+        self.queued = 0
+        self.running = 0
+        self.max_depth_seen = 0
+
+    def submit(self, key, job) -> bool:
+        """Queue `job` (a zero-argument coroutine function) behind earlier jobs for `key`."""
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+        depth = self.depth(key)
+        if depth >= self.max_queue_per_chat:
+            self.rejected += 1
+            logger.warning(f"Queue full for chat {key} ({depth} pending) - rejecting update")
+            return False
+
+        queue.append((time.monotonic(), job))
+        self.submitted += 1
+        self.queued += 1
+        self.max_depth_seen = max(self.max_depth_seen, depth + 1)
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._run_chat(key, queue))
+        return True
+
+    async def _run_chat(self, key, queue):
+        try:
+            while queue:
+                # The job stays at the head of the queue (and counts towards its depth)
+                # until a global slot frees up
+                async with self._slots:
+                    enqueued_at, job = queue.popleft()
+                    self.queued -= 1
+                    self._waits.append(time.monotonic() - enqueued_at)
+                    self.running += 1
+                    self._running_chats.add(key)
+                    try:
+                        await job()
+                    except Exception as e:
+                        logger.error(f"Scheduled job for chat {key} failed: {e}")
+                    finally:
+                        self.running -= 1
+                        self._running_chats.discard(key)
+        finally:
+            self._workers.pop(key, None)
+            if not queue:
+                self._queues.pop(key, None)
+
+    def depth(self, key) -> int:
+        """Jobs waiting or running for `key`."""
+        queue = self._queues.get(key)
+        return (len(queue) if queue else 0) + (key in self._running_chats)
+
+    async def drain(self, timeout=None) -> bool:
+        """Wait for every queued and running job to finish; False if `timeout` expired first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._workers:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            await asyncio.wait(list(self._workers.values()), timeout=remaining)
+        return True
+
+    async def close(self):
+        """Cancel all chat workers; queued jobs are dropped."""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self.queued = 0
+        self._queues.clear()
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 4) if waits else 0.0
+
+        return {
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "queued": self.queued,
+            "running": self.running,
+            "active_chats": len(self._workers),
+            "max_queue_depth": max((self.depth(key) for key in self._queues), default=0),
+            "max_queue_depth_seen": self.max_depth_seen,
+            "wait_seconds_p50": percentile(0.50),
+            "wait_seconds_p99": percentile(0.99),
+        }
@@ -0,0 +1,153 @@
+"""Per-chat session state: stable agent thread keys, in-flight requests and idle eviction."""
+import asyncio
+import hashlib
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def thread_key(chat_id) -> str:
+    """The agent thread of a chat: the same for text and voice, and across restarts."""
+    return hashlib.sha256(str(chat_id).encode()).hexdigest()
+
+
+class Session:
+    """One chat's state; `__slots__` keeps it to a few hundred bytes with its dict entry."""
+    __slots__ = ("thread_id", "last_active", "latest", "in_flight", "reply", "summary")
+
+    def __init__(self, thread_id, now):
+        self.thread_id = thread_id
+        self.last_active = now
+        self.latest = 0  # update_id of the newest message, when superseding is on
+        self.in_flight: asyncio.Task | None = None  # the update being handled for this chat
+        self.reply = None  # its placeholder message, edited if the request is superseded
+        self.summary = ""  # rolling tail of the conversation, when enabled
+
+
+class SessionStore:
+    """Sessions by chat id, in order of last activity.
+
+    A plain dict re-inserted on every touch stays ordered by activity (and takes less
+    memory than an OrderedDict at a million chats), so idle and capacity eviction only
+    walk the oldest entries. Chats with a request in flight are never evicted.
+
+    - `idle_ttl`: seconds without activity before a session is dropped by `evict_idle`.
+    - `max_sessions`: at capacity, the least recently active tenth is dropped.
+    - `summary_chars`: length of the rolling summary kept by `remember`; 0 disables it.
+    """
+
+    def __init__(self, max_sessions=1_000_000, idle_ttl=86400.0, summary_chars=0, sweep_interval=60.0):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.summary_chars = summary_chars
+        self.sweep_interval = sweep_interval
+        self._sessions: dict[object, Session] = {}
+        self._sweeper: asyncio.Task | None = None
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+        self.superseded = 0
+
+    def get(self, chat_id) -> Session:
+        """The chat's session, created on first use; marks the chat active."""
+        now = time.monotonic()
+        session = self._sessions.pop(chat_id, None)
+        if session is None:
+            if len(self._sessions) >= self.max_sessions:
+                self._evict_oldest(max(1, self.max_sessions // 10))
+            session = Session(thread_key(chat_id), now)
+            self.created += 1
+        else:
+            session.last_active = now
+        self._sessions[chat_id] = session
+        return session
+
+    def _evict_oldest(self, count):
+        stale = [chat_id for chat_id, session in itertools.islice(self._sessions.items(), count)
+                 if session.in_flight is None]
+        for chat_id in stale:
+            del self._sessions[chat_id]
+        self.evicted_capacity += len(stale)
+
+    def evict_idle(self, now=None) -> int:
+        cutoff = (now or time.monotonic()) - self.idle_ttl
+        stale = []
+        for chat_id, session in self._sessions.items():
+            if session.last_active >= cutoff:
+                break
+            if session.in_flight is None:
+                stale.append(chat_id)
+        for chat_id in stale:
+            del self._sessions[chat_id]
+        self.evicted_idle += len(stale)
+        return len(stale)
+
+    def begin(self, session, task):
+        session.in_flight = task
+        session.reply = None
+
+    def end(self, session, task):
+        if session.in_flight is task:
+            session.in_flight = None
+            session.reply = None
+
+    def supersede(self, chat_id, update_id):
+        """Record the chat's newest message and cancel the request in flight for an older one.
+
+        `in_flight` is cleared first, so the cancelled handler can tell this apart from a shutdown.
+        Older messages still queued are skipped by `is_superseded` when their turn comes.
+        """
+        session = self.get(chat_id)
+        session.latest = max(session.latest, update_id)
+        if session.in_flight is not None and not session.in_flight.done():
+            task, session.in_flight = session.in_flight, None
+            task.cancel()
+            self.superseded += 1
+
+    def is_superseded(self, session, update_id) -> bool:
+        if update_id < session.latest:
+            self.superseded += 1
+            return True
+        return False
+
+    def prompt(self, session, text):
+        """`text` preceded by the session's rolling summary, if there is one, for the agent."""
+        if not session.summary:
+            return text
+        return f"Conversation so far:{session.summary}\n\nUser: {text}"
+
+    def remember(self, session, prompt, answer):
+        """Append an exchange to the session's rolling summary (its last `summary_chars` characters)."""
+        if self.summary_chars > 0:
+            session.summary = f"{session.summary}\nUser: {prompt}\nAssistant: {answer}"[-self.summary_chars:]
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            evicted = self.evict_idle()
+            if evicted:
+                logger.info(f"Evicted {evicted} idle session(s), {len(self._sessions)} left")
+
+    async def start(self):
+        if self.sweep_interval > 0 and self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def aclose(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "created": self.created,
+            "evicted_idle": self.evicted_idle,
+            "evicted_capacity": self.evicted_capacity,
+            "superseded": self.superseded,
+        }
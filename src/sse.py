@@ -0,0 +1,176 @@
+"""Incremental Server-Sent Events decoder (WHATWG event-stream format)."""
+import asyncio
+import codecs
+import logging
+from dataclasses import dataclass
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+_BOM = "\ufeff"
+
+
+@dataclass(slots=True)
+class SSEEvent:
+    event: str = "message"
+    data: str = ""
+    id: str | None = None
+    retry: int | None = None
+
+
+class SSEDecoder:
+    """Feed raw bytes in, get complete events out.
+
+    Incoming bytes are decoded incrementally (UTF-8 sequences may be split across chunks).
+    An unterminated line is kept as a list of pending pieces and only joined once its
+    terminator arrives, so each byte is copied a constant number of times however long
+    the stream or the line is.
+    Handles CR, LF and CRLF line endings (also split across chunks), multi-line `data:`,
+    comments, and the `id:` / `retry:` fields needed to resume with `Last-Event-ID`.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending: list[str] = []
+        self._skip_lf = False
+        self._first_line = True
+        self._event = ""
+        self._data: list[str] = []  # data lines of the event being received
+        self.last_event_id = ""
+        self.retry: int | None = None
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        return self._feed_text(self._decoder.decode(chunk))
+
+    def close(self) -> list[SSEEvent]:
+        """Flush the decoder; an unterminated trailing event is discarded per the spec."""
+        events = self._feed_text(self._decoder.decode(b"", final=True))
+        self._pending.clear()
+        return events
+
+    def _feed_text(self, text: str) -> list[SSEEvent]:
+        if not text:
+            return []
+        if self._skip_lf:
+            # The previous chunk ended in CR; an LF here completes that CRLF
+            self._skip_lf = False
+            if text[0] == "\n":
+                text = text[1:]
+        if text.endswith("\r"):
+            self._skip_lf = True
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        lines = text.split("\n")
+        tail = lines.pop()
+        if not lines:
+            if tail:
+                self._pending.append(tail)
+            return []
+        if self._pending:
+            self._pending.append(lines[0])
+            lines[0] = "".join(self._pending)
+            self._pending.clear()
+        if tail:
+            self._pending.append(tail)
+
+        if self._first_line:
+            self._first_line = False
+            if lines[0].startswith(_BOM):
+                lines[0] = lines[0][1:]
+
+        events = []
+        data = self._data
+        event_type = self._event
+        for line in lines:
+            if not line:
+                if data:
+                    events.append(SSEEvent(
+                        event_type or "message",
+                        data[0] if len(data) == 1 else "\n".join(data),
+                        self.last_event_id or None,
+                        self.retry,
+                    ))
+                    data.clear()
+                event_type = ""
+            # Hot paths: nearly every line of an agent stream is a data or event line
+            elif line.startswith("data:"):
+                data.append(line[6:] if line[5:6] == " " else line[5:])
+            elif line.startswith("event:"):
+                event_type = line[7:] if line[6:7] == " " else line[6:]
+            elif line[0] != ":":
+                self._event = event_type
+                self._process_field(line)
+                event_type = self._event
+        self._event = event_type
+        return events
+
+    def _process_field(self, line: str):
+        field, sep, value = line.partition(":")
+        if sep and value[:1] == " ":
+            value = value[1:]
+
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        elif field == "id":
+            if "\0" not in value:
+                self.last_event_id = value
+        elif field == "retry":
+            if value.isdigit():
+                self.retry = int(value)
+
+
+async def iter_sse_events(response, decoder: SSEDecoder | None = None):
+    """Yield `SSEEvent`s from an httpx streaming response."""
+    decoder = decoder or SSEDecoder()
+    async for chunk in response.aiter_bytes():
+        for event in decoder.feed(chunk):
+            yield event
+    for event in decoder.close():
+        yield event
+
+
+async def iter_sse_with_resume(open_stream, max_reconnects=3, default_retry=1000):
+    """Yield events across disconnects, resuming with `Last-Event-ID`.
+
+    `open_stream(headers)` must return an async context manager producing a streaming
+    response. Reconnects only happen when the server has sent an event id to resume from;
+    the delay follows the server's `retry:` field.
+    """
+    decoder = SSEDecoder()
+    reconnects = 0
+    while True:
+        headers = {"Last-Event-ID": decoder.last_event_id} if decoder.last_event_id else {}
+        try:
+            async with open_stream(headers) as response:
+                if response.is_error:
+                    await response.aread()  # keep the error body for the caller
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    for event in decoder.feed(chunk):
+                        yield event
+            for event in decoder.close():
+                yield event
+            return
+        except httpx.TransportError as e:
+            if not decoder.last_event_id or reconnects >= max_reconnects:
+                raise
+            reconnects += 1
+            delay = (decoder.retry if decoder.retry is not None else default_retry) / 1000
+            logger.warning(
+                f"SSE stream dropped ({e!r}); resuming from event {decoder.last_event_id} "
+                f"in {delay:.1f}s (attempt {reconnects}/{max_reconnects})"
+            )
+            # Bytes of a half-received event are dropped; the server resends from the last id
+            decoder = _resumed(decoder)
+            await asyncio.sleep(delay)
+
+
+def _resumed(decoder: SSEDecoder) -> SSEDecoder:
+    fresh = SSEDecoder()
+    fresh.last_event_id = decoder.last_event_id
+    fresh.retry = decoder.retry
+    return fresh
@@ -0,0 +1,187 @@
+"""State shared by the bot's worker processes: update dedup and bot-wide rate limits.
+
+Chats are routed to workers by chat id, so per-chat state stays in each worker. Only
+bot-wide state goes through a store:
+
+- `memory://` (default): this process only, for a single worker;
+- `sqlite:///path/to/state.sqlite3`: every process on one host.
+
+Another backend (e.g. Redis, for workers on several hosts) only has to implement
+`claim` and `reserve` with the same semantics.
+"""
+import asyncio
+import itertools
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore(ABC):
+    """Interface. `shared` tells whether other processes see the same state."""
+
+    shared = False
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def claim(self, key, ttl) -> bool:
+        """Mark `key` as seen for `ttl` seconds; False if it already was (a duplicate)."""
+
+    @abstractmethod
+    async def reserve(self, key, rate, burst) -> float:
+        """Take one token from the `key` bucket (`rate`/s, `burst` tokens); returns the
+        seconds to wait before using it (0 if it can be used now)."""
+
+    def stats(self):
+        return {}
+
+
+def _gcra(tat, now, rate, burst):
+    """Generic cell rate algorithm: from the bucket's theoretical arrival time `tat`,
+    return (new tat, wait). Equivalent to a token bucket, with a single number of state."""
+    interval = 1.0 / rate
+    tat = max(tat, now) + interval
+    return tat, max(0.0, tat - burst * interval - now)
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._seen: dict[str, float] = {}  # key -> expires at
+        self._buckets: dict[str, float] = {}
+        self.claimed = 0
+        self.duplicates = 0
+
+    async def claim(self, key, ttl):
+        now = time.time()
+        expires = self._seen.get(key)
+        if expires is not None and expires > now:
+            self.duplicates += 1
+            return False
+        if len(self._seen) >= self.max_keys:
+            # Oldest first: forget the oldest tenth at once, not one key per claim
+            for stale in list(itertools.islice(self._seen, max(1, self.max_keys // 10))):
+                del self._seen[stale]
+        self._seen.pop(key, None)
+        self._seen[key] = now + ttl
+        self.claimed += 1
+        return True
+
+    async def reserve(self, key, rate, burst):
+        self._buckets[key], wait = _gcra(self._buckets.get(key, 0.0), time.time(), rate, burst)
+        return wait
+
+    def stats(self):
+        return {"backend": "memory", "claimed": self.claimed, "duplicates": self.duplicates, "keys": len(self._seen)}
+
+
+class SQLiteStateStore(StateStore):
+    """Store in a SQLite (WAL) file shared by the processes of one host.
+
+    Each operation is one short `BEGIN IMMEDIATE` transaction, which serializes it across
+    processes. Nothing here needs to survive a power loss, so commits are not fsynced.
+    """
+
+    shared = True
+
+    def __init__(self, path, prune_interval=60.0):
+        self.path = path
+        self.prune_interval = prune_interval
+        self._db: sqlite3.Connection | None = None
+        # sqlite3 calls block, so they run on one dedicated thread, never on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+        self._last_prune = 0.0
+        self.claimed = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open_db(self):
+        db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+        return db
+
+    async def open(self):
+        self._db = await self._run(self._open_db)
+        logger.info(f"State store opened at {self.path}")
+
+    async def close(self):
+        if self._db is None:
+            return
+        db, self._db = self._db, None
+        await self._run(db.close)
+        self._executor.shutdown(wait=False)
+
+    def _transaction(self, fn, *args):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(*args)
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        return result
+
+    def _claim(self, key, ttl):
+        now = time.time()
+        if now - self._last_prune >= self.prune_interval:
+            self._last_prune = now
+            self._db.execute("DELETE FROM seen WHERE expires_at <= ?", (now,))
+        row = self._db.execute("SELECT expires_at FROM seen WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[0] > now:
+            return False
+        self._db.execute("INSERT OR REPLACE INTO seen (key, expires_at) VALUES (?, ?)", (key, now + ttl))
+        return True
+
+    def _reserve(self, key, rate, burst):
+        row = self._db.execute("SELECT tat FROM buckets WHERE key = ?", (key,)).fetchone()
+        tat, wait = _gcra(row[0] if row else 0.0, time.time(), rate, burst)
+        self._db.execute("INSERT OR REPLACE INTO buckets (key, tat) VALUES (?, ?)", (key, tat))
+        return wait
+
+    async def claim(self, key, ttl):
+        try:
+            claimed = await self._run(self._transaction, self._claim, key, ttl)
+        except sqlite3.Error as e:
+            # Dedup is best-effort here (the update journal is the durable one): let it through
+            self.errors += 1
+            logger.error(f"State store claim failed for {key}: {e}")
+            return True
+        if claimed:
+            self.claimed += 1
+        else:
+            self.duplicates += 1
+        return claimed
+
+    async def reserve(self, key, rate, burst):
+        try:
+            return await self._run(self._transaction, self._reserve, key, rate, burst)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"State store reserve failed for {key}: {e}")
+            return 0.0
+
+    def stats(self):
+        return {"backend": "sqlite", "claimed": self.claimed, "duplicates": self.duplicates, "errors": self.errors}
+
+
+def create_state_store(url) -> StateStore:
+    """`memory://` (or empty) or `sqlite:///path`."""
+    if not url or url == "memory://":
+        return MemoryStateStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported STATE_STORE {url!r} (use memory:// or sqlite:///path)")
@@ -0,0 +1,239 @@
+"""Streaming relay: agent SSE chunks to Telegram message edits, paced by Telegram's rate limits."""
+import asyncio
+import logging
+import time
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from outbound import FINAL, NORMAL, edit_text, send_text
+from rendering import open_fence
+from sse import iter_sse_with_resume
+
+logger = logging.getLogger(__name__)
+
+
+async def iter_sse_message_chunks(open_stream, event="message"):
+    """Yield the data of `event` events from an agent SSE stream, resuming after disconnects.
+
+    `open_stream(headers)` opens the streaming request; see `sse.iter_sse_with_resume`.
+    """
+    async for sse_event in iter_sse_with_resume(open_stream):
+        # Once per token: lazy formatting, so it costs nothing unless DEBUG is on
+        logger.debug("SSE event: %s (%d chars)", sse_event.event, len(sse_event.data))
+        if sse_event.event == event and sse_event.data and sse_event.data != "[DONE]":
+            yield sse_event.data
+
+
+class EditRateGovernor:
+    """Shares Telegram's edit budget between all concurrent streams.
+
+    Telegram allows roughly one edit per second per chat and ~30 requests per second
+    overall. With many active streams each one's edit interval widens so their sum stays
+    under the global rate; a flood-control `RetryAfter` pauses every stream.
+    """
+
+    def __init__(self, per_chat_interval=1.0, global_rate=25.0, max_interval=5.0):
+        self.per_chat_interval = per_chat_interval
+        self.global_rate = global_rate
+        self.max_interval = max_interval
+        self.active_streams = 0
+        self.blocked_until = 0.0
+
+    def interval(self):
+        shared = self.active_streams / self.global_rate if self.global_rate else 0.0
+        return min(self.max_interval, max(self.per_chat_interval, shared))
+
+    def retry_after(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class StreamRelay:
+    """Mirrors a growing answer into Telegram messages.
+
+    Chunks are only buffered on `append`; a single pump task edits the message with the
+    latest snapshot whenever the governor allows, so intermediate snapshots that went stale
+    while waiting are never sent. The first chunk is edited in right away (time to first
+    token); later edits wait for the interval, and a few extra chars while tokens are
+    still flowing fast, so each edit carries a meaningful delta.
+
+    With a `renderer` (a `rendering.Renderer`) the answer is converted to its markup, and
+    an answer outgrowing one message continues in new ones: completed messages are left
+    alone and only the text after them (the tail) is rendered again on each edit. Without
+    one, the raw text is sent with `parse_mode` into the single message.
+    """
+
+    def __init__(self, message, governor: EditRateGovernor, parse_mode=ParseMode.MARKDOWN, min_delta_chars=24,
+                 renderer=None):
+        self.messages = [message]
+        self.governor = governor
+        self.renderer = renderer
+        self.parse_mode = renderer.parse_mode if renderer else parse_mode
+        self.min_delta_chars = min_delta_chars
+        self._parts: list[str] = []
+        self._length = 0
+        self._sent_length = 0
+        self._sent_text = ""  # source text of the tail message as last sent
+        self._frozen = 0  # offset in the answer where the tail message starts
+        self._fence = None  # language of a code block the tail message continues
+        self._changed = asyncio.Event()
+        self._pump: asyncio.Task | None = None
+        self._last_edit = 0.0
+        self._last_chunk = 0.0
+        self._blocked_until = 0.0
+        self.started_at = time.monotonic()
+        self.first_edit_at: float | None = None
+        self.edits = 0
+        self.failed_edits = 0
+        self.last_error: Exception | None = None
+
+    @property
+    def message(self):
+        """The message that receives new text."""
+        return self.messages[-1]
+
+    def __len__(self):
+        return self._length
+
+    def text(self):
+        if len(self._parts) > 1:
+            self._parts[:] = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def append(self, chunk):
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        self._last_chunk = time.monotonic()
+        self._changed.set()
+        if self._pump is None:
+            self.governor.active_streams += 1
+            self._pump = asyncio.create_task(self._run_pump())
+
+    def _render(self, text):
+        return self.renderer.render(text, self._fence) if self.renderer else text.strip()
+
+    def _flood_control(self, e: RetryAfter):
+        retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+        self._blocked_until = time.monotonic() + retry_after
+        self.governor.retry_after(retry_after)
+        self.failed_edits += 1
+        self.last_error = e
+        logger.warning(f"Flood control on edit, retrying in {retry_after}s")
+
+    async def _edit(self, text, rate_limit_args=NORMAL):
+        self._last_edit = time.monotonic()
+        try:
+            await edit_text(self.message, self._render(text), parse_mode=self.parse_mode, rate_limit_args=rate_limit_args)
+        except RetryAfter as e:
+            self._flood_control(e)
+            return False
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                self._sent_text = text
+                return True
+            self.failed_edits += 1
+            self.last_error = e
+            logger.error(f"Failed to edit message: {e}")
+            return False
+        self.edits += 1
+        self._sent_text = text
+        self.first_edit_at = self.first_edit_at or time.monotonic()
+        return True
+
+    async def _continue_in_new_message(self, done, text):
+        """`done` completed the tail message; `text` starts the next one. False if it could not be sent."""
+        fence = self._fence
+        self._fence = open_fence(done, fence)
+        try:
+            message = await send_text(self.message, self._render(text), parse_mode=self.parse_mode,
+                                      rate_limit_args=FINAL)
+        except TelegramError as e:
+            # The tail message stays the same; the next sync splits and sends again
+            self._fence = fence
+            if isinstance(e, RetryAfter):
+                self._flood_control(e)
+            else:
+                self.failed_edits += 1
+                self.last_error = e
+                logger.error(f"Failed to continue the answer in a new message: {e}")
+            return False
+        self._frozen += len(done)
+        self.messages.append(message)
+        self.edits += 1
+        self._sent_text = text
+        return True
+
+    async def _sync(self, final=False):
+        """Send the current answer: parts that no longer fit are completed, the tail is re-rendered."""
+        text = self.text()[self._frozen:]
+        parts = self.renderer.split(text, self._fence) if self.renderer else [text]
+        if parts[0].strip() and parts[0] != self._sent_text:
+            # Only a tail message that was edited to its final text can be left behind
+            if not await self._edit(parts[0], FINAL if final or len(parts) > 1 else NORMAL):
+                if final:
+                    raise self.last_error
+                return
+        for done, part in zip(parts, parts[1:]):
+            if not await self._continue_in_new_message(done, part):
+                if final:
+                    raise self.last_error
+                return
+
+    async def _run_pump(self):
+        while True:
+            await self._changed.wait()
+            now = time.monotonic()
+            if self._last_edit:
+                wait = max(
+                    self._last_edit + self.governor.interval(),
+                    self._blocked_until,
+                    self.governor.blocked_until,
+                ) - now
+                # Tokens still flowing and only a sliver of new text: let it grow a bit more
+                if wait <= 0 and self._length - self._sent_length < self.min_delta_chars \
+                        and now - self._last_chunk < self.governor.interval() / 4:
+                    wait = self.governor.interval() / 4
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            self._changed.clear()
+            # Whatever arrived while waiting is folded into this one edit
+            self._sent_length = self._length
+            try:
+                await self._sync()
+            except Exception as e:
+                # A failed edit is retried with the next snapshot; finish() sends the rest
+                self.last_error = e
+                logger.error(f"Streaming edit failed: {e}")
+
+    async def close(self):
+        """Stop streaming edits without sending anything else."""
+        if self._pump is not None:
+            self._pump.cancel()
+            await asyncio.gather(self._pump, return_exceptions=True)
+            self._pump = None
+            self.governor.active_streams -= 1
+
+    async def finish(self):
+        """Stop streaming edits and send the complete answer; returns the full text."""
+        await self.close()
+        wait = max(self._blocked_until, self.governor.blocked_until) - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await self._sync(final=True)
+        return self.text().strip()
+
+    async def deliver(self, text):
+        """Send a complete answer at once (no streaming edits); returns it."""
+        self._parts[:] = [text]
+        self._length = len(text)
+        return await self.finish()
+
+    def stats(self):
+        ttfe = (self.first_edit_at - self.started_at) if self.first_edit_at else None
+        return {
+            "edits": self.edits,
+            "failed_edits": self.failed_edits,
+            "messages": len(self.messages),
+            "time_to_first_edit": ttfe,
+            "chars": self._length,
+        }
@@ -1,12 +0,0 @@
-
-import os
-from dotenv import load_dotenv
-import requests
-
-load_dotenv()
-
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-
-url = f"https://api.telegram.org/bot{BOT_TOKEN}/getWebhookInfo"
-response = requests.get(url)
-print(response.json())
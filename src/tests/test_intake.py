@@ -0,0 +1,91 @@
+"""Intake ordering: an update is journaled before it is claimed, and a duplicate claim is not replayed.
+
+Runs bot.py's `admit_update` against a temporary journal and an in-memory state store.
+Run from `src/`:
+
+    python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.update({
+    "BOT_TOKEN": "123:test",
+    "AGENT_API_URL": "http://127.0.0.1:9/completion",
+    "AGENT_API_TOKEN": "test",
+    "UPDATE_JOURNAL_PATH": "",
+    "TRANSCRIPTION_CACHE_PATH": "",
+    "LOG_QUEUE": "false",
+})
+
+import bot  # noqa: E402
+from state_store import MemoryStateStore  # noqa: E402
+from update_journal import UpdateJournal  # noqa: E402
+
+
+def text_update(update_id, chat_id=1):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": "hello",
+        },
+    }
+
+
+@pytest.fixture
+def intake(tmp_path, monkeypatch):
+    path = str(tmp_path / "journal.sqlite3")
+    journal = UpdateJournal(path)
+    monkeypatch.setattr(bot, "journal", journal)
+    monkeypatch.setattr(bot, "state_store", MemoryStateStore())
+    return journal, path
+
+
+async def reopen(journal, path):
+    await journal.close()
+    journal = UpdateJournal(path)
+    await journal.open()
+    return journal
+
+
+def test_update_claimed_elsewhere_is_not_replayed(intake):
+    journal, path = intake
+
+    async def run():
+        await journal.open()
+        # Another worker took the update first
+        await bot.state_store.claim("update:1", 60)
+        assert not await bot.admit_update(text_update(1))
+        assert await bot.admit_update(text_update(2))
+        replayed = await reopen(journal, path)
+        assert [update["update_id"] for update in await replayed.unfinished()] == [2]
+        await replayed.close()
+
+    asyncio.run(run())
+
+
+def test_failed_journal_write_leaves_update_unclaimed(intake, monkeypatch):
+    journal, _ = intake
+
+    async def failing_record(update_id, update_json):
+        raise OSError("disk full")
+
+    async def run():
+        await journal.open()
+        with monkeypatch.context() as patch:
+            patch.setattr(journal, "record", failing_record)
+            with pytest.raises(OSError):
+                await bot.admit_update(text_update(3))
+        # Telegram's redelivery is admitted, not skipped as a duplicate
+        assert await bot.admit_update(text_update(3))
+        assert not await bot.admit_update(text_update(3))
+        await journal.close()
+
+    asyncio.run(run())
@@ -0,0 +1,233 @@
+"""Pluggable voice transcription: async OpenAI, local Whisper in a process pool, and a fallback chain."""
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from importlib.util import find_spec
+
+from http_clients import PooledClient
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionError(RuntimeError):
+    """No transcription backend could transcribe the audio."""
+
+
+class Transcriber(ABC):
+    """A transcription backend: `transcribe(audio)` takes a named file object, returns text."""
+
+    name = "transcriber"
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def available(self) -> bool:
+        return True
+
+    async def start(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+    async def transcribe(self, audio) -> str:
+        self.calls += 1
+        started = time.monotonic()
+        # A previous backend may have read part of the buffer already
+        audio.seek(0)
+        try:
+            return await self._transcribe(audio)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.seconds += time.monotonic() - started
+
+    @abstractmethod
+    async def _transcribe(self, audio) -> str:
+        """The backend call; `audio` is at position 0."""
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "avg_seconds": round(self.seconds / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+class OpenAITranscriber(Transcriber):
+    """OpenAI speech-to-text through `AsyncOpenAI`, sharing the pooled "openai" HTTP client.
+
+    The `openai` package takes most of a second to import, so it is imported on a thread
+    after startup instead of delaying the first webhook acknowledgement.
+    """
+
+    name = "openai"
+
+    def __init__(self, api_key, http: PooledClient, model="gpt-4o-mini-transcribe", max_retries=1):
+        super().__init__()
+        self.api_key = api_key
+        self.http = http
+        self.model = model
+        self.max_retries = max_retries
+        self._client = None  # openai.AsyncOpenAI, once imported
+        self._loading: asyncio.Task | None = None
+
+    def available(self):
+        return bool(self.api_key)
+
+    async def start(self):
+        self._loading = asyncio.create_task(self._load_client())
+
+    async def _load_client(self):
+        openai = await asyncio.to_thread(import_module, "openai")
+        # The pooled httpx client only exists once the HTTP clients are started
+        self._client = openai.AsyncOpenAI(api_key=self.api_key, http_client=self.http.client,
+                                          max_retries=self.max_retries)
+
+    async def aclose(self):
+        if self._loading is not None:
+            self._loading.cancel()
+            await asyncio.gather(self._loading, return_exceptions=True)
+            self._loading = None
+        # Not closing the AsyncOpenAI client: the connection pool belongs to HttpClients
+        self._client = None
+
+    async def _transcribe(self, audio):
+        if self._client is None:
+            # A voice message before the background import finished (or before start)
+            await (self._loading or self._load_client())
+        transcription = await self._client.audio.transcriptions.create(model=self.model, file=audio)
+        return transcription.text
+
+
+# --- Local Whisper worker process ---
+_worker_model = None
+
+
+def _load_worker_model(model, device, compute_type):
+    global _worker_model
+    from faster_whisper import WhisperModel
+    _worker_model = WhisperModel(model, device=device, compute_type=compute_type)
+
+
+def _transcribe_in_worker(data, language):
+    segments, _ = _worker_model.transcribe(io.BytesIO(data), language=language, vad_filter=True)
+    return "".join(segment.text for segment in segments).strip()
+
+
+class LocalWhisperTranscriber(Transcriber):
+    """Offline transcription with faster-whisper (optional dependency) in a dedicated process pool.
+
+    Each worker process loads the model once; the audio bytes are sent to it, so decoding and
+    inference never hold the event loop or the GIL of the bot process.
+    """
+
+    name = "local"
+
+    def __init__(self, model="base", workers=1, device="cpu", compute_type="int8", language=None):
+        super().__init__()
+        self.model = model
+        self.workers = workers
+        self.device = device
+        self.compute_type = compute_type
+        self.language = language
+        self._pool: ProcessPoolExecutor | None = None
+
+    def available(self):
+        return find_spec("faster_whisper") is not None
+
+    async def start(self):
+        if not self.available():
+            logger.warning("faster-whisper is not installed - local transcription is disabled")
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            # Forking a process that already runs threads is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load_worker_model,
+            initargs=(self.model, self.device, self.compute_type),
+        )
+        logger.info(f"Local transcription: whisper '{self.model}' on {self.device}, {self.workers} worker(s)")
+
+    async def aclose(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _transcribe(self, audio):
+        if self._pool is None:
+            raise TranscriptionError("local transcription is not started")
+        data = audio.getvalue() if hasattr(audio, "getvalue") else audio.read()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, _transcribe_in_worker, data, self.language)
+
+
+class FallbackTranscriber(Transcriber):
+    """Tries backends in order until one succeeds.
+
+    A backend that just failed is tried last for `cooldown` seconds, so an upstream outage
+    does not cost every voice note a timeout before the next backend gets it.
+    """
+
+    name = "fallback"
+
+    def __init__(self, backends: list[Transcriber], cooldown=30.0):
+        super().__init__()
+        self.backends = backends
+        self.cooldown = cooldown
+        self._failed_at: dict[str, float] = {}
+
+    def available(self):
+        return any(backend.available() for backend in self.backends)
+
+    async def start(self):
+        await asyncio.gather(*(backend.start() for backend in self.backends if backend.available()))
+
+    async def aclose(self):
+        await asyncio.gather(*(backend.aclose() for backend in self.backends))
+
+    def _ordered(self):
+        now = time.monotonic()
+        backends = [backend for backend in self.backends if backend.available()]
+        # Stable sort: healthy backends keep their configured order, cooling-down ones go last
+        return sorted(backends, key=lambda b: now - self._failed_at.get(b.name, -self.cooldown) < self.cooldown)
+
+    async def _transcribe(self, audio):
+        errors = []
+        for backend in self._ordered():
+            try:
+                return await backend.transcribe(audio)
+            except Exception as e:
+                self._failed_at[backend.name] = time.monotonic()
+                errors.append(f"{backend.name}: {e}")
+                logger.warning(f"Transcription backend '{backend.name}' failed: {e}")
+        raise TranscriptionError("; ".join(errors) or "no transcription backend available")
+
+    def stats(self):
+        return {backend.name: backend.stats() for backend in self.backends}
+
+
+def create_transcriber(names, openai_api_key=None, openai_http=None, openai_model="gpt-4o-mini-transcribe",
+                       local_model="base", local_workers=1, local_device="cpu", local_compute_type="int8",
+                       language=None) -> FallbackTranscriber:
+    """Build the fallback chain from backend names, e.g. `["openai", "local"]`."""
+    backends = []
+    for name in names:
+        if name == "openai":
+            backends.append(OpenAITranscriber(openai_api_key, openai_http, model=openai_model))
+        elif name == "local":
+            backends.append(LocalWhisperTranscriber(
+                local_model, workers=local_workers, device=local_device,
+                compute_type=local_compute_type, language=language,
+            ))
+        else:
+            logger.error(f"Unknown transcription backend '{name}' - ignored")
+    return FallbackTranscriber(backends)
@@ -0,0 +1,184 @@
+"""Two-tier transcription cache: in-memory LRU in front of a persistent SQLite store."""
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def file_key(file_unique_id):
+    """Key for a Telegram file; `file_unique_id` is stable across bots, forwards and re-sends."""
+    return f"file:{file_unique_id}"
+
+
+def audio_key(audio):
+    """Key for the audio content itself, for the same audio uploaded as a different file."""
+    return f"sha256:{hashlib.sha256(audio.getbuffer()).hexdigest()}"
+
+
+class TranscriptionCache:
+    """Transcriptions by key, kept for `ttl` seconds.
+
+    Lookups hit the in-memory LRU (`memory_entries` most recently used) first, then the
+    SQLite tier at `path` (None for memory only), which keeps at most `max_entries` rows and
+    survives restarts. The cache is best effort: storage errors are logged, never raised.
+    """
+
+    def __init__(self, path=None, ttl=30 * 86400.0, memory_entries=1024, max_entries=100_000):
+        self.path = path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcription-cache")
+        self._last_prune = 0.0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open_db(self):
+        db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # A lost cache entry only costs a transcription, no need to fsync every write
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS transcriptions ("
+            " key TEXT PRIMARY KEY,"
+            " text TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " used_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS transcriptions_used ON transcriptions (used_at)")
+        return db
+
+    async def open(self):
+        if not self.path:
+            return
+        try:
+            self._db = await self._run(self._open_db)
+            logger.info(f"Transcription cache opened at {self.path}")
+        except sqlite3.Error as e:
+            logger.error(f"Transcription cache unavailable ({self.path}): {e} - using memory only")
+
+    async def close(self):
+        if self._db is not None:
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+        logger.info(f"Transcription cache closed: {self.stats()}")
+
+    def _remember(self, key, text, stored_at):
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (text, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, *keys, count_miss=True) -> str | None:
+        """The cached transcription under the first key found, or None.
+
+        `count_miss=False` for a lookup that may be followed by another one for the same
+        note; the caller then counts the miss once with `record_miss` if none follows.
+        """
+        now = time.time()
+        for key in keys:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+        if self._db is not None:
+            try:
+                found = await self._run(self._select, keys, now)
+            except sqlite3.Error as e:
+                logger.error(f"Transcription cache read failed: {e}")
+                found = None
+            if found is not None:
+                key, text, stored_at = found
+                self._remember(key, text, stored_at)
+                self.disk_hits += 1
+                return text
+
+        if count_miss:
+            self.misses += 1
+        return None
+
+    def record_miss(self):
+        self.misses += 1
+
+    def _select(self, keys, now):
+        for key in keys:
+            row = self._db.execute(
+                "SELECT text, stored_at FROM transcriptions WHERE key = ? AND stored_at > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE transcriptions SET used_at = ? WHERE key = ?", (now, key))
+                return key, row[0], row[1]
+        return None
+
+    async def put(self, keys, text):
+        """Store `text` under every key in `keys` (e.g. the file key and the audio key)."""
+        if not text:
+            return
+        now = time.time()
+        for key in keys:
+            self._remember(key, text, now)
+        self.stores += 1
+        if self._db is not None:
+            try:
+                await self._run(self._insert, keys, text, now)
+            except sqlite3.Error as e:
+                logger.error(f"Transcription cache write failed: {e}")
+
+    def _insert(self, keys, text, now):
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "INSERT OR REPLACE INTO transcriptions (key, text, stored_at, used_at) VALUES (?, ?, ?, ?)",
+                [(key, text, now, now) for key in keys],
+            )
+            if now - self._last_prune > 60:
+                self._prune(now)
+                self._last_prune = now
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _prune(self, now):
+        """Drop expired rows, then the least recently used ones beyond `max_entries`."""
+        db = self._db
+        db.execute("DELETE FROM transcriptions WHERE stored_at <= ?", (now - self.ttl,))
+        (count,) = db.execute("SELECT COUNT(*) FROM transcriptions").fetchone()
+        if count > self.max_entries:
+            db.execute(
+                "DELETE FROM transcriptions WHERE key IN"
+                " (SELECT key FROM transcriptions ORDER BY used_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "memory_entries": len(self._memory),
+        }
@@ -0,0 +1,166 @@
+"""Durable intake journal: updates are recorded by update_id before Telegram is acknowledged."""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PENDING = 0
+DONE = 1
+
+
+class UpdateJournal:
+    """SQLite (WAL) journal of incoming updates with group commit.
+
+    `record` resolves once the update is durably stored, and returns False for an
+    `update_id` that was already journaled (a Telegram redelivery). Concurrent records
+    are written in one transaction, so many updates share a single fsync. Updates that
+    were recorded but never marked done are returned by `unfinished` for replay.
+    """
+
+    def __init__(self, path, retention=86400.0, max_batch=512, linger=0.0):
+        self.path = path
+        self.retention = retention
+        self.max_batch = max_batch
+        self.linger = linger
+        self._db: sqlite3.Connection | None = None
+        # sqlite3 calls block, so they run on one dedicated thread, never on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="update-journal")
+        self._queue: asyncio.Queue | None = None
+        self._writer: asyncio.Task | None = None
+        self._in_flight: set[int] = set()
+        self._last_prune = 0.0
+        self.recorded = 0
+        self.duplicates = 0
+        self.commits = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open_db(self):
+        db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # FULL fsyncs every commit; group commit keeps that to one fsync per batch
+        db.execute("PRAGMA synchronous=FULL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS updates ("
+            " update_id INTEGER PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " status INTEGER NOT NULL,"
+            " received_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS updates_status ON updates (status, received_at)")
+        return db
+
+    async def open(self):
+        self._db = await self._run(self._open_db)
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+        logger.info(f"Update journal opened at {self.path}")
+
+    async def close(self):
+        if self._writer is None:
+            return
+        # Flush whatever is queued, then stop the writer
+        await self._queue.join()
+        self._writer.cancel()
+        await asyncio.gather(self._writer, return_exceptions=True)
+        self._writer = None
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
+        logger.info(f"Update journal closed: {self.stats()}")
+
+    async def record(self, update_id, update_json) -> bool:
+        """Durably store a new update; False if this update_id was already journaled."""
+        if update_id in self._in_flight:
+            self.duplicates += 1
+            return False
+        self._in_flight.add(update_id)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(("record", update_id, json.dumps(update_json), future))
+        try:
+            is_new = await future
+        finally:
+            self._in_flight.discard(update_id)
+        if is_new:
+            self.recorded += 1
+        else:
+            self.duplicates += 1
+        return is_new
+
+    def mark_done(self, update_id):
+        """Mark an update as processed; written with the next batch, no need to wait."""
+        self._queue.put_nowait(("done", update_id, None, None))
+
+    async def unfinished(self):
+        """Payloads of updates that were recorded but never marked done, oldest first."""
+        def _select():
+            rows = self._db.execute(
+                "SELECT payload FROM updates WHERE status = ? ORDER BY update_id", (PENDING,)
+            ).fetchall()
+            return [json.loads(payload) for (payload,) in rows]
+        return await self._run(_select)
+
+    def _commit_batch(self, batch):
+        now = time.time()
+        results = []
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            for kind, update_id, payload, _ in batch:
+                if kind == "record":
+                    cursor = db.execute(
+                        "INSERT OR IGNORE INTO updates (update_id, payload, status, received_at)"
+                        " VALUES (?, ?, ?, ?)",
+                        (update_id, payload, PENDING, now),
+                    )
+                    results.append(cursor.rowcount == 1)
+                else:
+                    db.execute("UPDATE updates SET status = ? WHERE update_id = ?", (DONE, update_id))
+                    results.append(None)
+            if now - self._last_prune > 60:
+                db.execute(
+                    "DELETE FROM updates WHERE status = ? AND received_at < ?",
+                    (DONE, now - self.retention),
+                )
+                self._last_prune = now
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return results
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self.linger:
+                await asyncio.sleep(self.linger)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                results = await self._run(self._commit_batch, batch)
+                self.commits += 1
+            except Exception as e:
+                logger.error(f"Update journal commit failed ({len(batch)} entries): {e}")
+                results = [e] * len(batch)
+
+            for (kind, update_id, _, future), result in zip(batch, results):
+                if future is not None and not future.done():
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+                self._queue.task_done()
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "duplicates": self.duplicates,
+            "commits": self.commits,
+            "updates_per_commit": round(self.recorded / self.commits, 2) if self.commits else 0.0,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
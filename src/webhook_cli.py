@@ -0,0 +1,256 @@
+"""Manage the bot's Telegram webhook: register it with its delivery settings, inspect it, watch its backlog.
+
+    python webhook_cli.py set                  # setWebhook with the settings below
+    python webhook_cli.py info                 # getWebhookInfo
+    python webhook_cli.py watch --interval 30  # pending updates and delivery errors over time
+    python webhook_cli.py delete --drop-pending
+
+Settings come from the environment (or `.env`); flags override them:
+
+    WEBHOOK_URL                   public base URL, `/webhook` is appended
+    WEBHOOK_SECRET_TOKEN          echoed by Telegram in X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_MAX_CONNECTIONS       concurrent deliveries, 1-100 (Telegram's default is 40)
+    WEBHOOK_ALLOWED_UPDATES       comma-separated update kinds, "all" for every default kind
+    WEBHOOK_DROP_PENDING_UPDATES  drop the backlog when the webhook is set
+    WEBHOOK_IP_ADDRESS            deliver to this IP instead of resolving the URL's host
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import httpx
+
+from webhook_intake import MESSAGE_UPDATE_TYPES
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+
+class WebhookError(RuntimeError):
+    """The Bot API answered with ok=false."""
+
+
+def _env_bool(name, default=False):
+    value = os.environ.get(name)
+    return value.lower() in ("1", "true", "yes") if value else default
+
+
+def parse_allowed_updates(value):
+    """Comma-separated update kinds; "all" (or empty) is Telegram's empty list."""
+    if not value or value.strip().lower() == "all":
+        return ()
+    return tuple(kind.strip() for kind in value.split(",") if kind.strip())
+
+
+@dataclass
+class WebhookConfig:
+    url: str
+    secret_token: str | None = None
+    max_connections: int = 40
+    # By default only the kinds the bot has handlers for, so Telegram never sends the rest
+    allowed_updates: tuple = MESSAGE_UPDATE_TYPES
+    drop_pending_updates: bool = False
+    ip_address: str | None = None
+
+    @classmethod
+    def from_env(cls, base_url=None):
+        base_url = base_url or os.environ.get("WEBHOOK_URL", "")
+        allowed = os.environ.get("WEBHOOK_ALLOWED_UPDATES")
+        return cls(
+            url=f"{base_url.rstrip('/')}/webhook",
+            secret_token=os.environ.get("WEBHOOK_SECRET_TOKEN") or None,
+            max_connections=int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", 40)),
+            allowed_updates=MESSAGE_UPDATE_TYPES if allowed is None else parse_allowed_updates(allowed),
+            drop_pending_updates=_env_bool("WEBHOOK_DROP_PENDING_UPDATES"),
+            ip_address=os.environ.get("WEBHOOK_IP_ADDRESS") or None,
+        )
+
+    def matches(self, info) -> bool:
+        """Whether getWebhookInfo `info` shows this webhook already registered with these settings."""
+        if self.drop_pending_updates:
+            return False  # an action, not a setting: always sent
+        if self.secret_token:
+            return False  # getWebhookInfo never returns it, so a changed secret cannot be seen
+        return (
+            info.get("url") == self.url
+            and info.get("max_connections", 40) == self.max_connections
+            and sorted(info.get("allowed_updates") or []) == sorted(self.allowed_updates)
+            and (not self.ip_address or info.get("ip_address") == self.ip_address)
+        )
+
+    def params(self):
+        params = {
+            "url": self.url,
+            "max_connections": self.max_connections,
+            "allowed_updates": list(self.allowed_updates),
+            "drop_pending_updates": self.drop_pending_updates,
+        }
+        if self.secret_token:
+            params["secret_token"] = self.secret_token
+        if self.ip_address:
+            params["ip_address"] = self.ip_address
+        return params
+
+
+def _result(method, response: httpx.Response):
+    try:
+        data = response.json()
+    except ValueError:
+        response.raise_for_status()
+        raise
+    if not data.get("ok"):
+        raise WebhookError(f"{method} failed: {data.get('error_code')} {data.get('description')}")
+    return data["result"]
+
+
+def call(token, method, api_url=TELEGRAM_API_URL, timeout=10, **params):
+    """POST a Bot API method and return its result."""
+    return _result(method, httpx.post(f"{api_url}/bot{token}/{method}", json=params, timeout=timeout))
+
+
+async def acall(client: httpx.AsyncClient, token, method, api_url=TELEGRAM_API_URL, **params):
+    """`call` on an async client, e.g. the bot's pooled Telegram client."""
+    return _result(method, await client.post(f"{api_url}/bot{token}/{method}", json=params))
+
+
+def set_webhook(token, config: WebhookConfig, api_url=TELEGRAM_API_URL):
+    return call(token, "setWebhook", api_url, **config.params())
+
+
+def get_webhook_info(token, api_url=TELEGRAM_API_URL):
+    return call(token, "getWebhookInfo", api_url)
+
+
+def delete_webhook(token, drop_pending_updates=False, api_url=TELEGRAM_API_URL):
+    return call(token, "deleteWebhook", api_url, drop_pending_updates=drop_pending_updates)
+
+
+async def ensure_webhook(client: httpx.AsyncClient, token, config: WebhookConfig, api_url=TELEGRAM_API_URL):
+    """Register the webhook unless it already is, with the same settings; returns (info, changed).
+
+    `info` is getWebhookInfo from before the change, for its backlog and delivery errors.
+    """
+    info = await acall(client, token, "getWebhookInfo", api_url)
+    if config.matches(info):
+        return info, False
+    await acall(client, token, "setWebhook", api_url, **config.params())
+    return info, True
+
+
+def describe(info):
+    """getWebhookInfo as a few readable lines."""
+    lines = [
+        f"url:              {info.get('url') or '(none)'}",
+        f"pending updates:  {info.get('pending_update_count', 0)}",
+        f"max connections:  {info.get('max_connections', '-')}",
+        f"allowed updates:  {', '.join(info.get('allowed_updates') or []) or 'default'}",
+        f"ip address:       {info.get('ip_address', '-')}",
+    ]
+    if info.get("last_error_date"):
+        when = datetime.fromtimestamp(info["last_error_date"]).isoformat(sep=" ", timespec="seconds")
+        lines.append(f"last error:       {when} {info.get('last_error_message', '')}")
+    if info.get("last_synchronization_error_date"):
+        when = datetime.fromtimestamp(info["last_synchronization_error_date"]).isoformat(sep=" ", timespec="seconds")
+        lines.append(f"last sync error:  {when}")
+    return "\n".join(lines)
+
+
+def watch(token, interval, count=None, api_url=TELEGRAM_API_URL, out=sys.stdout):
+    """Poll getWebhookInfo: backlog size and its rate of change, and delivery errors as they appear."""
+    previous = None
+    polls = 0
+    while count is None or polls < count:
+        if polls:
+            time.sleep(interval)
+        polls += 1
+        try:
+            info = get_webhook_info(token, api_url)
+        except (httpx.HTTPError, WebhookError) as e:
+            print(f"{datetime.now():%H:%M:%S}  getWebhookInfo failed: {e}", file=out, flush=True)
+            continue
+        now = time.time()
+        pending = info.get("pending_update_count", 0)
+        line = f"{datetime.now():%H:%M:%S}  pending {pending:6d}"
+        if previous is not None:
+            rate = (pending - previous[1]) / (now - previous[0]) * 60
+            line += f" ({rate:+8.1f}/min)"
+        error_date = info.get("last_error_date")
+        if error_date:
+            line += f"  last error {now - error_date:6.0f}s ago: {info.get('last_error_message', '')}"
+            if previous is not None and error_date != previous[2]:
+                line += "  [new]"
+        print(line, file=out, flush=True)
+        previous = (now, pending, error_date)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--token", default=os.environ.get("BOT_TOKEN"), help="bot token (default: BOT_TOKEN)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    set_parser = commands.add_parser("set", help="register the webhook")
+    set_parser.add_argument("--url", help="full webhook URL (default: WEBHOOK_URL + /webhook)")
+    set_parser.add_argument("--secret-token")
+    set_parser.add_argument("--max-connections", type=int)
+    set_parser.add_argument("--allowed-updates", help='comma-separated kinds, or "all"')
+    set_parser.add_argument("--drop-pending", action="store_true", default=None)
+    set_parser.add_argument("--ip-address")
+
+    commands.add_parser("info", help="print the current webhook settings and backlog")
+
+    watch_parser = commands.add_parser("watch", help="poll the backlog and delivery errors")
+    watch_parser.add_argument("--interval", type=float, default=30.0, help="seconds between polls")
+    watch_parser.add_argument("--count", type=int, help="stop after this many polls")
+
+    delete_parser = commands.add_parser("delete", help="remove the webhook")
+    delete_parser.add_argument("--drop-pending", action="store_true")
+
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error("BOT_TOKEN is not set (or pass --token)")
+
+    try:
+        if args.command == "set":
+            config = WebhookConfig.from_env()
+            if args.url:
+                config.url = args.url
+            if args.secret_token is not None:
+                config.secret_token = args.secret_token or None
+            if args.max_connections is not None:
+                config.max_connections = args.max_connections
+            if args.allowed_updates is not None:
+                config.allowed_updates = parse_allowed_updates(args.allowed_updates)
+            if args.drop_pending is not None:
+                config.drop_pending_updates = args.drop_pending
+            if args.ip_address is not None:
+                config.ip_address = args.ip_address or None
+            set_webhook(args.token, config)
+            shown = {**config.params(), **({"secret_token": "***"} if config.secret_token else {})}
+            print(f"Webhook set: {json.dumps(shown)}")
+            print(describe(get_webhook_info(args.token)))
+        elif args.command == "info":
+            print(describe(get_webhook_info(args.token)))
+        elif args.command == "watch":
+            watch(args.token, args.interval, args.count)
+        elif args.command == "delete":
+            delete_webhook(args.token, args.drop_pending)
+            print("Webhook deleted")
+    except KeyboardInterrupt:
+        pass
+    except (httpx.HTTPError, WebhookError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Cheap checks on raw webhook POSTs, before any update is journaled or parsed into PTB objects."""
+import hmac
+import json
+import logging
+
+# orjson is optional: several times faster than json on update payloads
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    orjson = None
+    loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Update kinds the bot's handlers answer: they read `update.message`, which edited messages,
+# channel posts and business messages leave empty
+MESSAGE_UPDATE_TYPES = ("message",)
+
+
+class WebhookIntake:
+    """Authenticates webhook POSTs and filters out updates no handler would match.
+
+    - `secret_token`: the value passed to `setWebhook`; Telegram sends it back in the
+      `X-Telegram-Bot-Api-Secret-Token` header, compared in constant time. None disables it.
+    - `update_types`: update kinds handled (e.g. "message"); None accepts all.
+    - `message_fields`: for those kinds, a message needs at least one of these fields
+      (e.g. "text", "voice"); None accepts any message.
+    """
+
+    def __init__(self, secret_token=None, update_types=None, message_fields=None):
+        self._secret = secret_token.encode() if secret_token else None
+        self.update_types = frozenset(update_types) if update_types else None
+        self.message_fields = tuple(message_fields) if message_fields else None
+        self.forged = 0
+        self.skipped = 0
+
+    def authentic(self, header_value) -> bool:
+        if self._secret is None:
+            return True
+        if header_value is not None and hmac.compare_digest(header_value.encode(), self._secret):
+            return True
+        self.forged += 1
+        return False
+
+    @staticmethod
+    def decode(body: bytes) -> dict:
+        """Parse a raw body; raises ValueError if it is not a JSON object."""
+        update_json = loads(body)
+        if not isinstance(update_json, dict):
+            raise ValueError("update is not a JSON object")
+        return update_json
+
+    def wanted(self, update_json) -> bool:
+        """False for updates no handler matches (unhandled kinds, stickers, photos, ...)."""
+        if self.update_types is None:
+            return True
+        for key, value in update_json.items():
+            if key in self.update_types:
+                if self.message_fields is None or any(field in value for field in self.message_fields):
+                    return True
+        self.skipped += 1
+        return False
+
+    def stats(self):
+        return {"json": "orjson" if orjson else "json", "forged": self.forged, "skipped": self.skipped}
@@ -0,0 +1,158 @@
+"""Webhook router for multi-worker mode: every update of a chat goes to the same worker.
+
+Telegram posts all updates to the router, which forwards each one unchanged to a worker
+picked by `chat_id % len(workers)`. Per-chat ordering, the per-chat queues and the per-chat
+rate limits therefore stay within one worker process, which may run on another host.
+"""
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from webhook_intake import SECRET_TOKEN_HEADER, WebhookIntake
+
+logger = logging.getLogger(__name__)
+
+# Headers Telegram sends that workers may rely on
+FORWARDED_HEADERS = ("content-type", SECRET_TOKEN_HEADER.lower())
+
+
+def update_routing_key(update_json):
+    """The chat id of an update; the sender's id for updates without a chat (inline
+    queries, ...); the update_id as a last resort."""
+    for key, value in update_json.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+        user = value.get("from") or value.get("user")
+        if user and "id" in user:
+            return user["id"]
+    return update_json.get("update_id", 0)
+
+
+def worker_index(update_json, workers):
+    # Chat ids are integers, so the modulo is stable across processes (unlike hash())
+    return int(update_routing_key(update_json)) % workers
+
+
+class _Worker:
+    __slots__ = ("url", "forwarded", "failed")
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.forwarded = 0
+        self.failed = 0
+
+
+def create_router_app(worker_urls, http, webhook_intake=None, ack_timeout=5.0, ready_timeout=60.0, health_text="ok"):
+    """Build the router's ASGI app. `http` is a `http_clients.PooledClient` to the workers.
+
+    `webhook_intake` (a `webhook_intake.WebhookIntake`) refuses forged POSTs and drops unhandled
+    updates here, so they never cost a hop to a worker.
+
+    A worker that cannot take an update gets it refused with a 503, so Telegram delivers
+    it again later; workers journal updates before acknowledging them, so a redelivery of
+    an update that did get through is skipped.
+    """
+    workers = [_Worker(url) for url in worker_urls]
+    webhook_intake = webhook_intake or WebhookIntake()
+
+    async def webhook(request: Request):
+        if not webhook_intake.authentic(request.headers.get(SECRET_TOKEN_HEADER)):
+            return PlainTextResponse("forbidden", status_code=403)
+        body = await request.body()
+        try:
+            update_json = webhook_intake.decode(body)
+        except ValueError:
+            return PlainTextResponse("bad request", status_code=400)
+        if not webhook_intake.wanted(update_json):
+            return PlainTextResponse("ok")
+
+        worker = workers[worker_index(update_json, len(workers))]
+        headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+        try:
+            # Workers answer within their own ack timeout; allow for the hop on top of it
+            response = await asyncio.wait_for(
+                http.post(f"{worker.url}/webhook", content=body, headers=headers), ack_timeout + 5
+            )
+            response.raise_for_status()
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            worker.failed += 1
+            logger.error(f"Worker {worker.url} did not take update {update_json.get('update_id')}: {e!r}")
+            return PlainTextResponse("worker unavailable", status_code=503)
+        worker.forwarded += 1
+        return PlainTextResponse(response.text, status_code=response.status_code)
+
+    async def home(request: Request):
+        return PlainTextResponse(health_text)
+
+    async def stats(request: Request):
+        return JSONResponse({
+            "workers": [{"url": w.url, "forwarded": w.forwarded, "failed": w.failed} for w in workers],
+            "http": http.stats(),
+            "intake": webhook_intake.stats(),
+        })
+
+    async def wait_until_ready():
+        """Poll every worker's health route, so the first updates are not refused."""
+        deadline = time.monotonic() + ready_timeout
+        for worker in workers:
+            while True:
+                try:
+                    (await http.get(f"{worker.url}/")).raise_for_status()
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() >= deadline:
+                        logger.warning(f"Worker {worker.url} not ready after {ready_timeout}s - routing to it anyway")
+                        break
+                    await asyncio.sleep(0.2)
+
+    @asynccontextmanager
+    async def lifespan(asgi_app):
+        await http.start()
+        await wait_until_ready()
+        logger.info(f"Routing updates to {len(workers)} worker(s)")
+        try:
+            yield
+        finally:
+            await http.aclose()
+
+    return Starlette(
+        routes=[Route("/", home), Route("/webhook", webhook, methods=["POST"]), Route("/stats", stats)],
+        lifespan=lifespan,
+    )
+
+
+def spawn_workers(script, count, env_for):
+    """Start `count` local worker processes running `script`; `env_for(i)` returns the
+    environment overrides of worker i."""
+    processes = []
+    for i in range(count):
+        env = {**os.environ, **env_for(i)}
+        processes.append(subprocess.Popen([sys.executable, script], env=env))
+    logger.info(f"Started {count} worker process(es)")
+    return processes
+
+
+def stop_workers(processes, timeout=30.0):
+    """SIGTERM the workers (they shut down cleanly), then kill whatever is left."""
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()